@@ -0,0 +1,532 @@
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import timeit
+import asyncio
+import tempfile
+import threading
+import subprocess
+import contextlib
+import configparser
+import importlib.util
+from datetime import datetime
+
+# 主程序和测试数据生成器的文件路径（文件名包含版本号，只能按路径加载）
+MONITOR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "minecraft_monitor_v1.0.py")
+GENERATOR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "TestDataGenerator_v0.3.py")
+
+
+def _load_file(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_monitor():
+    """按文件路径加载主程序模块"""
+    return _load_file("minecraft_monitor", MONITOR_FILE)
+
+
+def report(name, seconds, iterations):
+    """打印单项基准结果"""
+    per_call = seconds / iterations * 1e6
+    print(f"  {name:<32} {per_call:>12.2f} µs/次  ({iterations} 次, 共 {seconds:.3f} 秒)")
+    return per_call
+
+
+# ---------------------------------------------------------------------------
+# 状态响应读取：旧版拼接读取 vs PacketReader
+# ---------------------------------------------------------------------------
+
+def _pack_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        out.append(byte | (0x80 if value > 0 else 0))
+        if value == 0:
+            return bytes(out)
+
+
+def make_status_packet(size_kb):
+    """生成一个带有 size_kb KB favicon 的状态响应数据包"""
+    status = {
+        "version": {"name": "1.20.1", "protocol": 763},
+        "players": {"online": 1, "max": 20, "sample": [{"name": "Steve", "id": "0"}]},
+        "description": {"text": "Benchmark"},
+        "favicon": "data:image/png;base64," + "A" * (size_kb * 1024),
+    }
+    json_bytes = json.dumps(status).encode("utf-8")
+    body = b"\x00" + _pack_varint(len(json_bytes)) + json_bytes
+    return _pack_varint(len(body)) + body
+
+
+async def legacy_read_status(loop, sock):
+    """旧版 get_server_info 的读取方式：逐字节 recv 解码长度，bytes 拼接，切片复制"""
+    data = 0
+    for i in range(5):
+        byte = await loop.sock_recv(sock, 1)
+        if len(byte) == 0:
+            break
+        byte = byte[0]
+        data |= (byte & 0x7F) << 7 * i
+        if not byte & 0x80:
+            break
+    response = b""
+    while len(response) < data:
+        response += await loop.sock_recv(sock, 4096)
+
+    def unpack(buffer):
+        value = 0
+        count = 0
+        for i in range(5):
+            if len(buffer) <= i:
+                break
+            byte = buffer[i]
+            value |= (byte & 0x7F) << 7 * i
+            count += 1
+            if not byte & 0x80:
+                break
+        return value, buffer[count:]
+
+    packet_id, buffer = unpack(response)
+    json_length, buffer = unpack(buffer)
+    return buffer[:json_length].decode("utf-8")
+
+
+async def packet_reader_read_status(monitor, loop, sock):
+    """PacketReader 读取方式：recv_into 预分配缓冲区，memoryview 解码"""
+    reader = monitor.PacketReader(loop, sock)
+    packet_id, payload = await reader.read_packet()
+    json_length, offset = monitor._unpack_varint_from_buffer(payload)
+    return str(payload[offset:offset + json_length], "utf-8")
+
+
+def _send_chunked(sock, packet, chunk_size):
+    """按 TCP 分段大小逐块发送，模拟真实网络中数据分批到达"""
+    for i in range(0, len(packet), chunk_size):
+        sock.sendall(packet[i:i + chunk_size])
+
+
+def bench_reader(monitor, iterations=200, size_kb=100, chunk_size=1460):
+    """在同一事件循环中对比 100 KB 状态响应的两种读取方式"""
+    print(f"状态响应读取 ({size_kb} KB, 每块 {chunk_size} 字节, {iterations} 次):")
+    packet = make_status_packet(size_kb)
+
+    async def run(read):
+        loop = asyncio.get_running_loop()
+        total = 0.0
+        for _ in range(iterations):
+            server, client = socket.socketpair()
+            with server, client:
+                client.setblocking(False)
+                sender = threading.Thread(target=_send_chunked, args=(server, packet, chunk_size), daemon=True)
+                sender.start()
+                start = time.perf_counter()
+                text = await read(loop, client)
+                total += time.perf_counter() - start
+                sender.join()
+                assert len(text) > size_kb * 1024
+        return total
+
+    legacy = report("旧版 bytes 拼接读取", asyncio.run(run(legacy_read_status)), iterations)
+    current = report("PacketReader (recv_into)",
+                     asyncio.run(run(lambda loop, sock: packet_reader_read_status(monitor, loop, sock))),
+                     iterations)
+    print(f"  提升: {legacy / current:.2f}x")
+
+
+# ---------------------------------------------------------------------------
+# VarInt 编解码与握手数据包
+# ---------------------------------------------------------------------------
+
+def legacy_pack_varint(value):
+    """旧版 _pack_varint：逐字节 struct.pack 并拼接 bytes"""
+    if value < 0:
+        value += (1 << 32)
+    out = b""
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        out += struct.pack("B", byte | (0x80 if value > 0 else 0))
+        if value == 0:
+            break
+    return out
+
+
+def legacy_unpack_varint_from_buffer(buffer):
+    """旧版 _unpack_varint_from_buffer：每次返回剩余缓冲区的副本"""
+    data = 0
+    count = 0
+    for i in range(5):
+        if len(buffer) <= i:
+            break
+        byte = buffer[i]
+        data |= (byte & 0x7F) << 7 * i
+        count += 1
+        if not byte & 0x80:
+            break
+    return data, buffer[count:]
+
+
+def legacy_pack_string(string):
+    data = string.encode("utf-8")
+    return legacy_pack_varint(len(data)) + data
+
+
+def legacy_build_handshake(host, port):
+    """旧版每次检查都重新生成的握手+状态请求"""
+    handshake = b"\x00"
+    handshake += legacy_pack_varint(404)
+    handshake += legacy_pack_string(host)
+    handshake += struct.pack(">H", port)
+    handshake += legacy_pack_varint(1)
+    return legacy_pack_varint(len(handshake)) + handshake + legacy_pack_varint(1) + b"\x00"
+
+
+def bench_varint(monitor, number=200000):
+    """对比 VarInt 编解码、字符串打包和握手数据包生成"""
+    print(f"VarInt 与握手数据包 ({number} 次):")
+    response = make_status_packet(10)
+    payload = response[3:]  # 去掉 3 字节长度前缀，从数据包ID开始
+    cases = [
+        ("_pack_varint(1)", lambda: legacy_pack_varint(1), lambda: monitor._pack_varint(1)),
+        ("_pack_varint(404)", lambda: legacy_pack_varint(404), lambda: monitor._pack_varint(404)),
+        ("_pack_varint(100000)", lambda: legacy_pack_varint(100000), lambda: monitor._pack_varint(100000)),
+        ("_unpack_varint_from_buffer (10 KB)",
+         lambda: legacy_unpack_varint_from_buffer(payload),
+         lambda: monitor._unpack_varint_from_buffer(payload, 1)),
+        ("_pack_string(host)",
+         lambda: legacy_pack_string("play.example.com"),
+         lambda: monitor._pack_string("play.example.com")),
+        ("握手+状态请求",
+         lambda: legacy_build_handshake("play.example.com", 25565),
+         lambda: monitor.build_status_request("play.example.com", 25565)),
+    ]
+    for name, legacy, current in cases:
+        print(f" {name}:")
+        legacy_us = report("旧版", timeit.timeit(legacy, number=number), number)
+        current_us = report("当前", timeit.timeit(current, number=number), number)
+        print(f"  提升: {legacy_us / current_us:.2f}x")
+
+
+# ---------------------------------------------------------------------------
+# 日志解析：旧版逐行解析 vs 批量列式解析
+# ---------------------------------------------------------------------------
+
+def legacy_parse_log(f):
+    """旧版 load_log_data 的逐行解析（str.index/split + 两次 strptime）"""
+    sessions = []
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("[") and "] [上线]" in line:
+            server_address_end = line.index("] [上线]")
+            server_address = line[1:server_address_end]
+
+            parts = line[server_address_end + len("] [上线] "):].split("|")
+            time_part = parts[0].strip()
+            motd_part = parts[1].replace("MOTD:", "").strip() if len(parts) > 1 else "无MOTD"
+
+            time_range = time_part.split("~")
+            start_str = time_range[0].strip()
+            end_str = time_range[1].strip() if len(time_range) > 1 else ""
+
+            start_estimated = start_str.endswith("*")
+            end_estimated = end_str.endswith("*")
+
+            start_str = start_str.rstrip("*").strip()
+            end_str = end_str.rstrip("*").strip()
+
+            try:
+                start_time = datetime.strptime(start_str, "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                continue
+
+            if end_str == "无":
+                end_time = None
+            else:
+                try:
+                    end_time = datetime.strptime(end_str, "%Y-%m-%d %H:%M:%S")
+                except ValueError:
+                    end_time = None
+
+            sessions.append({
+                "server": server_address,
+                "start": start_time,
+                "end": end_time,
+                "motd": motd_part,
+                "start_estimated": start_estimated,
+                "end_estimated": end_estimated,
+                "duration": (end_time - start_time).total_seconds() if end_time else 0
+            })
+    return sessions
+
+
+def make_large_log(days=1095, server_count=440):
+    """用 TestDataGenerator 生成约 100 万行的日志（缓存在临时目录，参数不变时复用）"""
+    path = os.path.join(tempfile.gettempdir(), f"mcmonitor_bench_{days}d_{server_count}s.log")
+    if not os.path.exists(path):
+        generator = _load_file("test_data_generator", GENERATOR_FILE)
+        generator.generate_test_log(days, server_count, path)
+    return path
+
+
+def make_pairing_log(monitor):
+    """同一 (服务器, 开始时间) 多次上线/下线、孤立下线事件和旧格式完整会话混在一起的日志"""
+    base = datetime(2024, 3, 1, 12, 0, 0)
+    hour = base.replace(hour=13) - base
+    entry = monitor.format_log_entry
+    lines = [
+        # 上线 → 下线 → 上线 → 上线 → 下线：第一次下线补全第一次上线，第三次上线一直未结束
+        entry("a:1", base, None, "m"),
+        entry("a:1", base, base + 2 * hour, "m", event="下线"),
+        entry("a:1", base, None, "m"),
+        entry("a:1", base, None, "m"),
+        entry("a:1", base, base + 3 * hour, "m", event="下线"),
+        # 没有对应上线的下线、下线之后再下线
+        entry("b:1", base, base + hour, "n", event="下线"),
+        entry("b:1", base, None, "n"),
+        entry("b:1", base, base + hour, "n", end_estimated=True, event="下线"),
+        entry("b:1", base, base + 4 * hour, "n", event="下线"),
+        # 旧格式完整会话不参与配对
+        entry("c:1", base, base + hour, "o"),
+        entry("c:1", base, None, "o"),
+        entry("c:1", base, base + 5 * hour, "o", event="下线"),
+    ]
+    return "".join(lines)
+
+
+def check_parser_pairing(monitor):
+    """parse_log_columns 的配对结果必须与逐行的 read_log_sessions 完全一致"""
+    text = make_pairing_log(monitor)
+    expected = [
+        (s["server"], s["start"], s["end"], s["start_estimated"], s["end_estimated"])
+        for s in monitor.read_log_sessions(text.splitlines())
+    ]
+    columns = monitor.parse_log_columns(text.encode("utf-8"))
+    flags = columns["flags"].tolist()
+    actual = [
+        (server, start.astype(datetime), None if end != end else end.astype(datetime),
+         bool(flag & monitor.FLAG_START_ESTIMATED), bool(flag & monitor.FLAG_END_ESTIMATED))
+        for server, start, end, flag in zip(columns["server"], columns["start"], columns["end"], flags)
+    ]
+    assert actual == expected, f"配对结果不一致:\n{actual}\n{expected}"
+
+
+def bench_parser(monitor, days=1095, server_count=440):
+    """对比旧版逐行解析和 parse_log_columns 解析约 100 万行日志"""
+    check_parser_pairing(monitor)
+    path = make_large_log(days, server_count)
+    with open(path, "rb") as f:
+        lines = sum(1 for _ in f)
+    print(f"日志解析 ({lines} 行, {os.path.getsize(path) / 1024 / 1024:.1f} MB):")
+
+    start = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        legacy = legacy_parse_log(f)
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        columns = monitor.parse_log_columns(f.read())
+    current_seconds = time.perf_counter() - start
+
+    assert len(columns["start"]) == len(legacy)
+    report("旧版逐行解析", legacy_seconds, lines)
+    report("parse_log_columns (批量)", current_seconds, lines)
+    print(f"  提升: {legacy_seconds / current_seconds:.2f}x")
+
+
+# ---------------------------------------------------------------------------
+# 配置读取：每次重新解析 settings.ini vs 配置缓存快照
+# ---------------------------------------------------------------------------
+
+def legacy_load_config(monitor):
+    """旧版 load_config：每次在全局锁内重新读取并解析 settings.ini"""
+    with monitor.config_lock:
+        config = configparser.ConfigParser(delimiters=('='), allow_no_value=True)
+        config.read(monitor.CONFIG_FILE)
+        for section, settings in monitor.DEFAULT_SETTINGS.items():
+            if not config.has_section(section):
+                config.add_section(section)
+            for key, value in settings.items():
+                if not config.has_option(section, key):
+                    config.set(section, key, value)
+        return config
+
+
+def make_settings_file(monitor, server_count):
+    """生成包含 server_count 个服务器及其通知/间隔设置的 settings.ini"""
+    path = os.path.join(tempfile.gettempdir(), f"mcmonitor_bench_settings_{server_count}.ini")
+    config = configparser.ConfigParser(delimiters=('='), allow_no_value=True)
+    config.read_dict(monitor.DEFAULT_SETTINGS)
+    servers = [f"mc{i}.example.com:25565" for i in range(server_count)]
+    config.set("Servers", "servers", "\n".join(servers))
+    for server in servers:
+        config.set("ServerNotifications", server, "1110")
+        config.set("ServerIntervals", server, "30,600")
+    with open(path, "w", encoding="utf-8") as f:
+        config.write(f)
+    return path, servers
+
+
+class _StubTray:
+    def setToolTip(self, text):
+        pass
+
+    def showMessage(self, *args):
+        pass
+
+
+class _StubApp:
+    """update_status 需要的最小托盘应用状态"""
+
+    def __init__(self):
+        self.server_statuses = {}
+        self.tray_icon = _StubTray()
+
+    def update_status_menu(self):
+        pass
+
+
+def bench_config(monitor, server_count=500, rounds=2):
+    """对比旧版每次解析配置和配置缓存下 update_status 的吞吐量（每轮每个服务器一次状态更新）"""
+    path, servers = make_settings_file(monitor, server_count)
+    print(f"update_status 吞吐量 ({server_count} 个服务器, {rounds} 轮):")
+    infos = [
+        {"host": server.rsplit(":", 1)[0], "port": 25565, "online": True, "ping": 12.0,
+         "players": {"online": 1, "max": 20}}
+        for server in servers
+    ]
+
+    def run():
+        app = _StubApp()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(open(os.devnull, "w")):  # update_status 每次都打印调试信息
+            for _ in range(rounds):
+                for info in infos:
+                    monitor.MinecraftServerMonitor.update_status(app, info, "状态")
+        return time.perf_counter() - start
+
+    config_file, snapshot = monitor.CONFIG_FILE, monitor.config_snapshot
+    try:
+        monitor.CONFIG_FILE = path
+        monitor.config_snapshot = lambda: legacy_load_config(monitor)
+        legacy = run()
+        monitor.config_snapshot = snapshot
+        monitor.CONFIG_CACHE.snapshot()  # 首次解析不计入
+        current = run()
+    finally:
+        monitor.CONFIG_FILE, monitor.config_snapshot = config_file, snapshot
+    calls = rounds * server_count
+    report("旧版每次解析 settings.ini", legacy, calls)
+    report("配置缓存快照", current, calls)
+    print(f"  吞吐量: {calls / legacy:.0f} -> {calls / current:.0f} 次/秒, 提升 {legacy / current:.2f}x")
+
+
+# ---------------------------------------------------------------------------
+# 启动导入耗时：python -X importtime 加载主程序模块
+# ---------------------------------------------------------------------------
+
+# 只在解析日志或生成图表时才需要的库，托盘启动时不应导入
+LAZY_MODULES = ("numpy", "pandas", "matplotlib")
+
+_IMPORT_MONITOR = (
+    "import importlib.util; "
+    f"spec = importlib.util.spec_from_file_location('minecraft_monitor', {MONITOR_FILE!r}); "
+    "monitor = importlib.util.module_from_spec(spec); spec.loader.exec_module(monitor)"
+)
+
+# 启动 LOG_WRITER 写入一次上线/下线（含按月轮转检查），输出此时已导入的 LAZY_MODULES
+_START_LOG_WRITER = _IMPORT_MONITOR + """
+import os, sys, tempfile
+from datetime import datetime
+with tempfile.TemporaryDirectory() as log_dir:
+    monitor.LOG_WRITER.log_file = os.path.join(log_dir, "server_status.log")
+    monitor.LOG_WRITER.rotate_monthly = True
+    now = datetime.now().replace(microsecond=0)
+    monitor.log_server_status("127.0.0.1:25565", now, None, "bench")
+    monitor.log_server_status("127.0.0.1:25565", now, now, "bench")
+    assert monitor.LOG_WRITER.flush()
+    monitor.LOG_WRITER.close()
+print("imported:" + ",".join(name for name in sys.argv[1:] if name in sys.modules))
+"""
+
+
+def import_times(preload=()):
+    """
+    在子进程中用 -X importtime 加载主程序模块（preload 中的模块先导入），
+    返回 (顶层导入总耗时秒数, [(耗时秒数, 模块名), ...] 顶层导入列表, 导入过的全部模块名)
+    """
+    code = "".join(f"import {name}; " for name in preload) + _IMPORT_MONITOR
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, encoding="utf-8", errors="replace")
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    top_level, modules = [], set()
+    for line in result.stderr.splitlines():
+        # 格式: "import time:       self |  cumulative | 模块名"，缩进表示被上一级导入
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        modules.add(name.strip())
+        if not name[1:].startswith(" "):
+            top_level.append((int(cumulative) / 1e6, name.strip()))
+    return sum(seconds for seconds, _ in top_level), top_level, modules
+
+
+def modules_after_log_writer():
+    """在子进程中加载主程序模块并让 LOG_WRITER 写入几条日志，返回此时已导入的 LAZY_MODULES"""
+    result = subprocess.run([sys.executable, "-c", _START_LOG_WRITER, *LAZY_MODULES],
+                            capture_output=True, text=True, encoding="utf-8", errors="replace")
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    line = [line for line in result.stdout.splitlines() if line.startswith("imported:")][-1]
+    return [name for name in line[len("imported:"):].split(",") if name]
+
+
+def bench_startup(monitor, runs=5):
+    """
+    对比主程序模块启动导入耗时（立即导入 numpy/pandas/matplotlib vs 按需导入），
+    并检查启动时以及 LOG_WRITER 开始写入日志后都没有导入这些库
+    """
+    print(f"启动导入耗时 (-X importtime, {runs} 次):")
+    eager = [import_times(LAZY_MODULES + ("matplotlib.figure", "matplotlib.backends.backend_agg"))[0]
+             for _ in range(runs)]
+    current = [import_times() for _ in range(runs)]
+    report("立即导入绘图/数据分析库", sum(eager), runs)
+    report("按需导入", sum(seconds for seconds, _, _ in current), runs)
+    print(f"  提升: {sum(eager) / sum(seconds for seconds, _, _ in current):.2f}x")
+
+    _, top_level, modules = current[-1]
+    print("  最慢的顶层导入:")
+    for seconds, name in sorted(top_level, reverse=True)[:5]:
+        print(f"    {name:<28} {seconds * 1000:>8.1f} ms")
+    imported = [name for name in LAZY_MODULES if name in modules]
+    assert not imported, f"启动时导入了 {', '.join(imported)}"
+    imported = modules_after_log_writer()
+    assert not imported, f"LOG_WRITER 写入日志后导入了 {', '.join(imported)}"
+    print("  LOG_WRITER 写入日志后未导入: " + ", ".join(LAZY_MODULES))
+
+
+BENCHMARKS = {
+    "reader": bench_reader,
+    "varint": bench_varint,
+    "parser": bench_parser,
+    "config": bench_config,
+    "startup": bench_startup,
+}
+
+
+if __name__ == "__main__":
+    # 用法: python PerformanceBenchmark_v0.1.py [基准名称 ...]，不带参数时运行全部
+    names = sys.argv[1:] or list(BENCHMARKS)
+    monitor = load_monitor()
+    for name in names:
+        BENCHMARKS[name](monitor)
@@ -6,28 +6,71 @@ import re
 import sys
 import os
 import ctypes
+import gzip
+import mmap
+import zlib
+import asyncio
 import configparser
 import threading
 import base64
+import functools
+import hashlib
+import heapq
+import importlib
+import ipaddress
+import queue
+import sqlite3
 from datetime import datetime, timedelta
+from types import MappingProxyType
 from PyQt5.QtWidgets import (QApplication, QSystemTrayIcon, QMenu, QMessageBox, 
                             QDialog, QVBoxLayout, QCalendarWidget, QTextEdit, 
                             QLabel, QPushButton, QHBoxLayout, QGroupBox, 
                             QSplitter, QWidget, QSizePolicy, QScrollArea,
                             QComboBox, QCheckBox, QLineEdit, QListWidget, 
                             QListWidgetItem, QAbstractItemView, QGridLayout,
-                            QInputDialog, QDialogButtonBox)
-from PyQt5.QtGui import QIcon, QTextCharFormat, QColor, QBrush, QFont, QIntValidator, QPixmap
-from PyQt5.QtCore import QThread, pyqtSignal, Qt, QObject, QPoint, QRect, QByteArray, QBuffer
-import matplotlib
-matplotlib.use('Agg')  # 使用Agg后端，不需要GUI
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-import matplotlib.dates as mdates
-import matplotlib.font_manager as fm  # 添加字体管理模块
-import numpy as np
-import pandas as pd
-from collections import defaultdict
+                            QInputDialog, QDialogButtonBox, QProgressBar)
+from PyQt5.QtGui import QIcon, QTextCharFormat, QColor, QBrush, QFont, QIntValidator, QPixmap, QImage
+from PyQt5.QtCore import QThread, pyqtSignal, Qt, QObject, QPoint, QRect, QByteArray, QBuffer, QDate
+from collections import defaultdict, OrderedDict
+try:
+    import dns.asyncresolver  # 可选依赖 dnspython：用于解析 SRV 记录
+except ImportError:
+    dns = None
+
+class LazyModule:
+    """
+    按需导入的模块：第一次访问属性时才导入（可选 setup 在导入后执行一次）
+    matplotlib/pandas/numpy 只在解析日志、统计延迟和生成图表时用到，托盘启动时不导入
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, name, setup=None):
+        self._name = name
+        self._setup = setup
+        self._module = None
+
+    def load(self):
+        module = self._module
+        if module is None:
+            with LazyModule._lock:
+                if self._module is None:
+                    module = importlib.import_module(self._name)
+                    if self._setup:
+                        self._setup(module)
+                    self._module = module
+                module = self._module
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+matplotlib = LazyModule("matplotlib", setup=lambda module: module.use('Agg'))  # 使用Agg后端，不需要GUI
+mdates = LazyModule("matplotlib.dates")
+fm = LazyModule("matplotlib.font_manager")  # 添加字体管理模块
+mpl_figure = LazyModule("matplotlib.figure")
+mpl_backend_agg = LazyModule("matplotlib.backends.backend_agg")
 
 def get_app_base_path():
     """获取应用程序基目录，支持 PyInstaller 打包和普通运行模式"""
@@ -44,12 +87,23 @@ BASE_DIR = get_app_base_path()
 CONFIG_FILE = os.path.join(BASE_DIR, "settings.ini")
 ICON_PATH = os.path.join(BASE_DIR, "monitor_icon.ico")
 LOG_FILE = os.path.join(BASE_DIR, "server_status.log")  # 日志文件路径
+SESSION_DB_FILE = os.path.join(BASE_DIR, "server_status.db")  # SQLite 会话库路径
 
 # 默认设置
 DEFAULT_SETTINGS = {
     'General': {
         'check_interval': '180',
+        'max_concurrency': '64',  # 探测引擎同时进行的最大检查数
+        'probe_timeout': '5',  # 单次检查的总超时（秒），按解析/连接/握手/读取阶段划分
+        'dns_cache_ttl': '300',  # DNS 解析结果缓存时间（秒），记录自带 TTL 时取较小值
+        'breaker_threshold': '5',  # 连续失败多少次后进入熔断（半开）状态
+        'breaker_max_delay': '3600',  # 熔断状态下重试间隔的上限（秒）
+        'latency_samples': '1440',  # 每个服务器保留的延迟样本数
+        'log_fsync_interval': '1',  # 日志写入线程两次 fsync 之间的最短间隔（秒），0 表示每批都 fsync
+        'log_rotation': 'monthly',  # 日志轮转: monthly（之前月份的日志按月 gzip 归档）或 none
         'log_file': LOG_FILE,
+        'session_store': 'text',  # 会话历史存储: text（只读文本日志）或 sqlite（额外写入带索引的 SQLite 会话库，重启生效）
+        'session_db': SESSION_DB_FILE,
         'icon_path': ICON_PATH
     },
     'Servers': {
@@ -63,8 +117,13 @@ DEFAULT_SETTINGS = {
         # 格式: 服务器地址: 设置值 (0/1)
         # 例如: '127.0.0.1:25565': '111'  # 分别对应: 上线弹窗, 上线通知, 离线通知
     },
+    'ServerIntervals': {
+        # 格式: 服务器地址: 最小间隔,最大间隔 (秒)
+        # 例如: '127.0.0.1:25565': '30,600'  # 未设置时按检查间隔计算默认值
+    },
     'Calendar': {
-        'show_color': '0'  # 默认不显示颜色
+        'show_color': '0',  # 默认不显示颜色
+        'chart_font': ''  # 图表使用的中文字体文件路径（没有中文字体时为 none:<字体列表版本>），第一次生成图表时查找并保存
     }
 }
 
@@ -182,38 +241,227 @@ def base64_to_pixmap(base64_str):
             print(f"转换图标错误: {str(e)}")
             return None
 
-def load_config():
-    """加载配置文件，如果不存在则创建默认配置"""
-    print('load_config 加载配置文件')
-    with config_lock:
-        config = configparser.ConfigParser(delimiters=('='), allow_no_value=True)
+class FaviconCache:
+    """
+    服务器图标缓存
+    Base64 图标数据按内容哈希只保存一份，检查结果中只携带哈希；
+    解码并缩放后的 QPixmap 保存在 LRU 缓存中，重复打开窗口时不再解码
+    """
 
-        # 确保配置文件目录存在
-        config_dir = os.path.dirname(CONFIG_FILE)
-        if config_dir and not os.path.exists(config_dir):
-            os.makedirs(config_dir, exist_ok=True)
-        
-        # 如果配置文件不存在，创建默认配置
-        if not os.path.exists(CONFIG_FILE):
-            print(f"创建默认配置文件: {CONFIG_FILE}")
-            config.read_dict(DEFAULT_SETTINGS)
-            with open(CONFIG_FILE, 'w') as configfile:
-                config.write(configfile)
-        else:
-            config.read(CONFIG_FILE)
-        
-        # 确保所有必要的设置都存在
-        for section, settings in DEFAULT_SETTINGS.items():
-            if not config.has_section(section):
-                config.add_section(section)
-            for key, value in settings.items():
-                if not config.has_option(section, key):
-                    config.set(section, key, value)
+    def __init__(self, max_pixmaps=256, size=64):
+        self.max_pixmaps = max_pixmaps
+        self.size = size  # 缩放后的图标尺寸
+        self._lock = threading.Lock()  # 检查结果在引擎线程写入，图标在GUI线程读取
+        self._data = {}  # 哈希 -> Base64 字符串
+        self._refs = {}  # 哈希 -> 引用该图标的服务器数
+        self._owners = {}  # 服务器地址 -> 哈希
+        self._pixmaps = OrderedDict()  # 哈希 -> 缩放后的 QPixmap（只在GUI线程访问）
+
+    def store(self, server_address, favicon_base64):
+        """记录服务器当前图标，返回图标哈希（无图标时返回 None）"""
+        if not favicon_base64:
+            self.release(server_address)
+            return None
+        key = hashlib.sha1(favicon_base64.encode("ascii", "replace")).hexdigest()[:16]
+        with self._lock:
+            old_key = self._owners.get(server_address)
+            if old_key == key:
+                return old_key  # 图标未变化，复用已有的哈希字符串
+            self._data.setdefault(key, favicon_base64)
+            self._refs[key] = self._refs.get(key, 0) + 1
+            self._owners[server_address] = key
+            if old_key:
+                self._release_key(old_key)
+        return key
+
+    def release(self, server_address):
+        """服务器移除或不再有图标时释放引用"""
+        with self._lock:
+            old_key = self._owners.pop(server_address, None)
+            if old_key:
+                self._release_key(old_key)
+
+    def _release_key(self, key):
+        self._refs[key] -= 1
+        if self._refs[key] <= 0:
+            del self._refs[key]
+            del self._data[key]
+
+    def get_data(self, key):
+        """获取图标的 Base64 数据"""
+        with self._lock:
+            return self._data.get(key)
+
+    def get_pixmap(self, key):
+        """获取缩放后的图标 QPixmap（只能在GUI线程调用），没有有效图标时返回 None"""
+        if not key:
+            return None
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+            return pixmap
+
+        pixmap = base64_to_pixmap(self.get_data(key))
+        if pixmap is None or pixmap.isNull():
+            return None
+        # 缩放图标以适应标签
+        pixmap = pixmap.scaled(self.size, self.size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self._pixmaps[key] = pixmap
+        if len(self._pixmaps) > self.max_pixmaps:
+            self._pixmaps.popitem(last=False)
+        return pixmap
+
+# 全局图标缓存
+FAVICON_CACHE = FaviconCache()
+
+def _new_config_parser():
+    return configparser.ConfigParser(delimiters=('='), allow_no_value=True)
+
+def _read_config_file():
+    """读取并解析配置文件，如果不存在则创建默认配置（调用方持有 config_lock）"""
+    print('_read_config_file 解析配置文件')
+    config = _new_config_parser()
+
+    # 确保配置文件目录存在
+    config_dir = os.path.dirname(CONFIG_FILE)
+    if config_dir and not os.path.exists(config_dir):
+        os.makedirs(config_dir, exist_ok=True)
+    
+    # 如果配置文件不存在，创建默认配置
+    if not os.path.exists(CONFIG_FILE):
+        print(f"创建默认配置文件: {CONFIG_FILE}")
+        config.read_dict(DEFAULT_SETTINGS)
+        with open(CONFIG_FILE, 'w') as configfile:
+            config.write(configfile)
+    else:
+        config.read(CONFIG_FILE)
+    
+    # 确保所有必要的设置都存在
+    for section, settings in DEFAULT_SETTINGS.items():
+        if not config.has_section(section):
+            config.add_section(section)
+        for key, value in settings.items():
+            if not config.has_option(section, key):
+                config.set(section, key, value)
+
+    return config
+
+class ConfigSnapshot:
+    """
+    配置的只读快照，读取接口与 ConfigParser 相同（get/getint/getfloat/getboolean/has_option...）
+    创建后不再修改，可以在任意线程共享；需要修改配置时用 load_config() 取得可修改的副本
+    """
+    _UNSET = object()
+
+    def __init__(self, config):
+        self._sections = MappingProxyType({
+            section: MappingProxyType(dict(config.items(section, raw=True)))
+            for section in config.sections()
+        })
+
+    def sections(self):
+        return list(self._sections)
+
+    def has_section(self, section):
+        return section in self._sections
+
+    def has_option(self, section, option):
+        return section in self._sections and option.lower() in self._sections[section]
+
+    def options(self, section):
+        return list(self._sections[section])
+
+    def items(self, section):
+        return list(self._sections[section].items())
+
+    def get(self, section, option, *, fallback=_UNSET):
+        options = self._sections.get(section)
+        if options is None:
+            if fallback is self._UNSET:
+                raise configparser.NoSectionError(section)
+            return fallback
+        option = option.lower()
+        if option not in options:
+            if fallback is self._UNSET:
+                raise configparser.NoOptionError(option, section)
+            return fallback
+        return options[option]
 
+    def _get_converted(self, convert, section, option, fallback):
+        try:
+            value = self.get(section, option)
+        except (configparser.NoSectionError, configparser.NoOptionError):
+            if fallback is self._UNSET:
+                raise
+            return fallback
+        return convert(value)
+
+    def getint(self, section, option, *, fallback=_UNSET):
+        return self._get_converted(int, section, option, fallback)
+
+    def getfloat(self, section, option, *, fallback=_UNSET):
+        return self._get_converted(float, section, option, fallback)
+
+    def getboolean(self, section, option, *, fallback=_UNSET):
+        def convert(value):
+            if value.lower() not in configparser.ConfigParser.BOOLEAN_STATES:
+                raise ValueError(f"Not a boolean: {value}")
+            return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+        return self._get_converted(convert, section, option, fallback)
+
+    def copy(self):
+        """可修改的 ConfigParser 副本"""
+        config = _new_config_parser()
+        config.read_dict({section: dict(options) for section, options in self._sections.items()})
         return config
 
+class ConfigCache:
+    """
+    settings.ini 的进程级缓存
+    配置文件的修改时间/大小/inode 不变时直接返回上次解析的快照，只有文件变化或 save_config 之后才重新解析，
+    读取方不再每次都在 config_lock 内解析 INI
+    """
+
+    def __init__(self):
+        self._entry = (None, None)  # (文件标识, 快照)，整体替换，读取时不需要加锁
+
+    @staticmethod
+    def _file_key():
+        try:
+            stat = os.stat(CONFIG_FILE)
+        except OSError:
+            return None
+        return (CONFIG_FILE, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def snapshot(self) -> ConfigSnapshot:
+        key, snapshot = self._entry
+        if snapshot is not None and key is not None and key == self._file_key():
+            return snapshot
+        with config_lock:
+            key, snapshot = self._entry
+            if snapshot is None or key is None or key != self._file_key():
+                snapshot = ConfigSnapshot(_read_config_file())
+                self._entry = (self._file_key(), snapshot)
+            return snapshot
+
+    def update(self, config):
+        """保存配置之后直接用保存的内容更新快照（调用方持有 config_lock）"""
+        self._entry = (self._file_key(), ConfigSnapshot(config))
+
+# 全局配置缓存
+CONFIG_CACHE = ConfigCache()
+
+def config_snapshot() -> ConfigSnapshot:
+    """当前配置的只读快照（文件未变化时不重新解析）"""
+    return CONFIG_CACHE.snapshot()
+
+def load_config():
+    """加载配置文件，返回可修改的 ConfigParser 副本（只读取配置时用 config_snapshot()）"""
+    print('load_config 加载配置文件')
+    return config_snapshot().copy()
+
 def save_config(config):
-    """保存配置到文件"""
+    """保存配置到文件，并更新配置缓存"""
     print('save_config 保存配置文件')
     with config_lock:
         # 确保配置文件目录存在
@@ -223,6 +471,26 @@ def save_config(config):
         
         with open(CONFIG_FILE, 'w', encoding='utf-8') as configfile:
             config.write(configfile)
+        CONFIG_CACHE.update(config)
+
+def get_server_interval_bounds(config, server_address):
+    """获取服务器的自适应检查间隔范围 (最小间隔, 最大间隔)"""
+    check_interval = int(config.get('General', 'check_interval', fallback=180))
+    # 默认：状态变化后最快 1/6 检查间隔（不少于10秒），长期稳定时最慢 2 倍检查间隔
+    min_interval = max(10, check_interval // 6)
+    max_interval = check_interval * 2
+
+    bounds_str = config.get('ServerIntervals', server_address, fallback='')
+    if bounds_str:
+        try:
+            min_str, max_str = bounds_str.split(',')
+            if min_str.strip():
+                min_interval = max(10, int(min_str))
+            if max_str.strip():
+                max_interval = int(max_str)
+        except ValueError:
+            print(f"服务器检查间隔设置无效: {server_address} = {bounds_str}")
+    return min_interval, max(min_interval, max_interval)
 
 def parse_server_address(address: str):
     """解析服务器地址格式：host:port 或 host"""
@@ -248,137 +516,454 @@ def is_valid_server_address(address: str):
     except:
         return False
 
+class SystemResolver:
+    """系统解析器：A/AAAA 记录使用 getaddrinfo，SRV 记录使用 dnspython（未安装时不解析 SRV）"""
+
+    async def resolve_srv(self, name: str):
+        """解析 SRV 记录，返回按优先级排序的 [(目标主机, 端口, TTL)]，没有记录时返回空列表"""
+        if dns is None:
+            return []
+        try:
+            answer = await dns.asyncresolver.resolve(name, "SRV")
+        except Exception:
+            return []
+        records = sorted(answer, key=lambda r: (r.priority, -r.weight))
+        return [(r.target.to_text().rstrip("."), r.port, answer.rrset.ttl) for r in records]
+
+    async def resolve_addresses(self, host: str, port: int):
+        """解析 A/AAAA 记录，返回 ([(地址族, 套接字地址)], TTL)，getaddrinfo 不提供 TTL 时为 None"""
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        return [(family, sockaddr) for family, _, _, _, sockaddr in infos], None
+
+class StubResolver:
+    """静态解析器，用于离线测试：srv_records 按 SRV 名称、addresses 按主机名给出结果"""
+
+    def __init__(self, srv_records=None, addresses=None):
+        self.srv_records = srv_records or {}  # "_minecraft._tcp.host" -> [(目标主机, 端口, TTL)]
+        self.addresses = addresses or {}  # 主机名 -> [(地址族, 套接字地址)]
+        self.fail = False  # 设为 True 时模拟解析器故障
+        self.queries = 0  # 查询次数
+
+    async def resolve_srv(self, name: str):
+        self.queries += 1
+        if self.fail:
+            raise OSError("模拟的解析失败")
+        return list(self.srv_records.get(name, []))
+
+    async def resolve_addresses(self, host: str, port: int):
+        self.queries += 1
+        if self.fail or host not in self.addresses:
+            raise socket.gaierror(f"无法解析 {host}")
+        return [(family, sockaddr[:1] + (port,) + sockaddr[2:]) for family, sockaddr in self.addresses[host]], None
+
+class ResolverCache:
+    """
+    探测目标的解析缓存
+    默认端口的域名会先查询 _minecraft._tcp SRV 记录，再解析 A/AAAA；
+    结果按 TTL 缓存，解析失败时返回已过期的缓存结果
+    """
+
+    def __init__(self, resolver=None, ttl: int = 300):
+        self.resolver = resolver or SystemResolver()
+        self.ttl = ttl
+        self._cache = {}  # (主机, 端口) -> (过期时间, [(地址族, 套接字地址)])
+
+    @staticmethod
+    def _wants_srv(host: str, port: int) -> bool:
+        """只有使用默认端口的域名才查询 SRV 记录（与客户端行为一致）"""
+        if port != 25565:
+            return False
+        try:
+            ipaddress.ip_address(host)
+            return False
+        except ValueError:
+            return True
+
+    async def resolve(self, host: str, port: int):
+        """返回 [(地址族, 套接字地址)] 连接候选列表"""
+        key = (host, port)
+        entry = self._cache.get(key)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            return entry[1]
+
+        try:
+            target_host, target_port, ttl = host, port, self.ttl
+            if self._wants_srv(host, port):
+                try:
+                    records = await self.resolver.resolve_srv(f"_minecraft._tcp.{host}")
+                except Exception:
+                    records = []  # SRV 查询失败时按普通域名处理
+                if records:
+                    target_host, target_port, srv_ttl = records[0]
+                    ttl = min(ttl, srv_ttl)
+
+            addresses, address_ttl = await self.resolver.resolve_addresses(target_host, target_port)
+            if not addresses:
+                raise socket.gaierror(f"{target_host} 没有可用地址")
+            if address_ttl is not None:
+                ttl = min(ttl, address_ttl)
+        except Exception:
+            if entry:
+                # 解析失败时使用过期缓存，并在短时间后再重试解析
+                self._cache[key] = (now + min(self.ttl, 30), entry[1])
+                return entry[1]
+            raise
+
+        self._cache[key] = (now + ttl, addresses)
+        return addresses
+
+# 未指定解析器时使用的全局解析缓存
+DEFAULT_RESOLVER = ResolverCache()
+
 def get_server_info(host: str, port: int = 25565, timeout: int = 5) -> dict:
     """
     获取 Minecraft 服务器信息
     返回字典包含: 版本、在线玩家、最大玩家、MOTD、玩家列表等
     """
     print(threading.current_thread().name+'-get_server_info-获取 Minecraft 服务器信息')
+    return asyncio.run(async_get_server_info(host, port, timeout))
+
+# 检查阶段名称（用于错误信息）
+PROBE_PHASE_NAMES = {
+    "resolve": "域名解析",
+    "connect": "连接",
+    "handshake": "握手",
+    "read": "读取响应",
+}
+
+class ProbeBudget:
+    """
+    单次检查的总超时预算
+    每个阶段有各自的截止时间（占总时长的累计比例），前面阶段没用完的时间顺延给后面的阶段
+    """
+    PHASE_DEADLINES = {"resolve": 0.2, "connect": 0.6, "handshake": 0.7, "read": 1.0}
+
+    def __init__(self, loop, timeout: float):
+        self.loop = loop
+        self.start = loop.time()
+        self.timeout = timeout
+
+    def remaining(self, phase: str) -> float:
+        """返回该阶段还可以使用的秒数"""
+        deadline = self.start + self.timeout * self.PHASE_DEADLINES[phase]
+        return max(0, deadline - self.loop.time())
+
+# Happy Eyeballs：前一个地址未在该时间内连上时，开始尝试下一个地址（RFC 8305 建议 250ms）
+HAPPY_EYEBALLS_DELAY = 0.25
+
+async def async_get_server_info(host: str, port: int = 25565, timeout: int = 5, resolver=None) -> dict:
+    """
+    异步获取 Minecraft 服务器信息（非阻塞握手与状态交换）
+    在同一连接上用 Ping/Pong 数据包测量延迟，返回字典格式与 get_server_info 相同；
+    离线时 "phase" 字段给出失败的阶段 (resolve/connect/handshake/read)
+    """
+    loop = asyncio.get_running_loop()
+    budget = ProbeBudget(loop, timeout)
+    resolver = resolver or DEFAULT_RESOLVER
+    phase = "resolve"
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.settimeout(timeout)
-            sock.connect((host, port))
-
-            # 发送握手数据包
-            handshake = b"\x00"  # 数据包ID (Handshake)
-            handshake += _pack_varint(404)  # 协议版本
-            handshake += _pack_string(host)
-            handshake += struct.pack(">H", port)
-            handshake += _pack_varint(1)  # 下一步状态 (Status)
-            
-            handshake_packet = _pack_varint(len(handshake)) + handshake
-            sock.send(handshake_packet)
-            
-            # 发送状态请求
-            status_request = _pack_varint(1) + b"\x00"
-            sock.send(status_request)
-            
-            # 读取响应
-            response_length = _unpack_varint(sock)
-            response = b""
-            while len(response) < response_length:
-                response += sock.recv(4096)
-            
-            # 解析响应
-            buffer = response
-            packet_id, buffer = _unpack_varint_from_buffer(buffer)
-            json_length, buffer = _unpack_varint_from_buffer(buffer)
-            json_data = buffer[:json_length]
-            server_info = json.loads(json_data.decode("utf-8"))
-            print(server_info)
-            # 处理玩家列表
-            if "players" in server_info and "sample" in server_info["players"]:
-                players = [p["name"] for p in server_info["players"]["sample"]]
-            else:
-                players = []
-
-            # 处理图标（favicon）
-            favicon_base64 = None
-            if "favicon" in server_info:
-                favicon_base64 = server_info["favicon"]
-                # 如果包含前缀，去掉前缀
-                if favicon_base64.startswith("data:image/png;base64,"):
-                    favicon_base64 = favicon_base64[len("data:image/png;base64,"):]
-
-            # 处理 MOTD 格式 - 使用新的解析函数
-            plain_motd = "No MOTD"
-            html_motd = "No MOTD"
-            if "description" in server_info:
-                plain_motd, html_motd = parse_motd(server_info["description"])
-
-            return {
-                "online": True,
-                "host": host,
-                "port": port,
-                "version": server_info.get("version", {}).get("name", "Unknown"),
-                "protocol": server_info.get("version", {}).get("protocol", -1),
-                "motd_plain": plain_motd,
-                "motd_html": html_motd,
-                "players": {
-                    "online": server_info.get("players", {}).get("online", 0),
-                    "max": server_info.get("players", {}).get("max", 0),
-                    "list": players
-                },
-                "ping": 0,
-                "favicon": favicon_base64
-            }
-            
-    except (socket.timeout, ConnectionRefusedError):
-        return {"online": False, "host": host, "port": port, "error": "连接失败"}
+        candidates = await asyncio.wait_for(resolver.resolve(host, port), budget.remaining("resolve"))
+
+        phase = "connect"
+        sock = await asyncio.wait_for(open_probe_connection(loop, candidates), budget.remaining("connect"))
+        with sock:
+            reader = PacketReader(loop, sock)
+
+            phase = "handshake"
+            start = await asyncio.wait_for(
+                _async_send_status_request(loop, sock, host, port), budget.remaining("handshake"))
+
+            phase = "read"
+            payload, status_rtt = await asyncio.wait_for(
+                _async_read_status_response(reader, start), budget.remaining("read"))
+            info = _parse_status_response(host, port, payload)
+
+            # 状态响应后在同一连接上发送 Ping，测量应用层往返延迟
+            try:
+                info["ping"] = await asyncio.wait_for(
+                    _async_ping_exchange(loop, sock, reader), budget.remaining("read"))
+            except (asyncio.TimeoutError, OSError, ValueError):
+                # 服务器不响应 Ping 时，退回使用状态请求的往返时间
+                info["ping"] = status_rtt
+            return info
+    except (socket.timeout, asyncio.TimeoutError):
+        error = f"{PROBE_PHASE_NAMES[phase]}超时"
+    except ConnectionRefusedError:
+        error = "连接被拒绝"
+    except (socket.gaierror, UnicodeError) as e:
+        error = f"域名解析失败: {str(e)}"
     except Exception as e:
-        return {"online": False, "host": host, "port": port, "error": str(e)}
+        error = f"{PROBE_PHASE_NAMES[phase]}失败: {str(e)}"
+    return {"online": False, "host": host, "port": port, "error": error, "phase": phase}
+
+def _interleave_families(candidates):
+    """按地址族交替排列候选地址（保持解析器给出的首选地址族在前）"""
+    groups = OrderedDict()
+    for family, sockaddr in candidates:
+        groups.setdefault(family, []).append((family, sockaddr))
+    ordered = []
+    queues = list(groups.values())
+    while any(queues):
+        for group in queues:
+            if group:
+                ordered.append(group.pop(0))
+    return ordered
+
+async def _connect_candidate(loop, family, sockaddr):
+    """连接单个候选地址，失败或取消时关闭套接字"""
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.setblocking(False)
+        await loop.sock_connect(sock, sockaddr)
+        return sock
+    except BaseException:
+        sock.close()
+        raise
+
+async def open_probe_connection(loop, candidates, delay: float = HAPPY_EYEBALLS_DELAY):
+    """
+    Happy Eyeballs 连接：IPv4/IPv6 候选地址交替排列，
+    前一个尝试失败或 delay 秒内未完成时并行开始下一个，返回第一个连接成功的套接字
+    """
+    candidates = _interleave_families(candidates)
+    pending = set()
+    errors = []
+    try:
+        for index, (family, sockaddr) in enumerate(candidates):
+            pending.add(asyncio.create_task(_connect_candidate(loop, family, sockaddr)))
+            is_last = index == len(candidates) - 1
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=None if is_last else delay, return_when=asyncio.FIRST_COMPLETED)
+                winner = None
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        task.result().close()  # 同时连上的多余连接
+                if winner is not None:
+                    return winner
+                if not is_last:
+                    break  # 等待超时或有尝试失败：开始下一个候选地址
+        raise errors[-1] if errors else OSError("没有可连接的地址")
+    finally:
+        for task in pending:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                task.result().close()
+            else:
+                task.cancel()
+
+@functools.lru_cache(maxsize=4096)
+def build_status_request(host: str, port: int) -> bytes:
+    """生成握手+状态请求数据包（只与服务器地址有关，按地址缓存复用）"""
+    # 握手数据包
+    handshake = b"".join((
+        b"\x00",  # 数据包ID (Handshake)
+        _pack_varint(404),  # 协议版本
+        _pack_string(host),
+        struct.pack(">H", port),
+        _pack_varint(1),  # 下一步状态 (Status)
+    ))
+
+    # 状态请求紧跟在握手之后，一次发送
+    status_request = b"\x01\x00"
+    return _pack_varint(len(handshake)) + handshake + status_request
+
+async def _async_send_status_request(loop, sock: socket.socket, host: str, port: int) -> float:
+    """发送握手和状态请求，返回发送时刻 (perf_counter)"""
+    request = build_status_request(host, port)
+    start = time.perf_counter()
+    await loop.sock_sendall(sock, request)
+    return start
+
+async def _async_read_status_response(reader, start: float):
+    """读取状态响应，返回 (状态响应数据 memoryview, 往返延迟ms)"""
+    # 收到第一个字节时记录往返时间
+    await reader.fill(1)
+    rtt = (time.perf_counter() - start) * 1000
+    packet_id, payload = await reader.read_packet()
+    return payload, rtt
+
+async def _async_ping_exchange(loop, sock: socket.socket, reader) -> float:
+    """发送 Ping (0x01) 数据包并等待 Pong，返回往返延迟 (ms)"""
+    payload = struct.pack(">q", int(time.time() * 1000))
+    ping_packet = _pack_varint(1 + len(payload)) + b"\x01" + payload
+
+    start = time.perf_counter()
+    await loop.sock_sendall(sock, ping_packet)
+    packet_id, pong = await reader.read_packet()
+    rtt = (time.perf_counter() - start) * 1000
+
+    if packet_id != 0x01 or pong != payload:
+        raise ValueError("无效的 Pong 响应")
+    return rtt
+
+class PacketReader:
+    """
+    基于预分配 bytearray 的数据包读取器
+    使用 recv_into 直接接收到缓冲区，返回的数据包内容是缓冲区的 memoryview（不复制），
+    该 memoryview 仅在下一次读取前有效
+    """
+    MAX_PACKET_LENGTH = 2 * 1024 * 1024  # 状态/Pong 数据包长度上限，防止异常服务器声明超大长度耗尽内存
+
+    def __init__(self, loop, sock: socket.socket, size: int = 4096):
+        self.loop = loop
+        self.sock = sock
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # 未读数据起点
+        self.end = 0  # 已接收数据终点
+
+    async def fill(self, n: int):
+        """确保缓冲区中至少有 n 字节未读数据"""
+        if self.end - self.start >= n:
+            return
+        if len(self.buffer) - self.start < n:
+            # 剩余空间不足：数据包比缓冲区大时按包长一次性分配，否则把未读数据移到开头
+            unread = self.end - self.start
+            if n > len(self.buffer):
+                buffer = bytearray(n)
+                buffer[:unread] = self.view[self.start:self.end]
+                self.buffer = buffer
+                self.view = memoryview(buffer)
+            else:
+                self.buffer[:unread] = self.view[self.start:self.end]
+            self.start, self.end = 0, unread
+
+        while self.end - self.start < n:
+            received = await self.loop.sock_recv_into(self.sock, self.view[self.end:])
+            if received == 0:
+                raise ConnectionError("连接被服务器关闭")
+            self.end += received
+
+    async def read_varint(self) -> int:
+        """读取一个 VarInt"""
+        # 快速路径：缓冲区中已有的单字节 VarInt
+        if self.start < self.end:
+            byte = self.buffer[self.start]
+            if byte < 0x80:
+                self.start += 1
+                return byte
+
+        data = 0
+        for i in range(5):
+            if self.start == self.end:
+                await self.fill(1)
+            byte = self.buffer[self.start]
+            self.start += 1
+            data |= (byte & 0x7F) << 7 * i
+            if not byte & 0x80:
+                break
+        return data
+
+    async def read_packet(self):
+        """读取一个完整数据包，返回 (数据包ID, 数据内容 memoryview)"""
+        length = await self.read_varint()
+        if length > self.MAX_PACKET_LENGTH:
+            raise ValueError(f"数据包长度 {length} 超过上限 {self.MAX_PACKET_LENGTH}")
+        await self.fill(length)
+        packet = self.view[self.start:self.start + length]
+        self.start += length
+        packet_id, offset = _unpack_varint_from_buffer(packet)
+        return packet_id, packet[offset:]
+
+def _parse_status_response(host: str, port: int, payload) -> dict:
+    """解析状态响应数据包内容（不含数据包ID），生成服务器信息字典"""
+    json_length, offset = _unpack_varint_from_buffer(payload)
+    # 直接从缓冲区解码为字符串，不经过中间 bytes 复制
+    server_info = json.loads(str(payload[offset:offset + json_length], "utf-8"))
+
+    # 处理玩家列表
+    if "players" in server_info and "sample" in server_info["players"]:
+        players = [p["name"] for p in server_info["players"]["sample"]]
+    else:
+        players = []
+
+    # 处理图标（favicon）
+    favicon_base64 = None
+    if "favicon" in server_info:
+        favicon_base64 = server_info["favicon"]
+        # 如果包含前缀，去掉前缀
+        if favicon_base64.startswith("data:image/png;base64,"):
+            favicon_base64 = favicon_base64[len("data:image/png;base64,"):]
+
+    # 处理 MOTD 格式 - 使用新的解析函数
+    plain_motd = "No MOTD"
+    html_motd = "No MOTD"
+    if "description" in server_info:
+        plain_motd, html_motd = parse_motd(server_info["description"])
+
+    return {
+        "online": True,
+        "host": host,
+        "port": port,
+        "version": server_info.get("version", {}).get("name", "Unknown"),
+        "protocol": server_info.get("version", {}).get("protocol", -1),
+        "motd_plain": plain_motd,
+        "motd_html": html_motd,
+        "players": {
+            "online": server_info.get("players", {}).get("online", 0),
+            "max": server_info.get("players", {}).get("max", 0),
+            "list": players
+        },
+        "ping": 0,
+        "favicon_hash": FAVICON_CACHE.store(f"{host}:{port}", favicon_base64)  # 图标数据保存在 FAVICON_CACHE
+    }
 
 def get_ping(host: str, port: int = 25565, timeout: int = 3) -> float:
-    """测量服务器实际延迟 (ms)"""
+    """测量服务器实际延迟 (ms)，失败时返回 -1"""
     print('get_ping 测量延迟')
-    try:
-        start = time.time()
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.settimeout(timeout)
-            sock.connect((host, port))
-            sock.send(b"\xFE\x01")  # Legacy ping packet
-            sock.recv(1024)
-        return (time.time() - start) * 1000
-    except:
-        return -1
+    info = get_server_info(host, port, timeout)
+    return info["ping"] if info.get("online", False) else -1
 
 # VarInt 编码/解码工具函数
+# 单字节 VarInt (0~127) 查找表
+_VARINT_ONE_BYTE = [bytes((i,)) for i in range(0x80)]
+
 def _pack_varint(value: int) -> bytes:
+    # 快速路径：单字节和双字节 VarInt（数据包长度、协议版本等常见值）
+    if 0 <= value < 0x80:
+        return _VARINT_ONE_BYTE[value]
+    if 0 < value < 0x4000:
+        return bytes((value & 0x7F | 0x80, value >> 7))
+
     if value < 0:
         value += (1 << 32)
-    out = b""
+    out = bytearray()
     while True:
         byte = value & 0x7F
         value >>= 7
-        out += struct.pack("B", byte | (0x80 if value > 0 else 0))
+        out.append(byte | (0x80 if value > 0 else 0))
         if value == 0:
             break
-    return out
+    return bytes(out)
 
-def _unpack_varint(sock: socket.socket) -> int:
-    data = 0
-    for i in range(5):
-        byte = sock.recv(1)
-        if len(byte) == 0:
-            break
-        byte = byte[0]
-        data |= (byte & 0x7F) << 7 * i
-        if not byte & 0x80:
-            break
-    return data
+def _unpack_varint_from_buffer(buffer, offset: int = 0) -> (int, int):
+    """从 buffer 的 offset 处解码 VarInt，返回 (值, 新的offset)，不复制缓冲区"""
+    # 快速路径：单字节和双字节 VarInt
+    if len(buffer) > offset + 1:
+        byte = buffer[offset]
+        if byte < 0x80:
+            return byte, offset + 1
+        second = buffer[offset + 1]
+        if second < 0x80:
+            return (byte & 0x7F) | (second << 7), offset + 2
 
-def _unpack_varint_from_buffer(buffer: bytes) -> (int, bytes):
     data = 0
     count = 0
     for i in range(5):
-        if len(buffer) <= i:
+        if len(buffer) <= offset + i:
             break
-        byte = buffer[i]
+        byte = buffer[offset + i]
         data |= (byte & 0x7F) << 7 * i
         count += 1
         if not byte & 0x80:
             break
-    return data, buffer[count:]
+    return data, offset + count
 
 def _pack_string(string: str) -> bytes:
     data = string.encode("utf-8")
@@ -389,82 +974,1705 @@ def clean_motd(motd: str) -> str:
     print('clean_motd 清理MOTD中的格式代码')
     return re.sub(r"§[0-9a-fk-or]", "", motd)
 
-def log_server_status(server_address, start_time: datetime, end_time: datetime, motd_plain: str, start_estimated: bool = False, end_estimated: bool = False):
-    """记录服务器状态到日志文件"""
-    print('log_server_status 记录日志')
+# 日志时间格式
+LOG_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def format_log_entry(server_address, start_time: datetime, end_time: datetime, motd_plain: str, start_estimated: bool = False, end_estimated: bool = False, event: str = "上线"):
+    """
+    生成一行日志
+    日志是只追加的事件记录：服务器上线时写入 "[上线] 开始时间 ~ 无"，
+    下线时写入 "[下线] 开始时间 ~ 结束时间"，读取时按 (服务器, 开始时间) 配对成会话
+    """
     cleaned_motd = motd_plain.replace('\n', ' ')  # 移除换行符
     # 格式化时间
-    start_str = start_time.strftime("%Y-%m-%d %H:%M:%S")
+    start_str = start_time.strftime(LOG_TIME_FORMAT)
     if start_estimated:
         start_str += "*"  # 添加星号表示服务器上线时间早于应用启动时间
     
-    if end_time:
-        end_str = end_time.strftime("%Y-%m-%d %H:%M:%S")
-        if end_estimated:
-            end_str += "*"  # 添加星号表示服务器下线时间晚于应用退出时间
-    else:
-        end_str = "无"
+    if end_time:
+        end_str = end_time.strftime(LOG_TIME_FORMAT)
+        if end_estimated:
+            end_str += "*"  # 添加星号表示服务器下线时间晚于应用退出时间
+    else:
+        end_str = "无"
+    
+    return f"[{server_address}] [{event}] {start_str} ~ {end_str} | MOTD: {cleaned_motd}\n"
+
+def parse_log_line(line: str):
+    """
+    解析一行日志，返回事件字典，无法解析时返回 None
+    事件类型: open（上线，结束时间为"无"）、close（下线）、session（旧格式的完整会话）
+    """
+    line = line.strip()
+    # 示例: [127.0.0.1:25565] [上线] 2024-06-28 10:30:00 ~ 2024-06-28 12:45:00 | MOTD: Welcome to the server
+    if not line.startswith("["):
+        return None
+    if "] [上线]" in line:
+        tag = "] [上线]"
+    elif "] [下线]" in line:
+        tag = "] [下线]"
+    else:
+        return None
+
+    # 提取服务器地址
+    server_address_end = line.index(tag)
+    server_address = line[1:server_address_end]
+
+    parts = line[server_address_end + len(tag) + 1:].split("|")
+    time_part = parts[0].strip()
+    motd_part = parts[1].replace("MOTD:", "").strip() if len(parts) > 1 else "无MOTD"
+
+    # 处理时间范围
+    time_range = time_part.split("~")
+    start_str = time_range[0].strip()
+    end_str = time_range[1].strip() if len(time_range) > 1 else ""
+
+    # 解析时间
+    start_estimated = start_str.endswith("*")
+    end_estimated = end_str.endswith("*")
+
+    start_str = start_str.rstrip("*").strip()
+    end_str = end_str.rstrip("*").strip()
+
+    try:
+        start_time = datetime.strptime(start_str, LOG_TIME_FORMAT)
+    except ValueError:
+        return None
+
+    if end_str == "无":
+        end_time = None
+    else:
+        try:
+            end_time = datetime.strptime(end_str, LOG_TIME_FORMAT)
+        except ValueError:
+            end_time = None
+
+    if tag == "] [下线]":
+        event = "close"
+    elif end_time is None:
+        event = "open"
+    else:
+        event = "session"
+
+    return {
+        "event": event,
+        "server": server_address,
+        "start": start_time,
+        "end": end_time,
+        "motd": motd_part,
+        "start_estimated": start_estimated,
+        "end_estimated": end_estimated
+    }
+
+class LogSessionParser:
+    """
+    把日志事件配对成会话，可以分多次喂入新追加的日志行
+    未结束的会话保存在 open_sessions 中，之后读到对应的下线事件时原地补全
+    """
+    
+    def __init__(self):
+        self.open_sessions = {}  # (服务器, 开始时间) -> 未结束的会话
+    
+    def feed(self, lines):
+        """
+        解析一批日志行，返回 (新会话列表, 之前批次中返回过、本批被补全结束时间的会话列表)
+        新会话按上线顺序排列，仍在线或未正常结束的会话结束时间为 None
+        """
+        sessions = []
+        closed = []
+        
+        for line in lines:
+            try:
+                entry = parse_log_line(line)
+            except Exception as e:
+                print(f"解析日志行错误: {line}\n错误: {str(e)}")
+                continue
+            if entry is None:
+                continue
+            
+            event = entry.pop("event")
+            key = (entry["server"], entry["start"])
+            if event == "close" and key in self.open_sessions:
+                # 下线事件：补全对应的上线记录
+                session = self.open_sessions.pop(key)
+                session["end"] = entry["end"]
+                session["end_estimated"] = entry["end_estimated"]
+                session["duration"] = (session["end"] - session["start"]).total_seconds()
+                if not session.pop("_new", False):
+                    closed.append(session)
+            else:
+                session = entry
+                session["duration"] = (session["end"] - session["start"]).total_seconds() if session["end"] else 0
+                sessions.append(session)
+                if event == "open":
+                    session["_new"] = True
+                    self.open_sessions[key] = session
+        
+        for session in sessions:
+            session.pop("_new", None)
+        return sessions, closed
+
+def read_log_sessions(lines):
+    """把日志事件配对成会话列表（按上线顺序），仍在线或未正常结束的会话结束时间为 None"""
+    return LogSessionParser().feed(lines)[0]
+
+# 批量解析用的固定格式：时间戳 "YYYY-MM-DD HH:MM:SS" 固定 19 字节
+_LOG_TIME_TEMPLATE = b"0000-00-00 00:00:00"
+_LOG_TIME_WIDTH = len(_LOG_TIME_TEMPLATE)
+_LOG_TAG_OPEN = "] [上线] ".encode("utf-8")
+_LOG_TAG_CLOSE = "] [下线] ".encode("utf-8")
+_LOG_MOTD_PREFIX = b" | MOTD: "
+_LOG_NO_END = "无".encode("utf-8")
+
+@functools.lru_cache(maxsize=None)
+def _byte_pattern(pattern):
+    """字节串对应的 uint8 数组（numpy 按需导入，所以不在模块级创建）"""
+    return np.frombuffer(pattern, dtype=np.uint8)
+
+@functools.lru_cache(maxsize=None)
+def _log_time_columns():
+    """时间戳模板中的 (数字列, 分隔符列)"""
+    template = _byte_pattern(_LOG_TIME_TEMPLATE)
+    return np.flatnonzero(template == ord("0")), np.flatnonzero(template != ord("0"))
+
+# 会话 flags 位
+FLAG_START_ESTIMATED = 1
+FLAG_END_ESTIMATED = 2
+
+def _gather_bytes(buf, positions, width):
+    """取出每行 positions 处的 width 个字节，返回 (行数, width) 的矩阵"""
+    # 滑动窗口视图不复制数据，按行号取出即可，不需要构造二维下标
+    windows = np.lib.stride_tricks.sliding_window_view(buf, width)
+    return windows[np.clip(positions, 0, len(buf) - width)]
+
+def _match_bytes(buf, positions, pattern, valid):
+    """逐行判断 buf[positions:positions+len(pattern)] 是否等于 pattern"""
+    return valid & (_gather_bytes(buf, positions, len(pattern)) == _byte_pattern(pattern)).all(axis=1)
+
+# 定宽字段按 8 字节分块求哈希用的乘数（奇数，固定种子）
+_FIELD_HASH_WIDTH = 256
+
+@functools.lru_cache(maxsize=None)
+def _field_hash_multipliers():
+    return np.random.default_rng(20240628).integers(
+        1, 2 ** 63, size=_FIELD_HASH_WIDTH // 8, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+def _factorize_fields(data, buf, starts, ends):
+    """
+    给每行的 data[starts:ends] 去重编号，返回 (编号数组, 唯一值 bytes 列表)
+    字段不长时补零成定宽矩阵，按 8 字节分块求哈希后编号，再整体核对一遍排除哈希冲突；
+    否则逐行切片编号
+    """
+    lengths = ends - starts
+    width = (int(lengths.max()) + 7) // 8 * 8 if len(lengths) else 0
+    if 0 < width <= min(_FIELD_HASH_WIDTH, len(buf)):
+        chars = _gather_bytes(buf, starts, width)
+        # 靠近末尾的行被 _gather_bytes 截断了位置，单独补齐
+        for row in np.flatnonzero(starts + width > len(buf)).tolist():
+            chars[row] = np.frombuffer(data[starts[row]:ends[row]].ljust(width, b"\0"), dtype=np.uint8)
+        chars[np.arange(width) >= lengths[:, None]] = 0
+        words = chars.view(np.uint64)
+        keys = (words * _field_hash_multipliers()[:words.shape[1]]).sum(axis=1, dtype=np.uint64)
+        keys ^= lengths.astype(np.uint64)
+        codes, unique_keys = pd.factorize(keys)
+        # 每个编号取第一次出现的行作为代表
+        first = np.empty(len(unique_keys), dtype=np.int64)
+        first[codes[::-1]] = np.arange(len(codes) - 1, -1, -1)
+        if (chars == chars[first[codes]]).all():
+            return codes, [data[a:b] for a, b in zip(starts[first].tolist(), ends[first].tolist())]
+    
+    fields = [data[a:b] for a, b in zip(starts.tolist(), ends.tolist())]
+    codes, uniques = pd.factorize(pd.Series(fields, dtype=object))
+    return codes, list(uniques)
+
+def _parse_log_times(buf, positions, valid):
+    """把每行 positions 处的 19 字节按固定格式解析为 datetime64[s]，返回 (时间数组, 是否有效)"""
+    chars = _gather_bytes(buf, positions, _LOG_TIME_WIDTH)
+    digit_columns, separator_columns = _log_time_columns()
+    # uint8 减法溢出后非数字字符都 >= 10
+    layout_ok = ((chars[:, digit_columns] - 48) < 10).all(axis=1)
+    layout_ok &= (chars[:, separator_columns] == _byte_pattern(_LOG_TIME_TEMPLATE)[separator_columns]).all(axis=1)
+    valid = valid & layout_ok
+    
+    chars[~valid] = np.frombuffer(b"1970-01-01 00:00:00", dtype=np.uint8)
+    strings = chars.view(f"S{_LOG_TIME_WIDTH}").ravel()
+    try:
+        chars[:, 10] = ord("T")  # numpy 按 ISO 格式直接转换
+        times = strings.astype("datetime64[s]")
+    except ValueError:
+        # 有超出范围的日期（如 13 月），逐个按固定格式解析
+        chars[:, 10] = ord(" ")
+        times = pd.to_datetime(strings.astype("U"), format=LOG_TIME_FORMAT, errors="coerce").values.astype("datetime64[s]")
+        valid &= ~np.isnat(times)
+    times[~valid] = np.datetime64("NaT")
+    return times, valid
+
+def parse_log_columns(data: bytes):
+    """
+    批量解析日志内容，返回与 read_log_sessions 相同的会话（按上线顺序），但为列式数组:
+    {"server": 服务器地址, "start"/"end": datetime64[s]（未结束为 NaT）, "flags": 估计标记位, "motd": MOTD}
+    格式规整的行用 numpy 按固定偏移一次性切出各字段，少数不规整的行交给 parse_log_line
+    """
+    if not data:
+        return {
+            "server": np.array([], dtype=object),
+            "start": np.array([], dtype="datetime64[s]"),
+            "end": np.array([], dtype="datetime64[s]"),
+            "flags": np.array([], dtype=np.uint8),
+            "motd": np.array([], dtype=object),
+        }
+    
+    # 内容很短时末尾补零，按固定偏移取字段时不会越界
+    buf = np.frombuffer(data if len(data) >= 64 else data + b"\0" * 64, dtype=np.uint8)
+    line_end = np.flatnonzero(buf == 10)
+    if data[-1:] != b"\n":
+        line_end = np.append(line_end, len(data))
+    line_start = np.concatenate(([0], line_end[:-1] + 1)).astype(np.int64)
+    line_end = line_end.astype(np.int64)
+    # 去掉行尾的 \r（Windows 文本模式写入）
+    if len(line_end):
+        line_end = line_end - (buf[np.maximum(line_end - 1, 0)] == 13)
+    
+    # 每行第一个 " ~ " 把开始和结束时间分开
+    tildes = np.flatnonzero(buf[1:-1] == 126)  # 先找 "~"，再检查两侧的空格
+    tildes = tildes[(buf[tildes] == 32) & (buf[tildes + 2] == 32)]
+    tilde_index = np.searchsorted(tildes, line_start)
+    valid = tilde_index < len(tildes)
+    tilde = tildes[np.minimum(tilde_index, len(tildes) - 1)] if len(tildes) else np.zeros_like(line_start)
+    valid &= (tilde < line_end) & (tilde >= line_start + 1 + len(_LOG_TAG_OPEN) + _LOG_TIME_WIDTH)
+    
+    # 开始时间: "] [上线] " 之后 19 字节，后面可能有 "*"
+    start_estimated = valid & (buf[np.maximum(tilde - 1, 0)] == ord("*"))
+    start_pos = tilde - _LOG_TIME_WIDTH - start_estimated
+    tag_pos = start_pos - len(_LOG_TAG_OPEN)
+    valid &= buf[line_start] == ord("[")
+    is_close = _match_bytes(buf, tag_pos, _LOG_TAG_CLOSE, valid)
+    valid &= is_close | _match_bytes(buf, tag_pos, _LOG_TAG_OPEN, valid)
+    start, valid = _parse_log_times(buf, start_pos, valid)
+    
+    # 结束时间: 19 字节（可能有 "*"）或 "无"
+    end_pos = tilde + 3
+    no_end = _match_bytes(buf, end_pos, _LOG_NO_END, valid)
+    end, has_end = _parse_log_times(buf, end_pos, valid & ~no_end)
+    end_estimated = has_end & (buf[np.minimum(end_pos + _LOG_TIME_WIDTH, len(buf) - 1)] == ord("*"))
+    motd_pos = np.where(no_end, end_pos + len(_LOG_NO_END), end_pos + _LOG_TIME_WIDTH + end_estimated)
+    valid &= (no_end | has_end) & _match_bytes(buf, motd_pos, _LOG_MOTD_PREFIX, valid)
+    valid &= ~(is_close & no_end)
+    motd_pos = motd_pos + len(_LOG_MOTD_PREFIX)
+    
+    # 变长字段先去重编号，只对唯一值解码和清理
+    rows = np.flatnonzero(valid)
+    server_codes, server_raw = _factorize_fields(data, buf, line_start[rows] + 1, tag_pos[rows])
+    motd_codes, motd_raw = _factorize_fields(data, buf, motd_pos[rows], line_end[rows])
+    
+    # 不规整的行（前后空格、缺少 MOTD 等）按原来的方式逐行解析
+    irregular = np.flatnonzero(~valid & (line_end > line_start))
+    extra = []
+    for row in irregular.tolist():
+        line = data[line_start[row]:line_end[row]].decode("utf-8", errors="replace")
+        try:
+            entry = parse_log_line(line)
+        except Exception as e:
+            print(f"解析日志行错误: {line}\n错误: {str(e)}")
+            continue
+        if entry is not None:
+            extra.append((row, entry))
+    
+    if extra:
+        extra_rows = np.array([row for row, _ in extra], dtype=np.int64)
+        rows = np.concatenate((rows, extra_rows))
+        # 已清理的 MOTD 用 str 作为键，区别于待清理的 bytes
+        server_index = {name: code for code, name in enumerate(server_raw)}
+        motd_index = {name: code for code, name in enumerate(motd_raw)}
+        server_codes = np.concatenate((server_codes, [
+            server_index.setdefault(entry["server"].encode("utf-8"), len(server_index)) for _, entry in extra
+        ])).astype(np.int64)
+        motd_codes = np.concatenate((motd_codes, [
+            motd_index.setdefault(entry["motd"], len(motd_index)) for _, entry in extra
+        ])).astype(np.int64)
+        server_raw = list(server_index)
+        motd_raw = list(motd_index)
+        start = start.copy()
+        end = end.copy()
+        start[extra_rows] = [np.datetime64(entry["start"], "s") for _, entry in extra]
+        end[extra_rows] = [np.datetime64(entry["end"], "s") if entry["end"] else np.datetime64("NaT") for _, entry in extra]
+        start_estimated[extra_rows] = [entry["start_estimated"] for _, entry in extra]
+        end_estimated[extra_rows] = [entry["end_estimated"] for _, entry in extra]
+        is_close[extra_rows] = [entry["event"] == "close" for _, entry in extra]
+    
+    server_names = np.array([name.decode("utf-8", errors="replace") for name in server_raw], dtype=object)
+    motd_names = []
+    for raw in motd_raw:
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8", errors="replace").split("|")[0].replace("MOTD:", "").strip()
+        motd_names.append(raw)
+    motd_names = np.array(motd_names, dtype=object)
+    
+    events = pd.DataFrame({
+        "line": rows,
+        "server": server_codes,
+        "start": start[rows],
+        "end": end[rows],
+        "start_estimated": start_estimated[rows],
+        "end_estimated": end_estimated[rows],
+        "close": is_close[rows],
+        "motd": motd_codes,
+    }).sort_values("line", kind="stable")
+    
+    # 配对（与 LogSessionParser 逐行处理一致）：同一 (服务器, 开始时间) 的下线事件补全它与上一个下线事件之间
+    # 最后一次上线，之间没有上线的下线事件单独作为完整会话。按之前出现过的下线事件数给事件分段，同段内配对
+    is_close = events["close"].to_numpy()
+    is_open = ~is_close & events["end"].isna().to_numpy()
+    events["segment"] = events.groupby(["server", "start"], sort=False)["close"].cumsum().to_numpy() - is_close
+    opens = events[is_open].drop_duplicates(["server", "start", "segment"], keep="last")
+    closes = events[is_close]
+    pairs = opens.reset_index().merge(
+        closes[["server", "start", "segment", "line", "end", "end_estimated"]],
+        on=["server", "start", "segment"], suffixes=("", "_close")
+    )
+    
+    events.loc[pairs["index"].to_numpy(), "end"] = pairs["end_close"].to_numpy()
+    events.loc[pairs["index"].to_numpy(), "end_estimated"] = pairs["end_estimated_close"].to_numpy()
+    sessions = events[~events["line"].isin(pairs["line_close"])]
+    
+    flags = (sessions["start_estimated"].to_numpy().astype(np.uint8) * FLAG_START_ESTIMATED
+             | sessions["end_estimated"].to_numpy().astype(np.uint8) * FLAG_END_ESTIMATED)
+    return {
+        "server": server_names[sessions["server"].to_numpy()],
+        "start": sessions["start"].to_numpy().astype("datetime64[s]"),
+        "end": sessions["end"].to_numpy().astype("datetime64[s]"),
+        "flags": flags,
+        "motd": motd_names[sessions["motd"].to_numpy()],
+    }
+
+class SessionTable:
+    """
+    列式会话表（文本日志模式下日历使用的内存数据）
+    开始/结束时间为 epoch 秒（与日志一样按本地时间计，未结束为 NO_END），服务器和 MOTD 存为字符串表中的编号，
+    两个估计标记合并为 flags 位。行按开始时间排序，按日期查询时二分查找，需要显示时才生成会话字典
+    """
+    NO_END = -1
+    EPOCH = datetime(1970, 1, 1)
+    
+    def __init__(self):
+        print('SessionTable__init__ 列式会话表')
+        self.start = np.empty(0, dtype=np.int64)
+        self.end = np.empty(0, dtype=np.int64)
+        self.server = np.empty(0, dtype=np.int32)
+        self.motd = np.empty(0, dtype=np.int32)
+        self.flags = np.empty(0, dtype=np.uint8)
+        self.server_names = []  # 编号 -> 服务器地址
+        self.server_ids = {}
+        self.motd_names = []  # 编号 -> MOTD
+        self.motd_ids = {}
+        self.max_span = 0  # 最长已结束会话的时长（秒），给查询的开始时间加下界
+        self.open_rows = {}  # (服务器编号, 开始时间) -> 未结束会话所在的行
+    
+    def __len__(self):
+        return len(self.start)
+    
+    @classmethod
+    def to_epoch(cls, value: datetime) -> int:
+        return int((value - cls.EPOCH).total_seconds())
+    
+    @classmethod
+    def from_epoch(cls, seconds: int) -> datetime:
+        return cls.EPOCH + timedelta(seconds=seconds)
+    
+    @staticmethod
+    def _intern(value, names, ids):
+        code = ids.get(value)
+        if code is None:
+            code = ids[value] = len(names)
+            names.append(value)
+        return code
+    
+    def _intern_array(self, values, names, ids):
+        """把字符串数组转换为字符串表中的编号"""
+        codes, uniques = pd.factorize(values)
+        mapping = np.array([self._intern(value, names, ids) for value in uniques], dtype=np.int32)
+        return mapping[codes] if len(codes) else np.empty(0, dtype=np.int32)
+    
+    def append_columns(self, columns):
+        """追加 parse_log_columns 解析出的会话"""
+        end = columns["end"].astype(np.int64)
+        end[np.isnat(columns["end"])] = self.NO_END
+        self._append(
+            columns["start"].astype(np.int64),
+            end,
+            self._intern_array(columns["server"], self.server_names, self.server_ids),
+            self._intern_array(columns["motd"], self.motd_names, self.motd_ids),
+            columns["flags"].astype(np.uint8)
+        )
+    
+    def append_sessions(self, sessions):
+        """追加会话字典（增量解析的结果）"""
+        if not sessions:
+            return
+        self._append(
+            np.array([self.to_epoch(session["start"]) for session in sessions], dtype=np.int64),
+            np.array([self.to_epoch(session["end"]) if session["end"] else self.NO_END for session in sessions], dtype=np.int64),
+            np.array([self._intern(session["server"], self.server_names, self.server_ids) for session in sessions], dtype=np.int32),
+            np.array([self._intern(session["motd"], self.motd_names, self.motd_ids) for session in sessions], dtype=np.int32),
+            np.array([FLAG_START_ESTIMATED * session["start_estimated"] | FLAG_END_ESTIMATED * session["end_estimated"]
+                      for session in sessions], dtype=np.uint8)
+        )
+    
+    def _append(self, start, end, server, motd, flags):
+        offset = len(self.start)
+        self.start = np.concatenate((self.start, start))
+        self.end = np.concatenate((self.end, end))
+        self.server = np.concatenate((self.server, server))
+        self.motd = np.concatenate((self.motd, motd))
+        self.flags = np.concatenate((self.flags, flags))
+        
+        closed = end != self.NO_END
+        if closed.any():
+            self.max_span = max(self.max_span, int((end[closed] - start[closed]).max()))
+        
+        if (np.diff(self.start[max(offset - 1, 0):]) < 0).any():
+            # 新追加的会话开始时间早于已有的（很少见），整体重新排序，相同开始时间保持日志中的顺序
+            order = np.argsort(self.start, kind="stable")
+            for name in ("start", "end", "server", "motd", "flags"):
+                setattr(self, name, getattr(self, name)[order])
+            self.open_rows = {}
+            offset = 0
+        for row in np.flatnonzero(self.end[offset:] == self.NO_END).tolist():
+            row += offset
+            self.open_rows[(int(self.server[row]), int(self.start[row]))] = row
+    
+    def close(self, server, start: datetime, end: datetime, end_estimated: bool = False) -> bool:
+        """补全一个未结束会话的结束时间，找不到对应会话时返回 False"""
+        key = (self.server_ids.get(server), self.to_epoch(start))
+        row = self.open_rows.pop(key, None)
+        if row is None:
+            return False
+        self.end[row] = self.to_epoch(end)
+        if end_estimated:
+            self.flags[row] |= FLAG_END_ESTIMATED
+        self.max_span = max(self.max_span, int(self.end[row] - self.start[row]))
+        return True
+    
+    def session(self, row: int) -> dict:
+        """生成第 row 行的会话字典"""
+        start_time = self.from_epoch(int(self.start[row]))
+        end_time = self.from_epoch(int(self.end[row])) if self.end[row] != self.NO_END else None
+        flags = int(self.flags[row])
+        return {
+            "server": self.server_names[self.server[row]],
+            "start": start_time,
+            "end": end_time,
+            "motd": self.motd_names[self.motd[row]],
+            "start_estimated": bool(flags & FLAG_START_ESTIMATED),
+            "end_estimated": bool(flags & FLAG_END_ESTIMATED),
+            "duration": (end_time - start_time).total_seconds() if end_time else 0
+        }
+    
+    def open_sessions(self):
+        """所有未结束的会话字典"""
+        return [self.session(row) for row in sorted(self.open_rows.values())]
+    
+    def rows_between(self, start: int, end: int, server_id=None):
+        """
+        与 [start, end) 有重叠的行号（epoch 秒），未结束的会话只算开始时间
+        行按开始时间排序，已结束会话的开始时间不早于 start - max_span，两端都用二分查找确定
+        """
+        low = np.searchsorted(self.start, start - self.max_span, side="left")
+        high = np.searchsorted(self.start, end, side="left")
+        starts = self.start[low:high]
+        ends = self.end[low:high]
+        mask = (ends >= start) | ((ends == self.NO_END) & (starts >= start))
+        if server_id is not None:
+            mask &= self.server[low:high] == server_id
+        return low + np.flatnonzero(mask)
+    
+    def sessions_between(self, start: datetime, end: datetime, server=None):
+        """查询与 [start, end) 有重叠的会话字典（按开始时间排序），接口与 SessionStore 相同"""
+        server_id = None
+        if server is not None:
+            server_id = self.server_ids.get(server)
+            if server_id is None:
+                return []
+        rows = self.rows_between(self.to_epoch(start), self.to_epoch(end), server_id)
+        return [self.session(row) for row in rows.tolist()]
+    
+    def subset(self, start: int, end: int, server=None):
+        """
+        与 [start, end) 有重叠的会话组成的新表（epoch 秒，数组和字符串表都是副本），
+        可以交给后台线程查询，不受界面线程之后追加或补全会话的影响
+        """
+        table = SessionTable()
+        server_id = None
+        if server is not None:
+            server_id = self.server_ids.get(server)
+            if server_id is None:
+                return table
+        rows = self.rows_between(start, end, server_id)
+        for name in ("start", "end", "server", "motd", "flags"):
+            setattr(table, name, getattr(self, name)[rows])
+        table.server_names = list(self.server_names)
+        table.server_ids = dict(self.server_ids)
+        table.motd_names = list(self.motd_names)
+        table.motd_ids = dict(self.motd_ids)
+        table.max_span = self.max_span
+        return table
+    
+    def servers(self):
+        """所有出现过的服务器地址"""
+        return list(self.server_names)
+    
+    def first_date(self):
+        """最早会话的日期，没有数据时返回 None"""
+        return self.from_epoch(int(self.start[0])).date() if len(self.start) else None
+    
+    def stats(self):
+        """返回 (有记录的天数, 会话数, 服务器数)，跨天的会话计入覆盖的每一天"""
+        start_day = self.start // 86400
+        end_day = np.where(self.end == self.NO_END, start_day, self.end // 86400)
+        counts = end_day - start_day + 1
+        # 展开每个会话覆盖的所有日期
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        days = np.repeat(start_day, counts) + offsets
+        return len(np.unique(days)), len(self.start), len(self.server_names)
+
+
+def add_sessions_by_day(log_data: dict, sessions):
+    """把会话按覆盖的日期加入 {日期: 会话列表}，没有结束时间的会话只计入开始当天"""
+    for session in sessions:
+        start_time = session["start"]
+        end_time = session["end"]
+        
+        current_date = start_time.date()
+        while end_time is None or current_date <= end_time.date():
+            if current_date not in log_data:
+                log_data[current_date] = []
+            
+            log_data[current_date].append(session)
+            current_date += timedelta(days=1)
+            
+            # 如果到达结束日期或没有结束时间（只处理一天）
+            if end_time is None or current_date > end_time.date():
+                break
+
+def motd_durations_between(sessions, start_date, end_date):
+    """
+    按 MOTD 统计会话在 [start_date, end_date] 内的在线秒数，返回 {MOTD: 秒数}
+    与 add_sessions_by_day 的规则相同：没有结束时间的会话只计入开始当天（到现在为止）
+    """
+    range_start = datetime.combine(start_date, datetime.min.time())
+    range_end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    now = datetime.now()
+    durations = defaultdict(float)
+    for session in sessions:
+        if session["end"] is None:
+            if not range_start <= session["start"] < range_end:
+                continue
+            day_end = datetime.combine(session["start"].date() + timedelta(days=1), datetime.min.time())
+            seconds = (min(now, day_end) - session["start"]).total_seconds()
+        else:
+            seconds = (min(session["end"], range_end) - max(session["start"], range_start)).total_seconds()
+        durations[session["motd"]] += max(seconds, 0)
+    return dict(durations)
+
+def read_log_tail(log_file, position):
+    """
+    读取 position 之后追加的完整日志行，返回 (字节内容, 是否从头读取, 新的 position)
+    position 记录已读取的字节偏移和文件标识（inode/大小/修改时间），以及偏移前的一小段内容；
+    为 None 或文件被截断、替换、改写时从头读取
+    """
+    stat = os.stat(log_file)
+    full = (
+        position is None
+        or stat.st_ino != position["inode"]
+        or stat.st_size < position["offset"]
+    )
+    if not full and stat.st_size == position["size"] and stat.st_mtime_ns == position["mtime"]:
+        return b"", False, position  # 没有变化
+    
+    with open(log_file, "rb") as f:
+        if not full and position["offset"]:
+            # 偏移前的内容变了说明文件被改写，需要重新解析
+            fingerprint_start = max(0, position["offset"] - len(position["fingerprint"]))
+            f.seek(fingerprint_start)
+            if f.read(position["offset"] - fingerprint_start) != position["fingerprint"]:
+                full = True
+        offset = 0 if full else position["offset"]
+        f.seek(offset)
+        data = f.read()
+    
+    # 只消费完整的行，末尾未写完的半行留到下次
+    data = data[:data.rfind(b"\n") + 1]
+    offset += len(data)
+    fingerprint = data[-64:] if full else (position["fingerprint"] + data)[-64:]
+    
+    position = {
+        "inode": stat.st_ino,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "offset": offset,
+        "fingerprint": fingerprint
+    }
+    return data, full, position
+
+# 日志行中的服务器、开始时间和结束时间（结束时间为"无"时不匹配第二个时间）
+_LOG_EVENT_PATTERN = re.compile(
+    r"^\[(.+?)\] \[(?:上线|下线)\] (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\*? ~ (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})?".encode("utf-8")
+)
+
+class LogArchive:
+    """
+    按月归档的日志分段
+    活动日志只保留当月的事件，之前月份的行按事件时间压缩追加到 <日志名>.<YYYY-MM>.log.gz；
+    分段索引 <日志名>.segments.json 记录每个分段覆盖的时间范围（行中最早的开始时间到最晚的事件时间）和服务器。
+    下线行带有开始时间，所以与查询范围重叠的会话，其上线和下线事件所在的分段都会被选中。
+    轮转先在分段索引中记录 pending（轮转前的分段、各分段文件追加前的大小、活动日志的标识），
+    活动日志替换完成后才清除；替换之前中断时按 pending 只读取分段文件追加前的部分，下次轮转时截回原来的大小再重新归档
+    """
+    replace_lock = threading.Lock()  # 替换活动日志与按字节偏移读取活动日志（LogIndex.sessions_on）互斥
+    
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self.base = os.path.splitext(log_file)[0]
+        self.index_file = self.base + ".segments.json"
+        self.segments, self.pending = self._load_index()
+        self.limits = {}  # 分段文件名 -> 只读取的字节数（未完成的轮转追加的部分不算）
+        if self.pending is not None and not self._committed(self.pending):
+            self.segments = self.pending["segments"]
+            self.limits = self.pending["files"]
+    
+    def _load_index(self):
+        if not os.path.exists(self.index_file):
+            return [], None
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            return saved["segments"], saved.get("pending")
+        except Exception as e:
+            print(f"读取日志分段索引错误: {str(e)}")
+            return [], None
+    
+    def _save_index(self, pending=None):
+        saved = {"segments": self.segments}
+        if pending is not None:
+            saved["pending"] = pending
+        temp_file = self.index_file + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(saved, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.index_file)
+    
+    def _committed(self, pending):
+        """pending 记录的轮转是否已经替换了活动日志（活动日志的 inode 或第一行变了）"""
+        try:
+            stat = os.stat(self.log_file)
+            with open(self.log_file, "rb") as f:
+                first_line = f.readline()
+        except OSError:
+            return True  # 活动日志不存在，不回滚（回滚会截掉已经不在活动日志里的行）
+        return stat.st_ino != pending["inode"] or first_line != pending["first_line"].encode("latin-1")
+    
+    def _recover(self):
+        """处理上次中断的轮转：没有替换活动日志时把分段文件截回追加前的大小，然后清除 pending"""
+        if self.pending is None:
+            return
+        if not self._committed(self.pending):
+            print('_recover 回滚未完成的日志轮转')
+            for name, size in self.pending["files"].items():
+                path = os.path.join(os.path.dirname(self.log_file), name)
+                if not os.path.exists(path):
+                    continue
+                if size:
+                    with open(path, "r+b") as f:
+                        f.truncate(size)
+                else:
+                    os.remove(path)
+            self.segments = self.pending["segments"]
+        self.pending = None
+        self.limits = {}
+        self._save_index()
+    
+    def segment_path(self, segment):
+        return os.path.join(os.path.dirname(self.log_file), segment["file"])
+    
+    def segments_between(self, start: datetime = None, end: datetime = None, server=None):
+        """与 [start, end) 有重叠的分段（按月份排序），start/end 为 None 时不限"""
+        start_str = start.strftime(LOG_TIME_FORMAT) if start else None
+        end_str = end.strftime(LOG_TIME_FORMAT) if end else None
+        return [
+            segment for segment in self.segments
+            if (start_str is None or segment["end"] >= start_str)
+            and (end_str is None or segment["start"] < end_str)
+            and (server is None or server in segment["servers"])
+        ]
+    
+    def read(self, start: datetime = None, end: datetime = None):
+        """读取与时间范围重叠的分段（解压后按月份顺序拼接的原始日志内容）"""
+        data = []
+        for segment in self.segments_between(start, end):
+            limit = self.limits.get(segment["file"])
+            if limit is None:
+                with gzip.open(self.segment_path(segment), "rb") as f:
+                    data.append(f.read())
+            else:
+                # 未完成的轮转之前的部分（gzip 成员完整，可以单独解压）
+                with open(self.segment_path(segment), "rb") as f:
+                    data.append(gzip.decompress(f.read(limit)))
+        return b"".join(data)
+    
+    def first_date(self):
+        """最早归档的日期，没有归档时返回 None"""
+        if not self.segments:
+            return None
+        return datetime.strptime(min(segment["start"] for segment in self.segments), LOG_TIME_FORMAT).date()
+    
+    def servers(self):
+        """归档中出现过的服务器地址"""
+        return {server for segment in self.segments for server in segment["servers"]}
+    
+    def rotate(self, month: str = None):
+        """
+        把活动日志中早于 month（"YYYY-MM"，默认当前月份）的行按月份压缩归档，活动日志只保留剩余的行，
+        返回归档的行数。调用方需要先关闭活动日志的写入句柄；上次中断的轮转先回滚，可以重复执行
+        """
+        month = month or datetime.now().strftime("%Y-%m")
+        self._recover()
+        if not os.path.exists(self.log_file):
+            return 0
+        inode = os.stat(self.log_file).st_ino
+        with open(self.log_file, "rb") as f:
+            match = _LOG_EVENT_PATTERN.match(f.readline())
+            if match and (match.group(3) or match.group(2))[:7].decode() >= month:
+                return 0  # 第一行已是当月（日志按时间追加），没有需要归档的内容
+            f.seek(0)
+            lines = f.read().splitlines(keepends=True)
+        
+        # 按事件时间（下线为结束时间，上线为开始时间）分月，无法解析的行跟随上一行
+        chunks = OrderedDict()
+        remaining = []
+        line_month = None
+        for line in lines:
+            match = _LOG_EVENT_PATTERN.match(line)
+            if match:
+                line_month = (match.group(3) or match.group(2))[:7].decode()
+            if line_month is None or line_month >= month:
+                remaining.append(line)
+            else:
+                chunks.setdefault(line_month, []).append((line, match))
+        if not chunks:
+            return 0
+        
+        print('rotate 归档之前月份的日志')
+        # 先记录轮转前的状态，分段文件追加和活动日志替换之间中断时据此回滚
+        pending = {
+            "inode": inode,
+            "first_line": lines[0].decode("latin-1"),
+            "segments": json.loads(json.dumps(self.segments)),
+            "files": {}
+        }
+        for chunk_month in chunks:
+            name = os.path.basename(f"{self.base}.{chunk_month}.log.gz")
+            path = os.path.join(os.path.dirname(self.log_file), name)
+            pending["files"][name] = os.path.getsize(path) if os.path.exists(path) else 0
+        self._save_index(pending)
+        
+        archived = 0
+        segments = {segment["month"]: segment for segment in self.segments}
+        for chunk_month, chunk in chunks.items():
+            segment = segments.get(chunk_month)
+            if segment is None:
+                segment = segments[chunk_month] = {
+                    "month": chunk_month,
+                    "file": os.path.basename(f"{self.base}.{chunk_month}.log.gz"),
+                    "start": "9999", "end": "", "servers": [], "lines": 0
+                }
+            servers = set(segment["servers"])
+            for line, match in chunk:
+                if match:
+                    servers.add(match.group(1).decode("utf-8", errors="replace"))
+                    segment["start"] = min(segment["start"], match.group(2).decode())
+                    segment["end"] = max(segment["end"], (match.group(3) or match.group(2)).decode())
+            # gzip 支持多个成员首尾相接，同一月份再次归档时直接追加
+            with open(self.segment_path(segment), "ab") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="ab") as f:
+                    f.write(b"".join(line for line, _ in chunk))
+                raw.flush()
+                os.fsync(raw.fileno())
+            segment["servers"] = sorted(servers)
+            segment["lines"] += len(chunk)
+            segment["size"] = os.path.getsize(self.segment_path(segment))
+            archived += len(chunk)
+        self.segments = sorted(segments.values(), key=lambda segment: segment["month"])
+        self._save_index(pending)
+        
+        # 索引和归档写完之后再替换活动日志，替换完成才清除 pending
+        temp_file = self.log_file + ".tmp"
+        with open(temp_file, "wb") as f:
+            f.write(b"".join(remaining))
+            f.flush()
+            os.fsync(f.fileno())
+        with self.replace_lock:
+            os.replace(temp_file, self.log_file)
+        self._save_index()
+        print(f"已归档 {archived} 行日志到 {len(chunks)} 个分段")
+        return archived
+
+class UptimeRollup:
+    """
+    每服务器每天的在线汇总 {天: {服务器: [在线秒数, 会话数]}}，另有所有服务器的每日合计
+    从日志尾部增量累加已结束的会话（加载后写入线程每写一批就追上一次），未结束的会话单独记录，
+    查询时按当前时间计入开始当天。汇总和已读取的日志位置保存在日志旁的 .rollup.json，
+    启动时只需读取保存之后追加的日志；日志被替换或改写时连同归档分段从头重新计算
+    """
+    SAVE_INTERVAL = 60  # 写入线程保存汇总文件的最短间隔（秒）
+    LINE_LIMIT = 64 * 1024  # 新追加的内容不超过这么多字节时逐行累加，不经过批量解析器
+    _last_version = 0  # 所有汇总实例共用的数据版本计数，重新打开的汇总不会与旧版本号重复
+    
+    def __init__(self, log_file):
+        print('UptimeRollup__init__ 在线时长汇总')
+        self.log_file = log_file
+        self.rollup_file = os.path.splitext(log_file)[0] + ".rollup.json"
+        self.lock = threading.Lock()
+        self.version = 0  # 数据版本，汇总内容每次变化时更新（图表缓存据此失效）
+        self._reset()
+        self._dirty = False
+        self._last_save = time.monotonic()
+    
+    def _bump_version(self):
+        UptimeRollup._last_version += 1
+        self.version = UptimeRollup._last_version
+    
+    def _reset(self):
+        self._bump_version()
+        self.days = {}  # 天（epoch 天数） -> {服务器: [在线秒数, 会话数]}
+        self.totals = {}  # 天 -> [所有服务器在线秒数, 会话数]
+        self.open_sessions = {}  # (服务器, 开始时间 epoch 秒) -> None，未结束的会话
+        self.position = None  # 已汇总到的日志位置，见 read_log_tail
+    
+    @classmethod
+    def load(cls, log_file):
+        """读取保存的汇总文件（不存在或损坏时从空开始），并追上日志中新追加的内容"""
+        rollup = cls(log_file)
+        try:
+            if os.path.exists(rollup.rollup_file):
+                with open(rollup.rollup_file, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                rollup.days = {int(day): servers for day, servers in saved["days"].items()}
+                for day, servers in rollup.days.items():
+                    rollup.totals[day] = [sum(item[0] for item in servers.values()),
+                                          sum(item[1] for item in servers.values())]
+                rollup.open_sessions = {(server, start): None for server, start in saved["open"]}
+                position = saved["position"]
+                position["fingerprint"] = position["fingerprint"].encode("latin-1")
+                rollup.position = position
+        except Exception as e:
+            print(f"读取在线时长汇总错误，将重新计算: {str(e)}")
+            rollup._reset()
+        rollup.catch_up()
+        return rollup
+    
+    def save(self, force=False):
+        """
+        保存汇总文件（先写临时文件再替换），没有变化或距上次保存不足 SAVE_INTERVAL 时跳过；
+        不是 force 时如果其他线程正在汇总也跳过
+        """
+        if not self.lock.acquire(force):
+            return
+        try:
+            if not self._dirty or self.position is None:
+                return
+            if not force and time.monotonic() - self._last_save < self.SAVE_INTERVAL:
+                return
+            position = dict(self.position, fingerprint=self.position["fingerprint"].decode("latin-1"))
+            saved = json.dumps({
+                "position": position,
+                "days": self.days,
+                "open": list(self.open_sessions)
+            }, ensure_ascii=False, separators=(",", ":"))
+            self._dirty = False
+            self._last_save = time.monotonic()
+        finally:
+            self.lock.release()
+        try:
+            temp_file = self.rollup_file + ".tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                f.write(saved)
+            os.replace(temp_file, self.rollup_file)
+        except Exception as e:
+            print(f"保存在线时长汇总错误: {str(e)}")
+    
+    def catch_up(self, blocking=True):
+        """
+        汇总日志中上次之后追加的会话
+        blocking 为 False 时如果其他线程正在汇总（如首次加载）则直接返回，之后的调用会一并追上
+        """
+        if not os.path.exists(self.log_file):
+            return
+        if not self.lock.acquire(blocking):
+            return
+        try:
+            data, full, position = read_log_tail(self.log_file, self.position)
+            if full:
+                self._reset()
+                data = LogArchive(self.log_file).read() + data
+            self.position = position
+            if data:
+                if not full and len(data) <= self.LINE_LIMIT:
+                    self._add_lines(data)  # 写入线程每批只追加几行
+                else:
+                    self._add_columns(parse_log_columns(data))
+                self._dirty = True
+        finally:
+            self.lock.release()
+    
+    def rebase(self):
+        """日志轮转之后从轮转后的活动日志末尾继续（轮转前已经追上，剩余的行都已汇总）"""
+        with self.lock:
+            _, _, self.position = read_log_tail(self.log_file, None)
+            self._dirty = True
+    
+    def _add_session(self, server, start, end):
+        """累加一个已结束的会话（epoch 秒），按覆盖的日期拆开，结束当天也算"""
+        end = max(end, start)
+        for day in range(start // 86400, end // 86400 + 1):
+            seconds = min(end, (day + 1) * 86400) - max(start, day * 86400)
+            item = self.days.setdefault(day, {}).setdefault(server, [0, 0])
+            item[0] += seconds
+            item[1] += 1
+            total = self.totals.setdefault(day, [0, 0])
+            total[0] += seconds
+            total[1] += 1
+    
+    def _add_lines(self, data):
+        """逐行累加少量新追加的日志，结果与 _add_columns 相同（不需要 numpy/pandas）"""
+        changed = False
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            try:
+                entry = parse_log_line(line)
+            except Exception:
+                continue
+            if entry is None:
+                continue
+            changed = True
+            start = SessionTable.to_epoch(entry["start"])
+            if entry["end"] is None:
+                self.open_sessions[(entry["server"], start)] = None
+            else:
+                self.open_sessions.pop((entry["server"], start), None)
+                self._add_session(entry["server"], start, SessionTable.to_epoch(entry["end"]))
+        if changed:
+            self._bump_version()
+    
+    def _add_columns(self, columns):
+        """累加 parse_log_columns 解析出的会话；日志尾部的下线事件可能对应之前记录的未结束会话"""
+        start = columns["start"].astype(np.int64)
+        closed = ~np.isnat(columns["end"])
+        servers = columns["server"]
+        if len(start):
+            self._bump_version()
+        
+        # 按行的顺序更新（同一键可能先结束又重新上线），最后一行决定是否仍未结束
+        for server, start_time, is_closed in zip(servers.tolist(), start.tolist(), closed.tolist()):
+            if is_closed:
+                self.open_sessions.pop((server, start_time), None)
+            else:
+                self.open_sessions[(server, start_time)] = None
+        
+        start = start[closed]
+        end = np.maximum(columns["end"][closed].astype(np.int64), start)
+        servers = servers[closed]
+        if not len(start):
+            return
+        
+        # 把会话按覆盖的日期拆开（与 add_sessions_by_day 一致，结束当天也算），再按 (服务器, 天) 合计
+        start_day = start // 86400
+        counts = end // 86400 - start_day + 1
+        rows = np.repeat(np.arange(len(start)), counts)
+        days = start_day[rows] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        seconds = np.minimum(end[rows], (days + 1) * 86400) - np.maximum(start[rows], days * 86400)
+        grouped = pd.DataFrame({"server": servers[rows], "day": days, "seconds": seconds}).groupby(
+            ["day", "server"], sort=False)["seconds"].agg(["sum", "size"])
+        
+        for (day, server), day_seconds, day_count in zip(
+                grouped.index.tolist(), grouped["sum"].tolist(), grouped["size"].tolist()):
+            item = self.days.setdefault(day, {}).setdefault(server, [0, 0])
+            item[0] += day_seconds
+            item[1] += day_count
+            total = self.totals.setdefault(day, [0, 0])
+            total[0] += day_seconds
+            total[1] += day_count
+    
+    def daily_totals(self, start_date, end_date, server=None, now=None):
+        """
+        返回 {日期: (在线秒数, 会话数)}，只包含 [start_date, end_date] 中有会话的日期；
+        server 为 None 时为所有服务器合计。未结束的会话计入开始当天，到 now（默认当前时间）为止
+        """
+        now = now or datetime.now()
+        first = SessionTable.to_epoch(datetime.combine(start_date, datetime.min.time())) // 86400
+        last = SessionTable.to_epoch(datetime.combine(end_date, datetime.min.time())) // 86400
+        result = {}
+        with self.lock:
+            # 范围比已汇总的天数少时（如日历的一页）按天直接查找，否则遍历全部
+            if last - first < len(self.days):
+                days = ((day, self.days.get(day)) for day in range(first, last + 1))
+            else:
+                days = self.days.items()
+            for day, servers in days:
+                if servers is not None and first <= day <= last:
+                    item = self.totals[day] if server is None else servers.get(server)
+                    if item:
+                        result[day] = list(item)
+            open_sessions = list(self.open_sessions)
+        
+        now_seconds = SessionTable.to_epoch(now)
+        for session_server, start in open_sessions:
+            day = start // 86400
+            if (server is None or session_server == server) and first <= day <= last:
+                item = result.setdefault(day, [0, 0])
+                item[0] += max(0, min(now_seconds, (day + 1) * 86400) - start)
+                item[1] += 1
+        
+        epoch_date = SessionTable.EPOCH.date()
+        return {epoch_date + timedelta(days=day): (seconds, count) for day, (seconds, count) in result.items()}
+
+class LogIndex:
+    """
+    活动日志的旁路字节偏移索引 <日志名>.idx
+    每行日志一条定长记录 (事件日, 开始日, 服务器 CRC32, 字节偏移)，按追加顺序排列，事件日取累计最大值以保证有序。
+    按日期查询时用 mmap 映射索引二分查找事件日，只读取可能与该日重叠的几行日志：
+    与某天重叠的会话，其事件（上线或下线）发生在这一天到这一天加最长会话时长之间。
+    文件头保存已索引到的日志位置（见 read_log_tail）和最长会话时长，日志被替换或改写时重建
+    """
+    MAGIC = b"MCLI"
+    HEADER = struct.Struct("<4sIqqqqqqI64s4x")  # 魔数, 版本, inode, 大小, 修改时间, 偏移, 最长会话秒数, 记录数, 指纹长度, 指纹
+    RECORD_FIELDS = [("day", "<i4"), ("start_day", "<i4"), ("server", "<u4"), ("offset", "<i8")]
+    RECORD_SIZE = 20
+    
+    def __init__(self, log_file):
+        print('LogIndex__init__ 日志字节偏移索引')
+        self.log_file = log_file
+        self.index_file = os.path.splitext(log_file)[0] + ".idx"
+        self.lock = threading.Lock()
+        self.position = None  # 已索引到的日志位置
+        self.max_span = 0
+        self.records = 0
+        self.last_day = -1  # 最后一条记录的事件日
+        self._day_cache = {}  # "YYYY-MM-DD" -> epoch 天数
+        self._load_header()
+    
+    def _load_header(self):
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, "rb") as f:
+                header = f.read(self.HEADER.size)
+                magic, version, inode, size, mtime, offset, max_span, records, fingerprint_length, fingerprint = \
+                    self.HEADER.unpack(header)
+                if magic != self.MAGIC or version != 1:
+                    return
+                if records:
+                    f.seek(self.HEADER.size + (records - 1) * self.RECORD_SIZE)
+                    self.last_day = int(np.frombuffer(f.read(self.RECORD_SIZE), dtype=self.RECORD_FIELDS)["day"][0])
+            self.position = {
+                "inode": inode, "size": size, "mtime": mtime, "offset": offset,
+                "fingerprint": fingerprint[:fingerprint_length]
+            }
+            self.max_span = max_span
+            self.records = records
+        except Exception as e:
+            print(f"读取日志索引错误，将重建: {str(e)}")
+            self.position = None
+    
+    def _header(self):
+        position = self.position
+        return self.HEADER.pack(
+            self.MAGIC, 1, position["inode"], position["size"], position["mtime"], position["offset"],
+            self.max_span, self.records, len(position["fingerprint"]), position["fingerprint"]
+        )
+    
+    def _day(self, text: bytes) -> int:
+        """"YYYY-MM-DD ..." 的 epoch 天数（与 SessionTable 一样按本地时间计）"""
+        key = text[:10]
+        day = self._day_cache.get(key)
+        if day is None:
+            day = self._day_cache[key] = (datetime.strptime(key.decode(), "%Y-%m-%d") - SessionTable.EPOCH).days
+        return day
+    
+    def _build_records(self, data: bytes, base: int):
+        """为 data（从日志偏移 base 开始的若干完整行）生成索引记录"""
+        rows = []
+        offset = base
+        for line in data.splitlines(keepends=True):
+            match = _LOG_EVENT_PATTERN.match(line)
+            if match:
+                server, start, end = match.groups()
+                start_day = self._day(start)
+                if end:
+                    event_day = self._day(end)
+                    span = (datetime.fromisoformat(end.decode()) - datetime.fromisoformat(start.decode())).total_seconds()
+                    self.max_span = max(self.max_span, int(span))
+                else:
+                    event_day = start_day
+                self.last_day = max(self.last_day, event_day)
+                rows.append((self.last_day, start_day, zlib.crc32(server), offset))
+            offset += len(line)
+        return np.array(rows, dtype=self.RECORD_FIELDS)
+    
+    def catch_up(self, blocking=True):
+        """索引日志中上次之后追加的行（blocking 为 False 时如果正在建立索引则直接返回）"""
+        if not os.path.exists(self.log_file):
+            return
+        if not self.lock.acquire(blocking):
+            return
+        try:
+            self._catch_up()
+        finally:
+            self.lock.release()
+    
+    def _catch_up(self):
+        """catch_up 的实现（调用方持有 self.lock）"""
+        data, full, position = read_log_tail(self.log_file, self.position)
+        if not full and position is self.position:
+            return  # 没有变化
+        base = 0 if full else self.position["offset"]
+        if full:
+            self.max_span = 0
+            self.records = 0
+            self.last_day = -1
+        records = self._build_records(data, base)
+        
+        mode = "r+b" if os.path.exists(self.index_file) and not full else "wb"
+        with open(self.index_file, mode) as f:
+            # 先追加记录再更新文件头，读取方只使用文件头中的记录数
+            f.seek(self.HEADER.size + self.records * self.RECORD_SIZE)
+            f.write(records.tobytes())
+            f.truncate()
+            self.records += len(records)
+            self.position = position
+            f.seek(0)
+            f.write(self._header())
+    
+    def first_day(self):
+        """索引覆盖的第一天，没有记录时返回 None"""
+        with self.lock:
+            if not self.records:
+                return None
+            with open(self.index_file, "rb") as f:
+                f.seek(self.HEADER.size)
+                day = int(np.frombuffer(f.read(self.RECORD_SIZE), dtype=self.RECORD_FIELDS)["day"][0])
+        return SessionTable.EPOCH.date() + timedelta(days=day)
+    
+    def covers(self, date) -> bool:
+        """date 的会话是否都在活动日志中（不早于活动日志的第一个事件）"""
+        first_day = self.first_day()
+        return first_day is not None and date >= first_day
+    
+    def sessions_on(self, date, server=None):
+        """
+        与 date 这一天重叠的会话（按上线顺序），server 为 None 时包括所有服务器；
+        活动日志在上次索引之后被替换（轮转）时返回 None，由调用方改用其他方式查询
+        """
+        day = (date - SessionTable.EPOCH.date()).days
+        # 映射索引和读取日志期间持有索引锁（catch_up 不会改写或截断映射中的文件）和替换锁（轮转不会替换日志）
+        with self.lock, LogArchive.replace_lock:
+            if not self.records:
+                return []
+            try:
+                stat = os.stat(self.log_file)
+            except OSError:
+                return None
+            if stat.st_ino != self.position["inode"] or stat.st_size < self.position["offset"]:
+                return None
+            span_days = -(-self.max_span // 86400)
+            
+            with open(self.index_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+                table = np.frombuffer(index, dtype=self.RECORD_FIELDS, count=self.records, offset=self.HEADER.size)
+                # 事件日有序，二分查找 [day, day + 最长会话天数]（多留一天给跨零点时稍晚写入的事件）
+                low = np.searchsorted(table["day"], day, side="left")
+                high = np.searchsorted(table["day"], day + span_days + 2, side="left")
+                window = table[low:high]
+                mask = window["start_day"] <= day
+                if server is not None:
+                    mask &= window["server"] == zlib.crc32(server.encode("utf-8"))
+                offsets = window["offset"][mask].tolist()
+                del table, window
+            
+            # 日志只按偏移读取几行，不映射
+            lines = []
+            with open(self.log_file, "rb") as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    lines.append(f.readline().rstrip(b"\r\n").decode("utf-8", errors="replace"))
+        
+        day_start = datetime.combine(date, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        return [
+            session for session in read_log_sessions(lines)
+            if (server is None or session["server"] == server)
+            and session["start"] < day_end
+            and (session["end"] >= day_start if session["end"] else session["start"] >= day_start)
+        ]
+
+class SessionStore:
+    """
+    SQLite 会话库（可选）
+    会话表按 (server, start) 和 (start, end) 建索引，日历和可视化按日期范围查询，
+    不再每次重新解析整个文本日志。时间按日志格式存为文本，字典序即时间顺序
+    """
+    
+    def __init__(self, db_file=SESSION_DB_FILE):
+        print('SessionStore__init__ 打开SQLite会话库')
+        self.db_file = db_file
+        self.lock = threading.Lock()  # 写入线程和界面线程共用一个连接
+        
+        db_dir = os.path.dirname(db_file)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id INTEGER PRIMARY KEY,
+                server TEXT NOT NULL,
+                start TEXT NOT NULL,
+                end TEXT,
+                motd TEXT NOT NULL DEFAULT '',
+                start_estimated INTEGER NOT NULL DEFAULT 0,
+                end_estimated INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_server_start ON sessions (server, start);
+            CREATE INDEX IF NOT EXISTS idx_sessions_start_end ON sessions (start, end);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self.conn.commit()
+        
+        # 最长已结束会话的时长（秒），用于给范围查询的开始时间加下界
+        row = self.conn.execute(
+            "SELECT MAX(strftime('%s', end) - strftime('%s', start)) FROM sessions WHERE end IS NOT NULL"
+        ).fetchone()
+        self.max_span = int(row[0] or 0)
+    
+    @staticmethod
+    def _row_to_session(row):
+        server, start, end, motd, start_estimated, end_estimated = row
+        start_time = datetime.fromisoformat(start)
+        end_time = datetime.fromisoformat(end) if end else None
+        return {
+            "server": server,
+            "start": start_time,
+            "end": end_time,
+            "motd": motd,
+            "start_estimated": bool(start_estimated),
+            "end_estimated": bool(end_estimated),
+            "duration": (end_time - start_time).total_seconds() if end_time else 0
+        }
+    
+    def _upsert(self, session):
+        """插入或覆盖一个会话（按服务器和开始时间唯一）"""
+        start = session["start"].strftime(LOG_TIME_FORMAT)
+        end = session["end"].strftime(LOG_TIME_FORMAT) if session["end"] else None
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sessions (server, start, end, motd, start_estimated, end_estimated) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (session["server"], start, end, session["motd"],
+             int(session["start_estimated"]), int(session["end_estimated"]))
+        )
+        if session["end"]:
+            self.max_span = max(self.max_span, int((session["end"] - session["start"]).total_seconds()))
+    
+    def apply_lines(self, lines):
+        """把一批日志行（上线/下线事件）写入会话库，一批一个事务"""
+        with self.lock, self.conn:
+            for line in lines:
+                entry = parse_log_line(line)
+                if entry is None:
+                    continue
+                event = entry.pop("event")
+                if event == "close":
+                    # 下线事件：补全对应的上线记录，MOTD 保留上线时的值
+                    cursor = self.conn.execute(
+                        "UPDATE sessions SET end = ?, end_estimated = ? WHERE server = ? AND start = ?",
+                        (entry["end"].strftime(LOG_TIME_FORMAT), int(entry["end_estimated"]),
+                         entry["server"], entry["start"].strftime(LOG_TIME_FORMAT))
+                    )
+                    if cursor.rowcount:
+                        self.max_span = max(self.max_span, int((entry["end"] - entry["start"]).total_seconds()))
+                        continue
+                self._upsert(entry)
+    
+    def import_log(self, log_file):
+        """
+        导入已有的文本日志（包括归档分段），返回导入的会话数；每个日志文件只导入一次，
+        按绝对路径记录在 meta 的 imported_log:<路径> 中（旧版本的 imported_log 记录同样有效）。
+        由写入线程调用，导入期间不会有新的日志行写入
+        """
+        print('import_log 导入文本日志到SQLite会话库')
+        key = "imported_log:" + os.path.abspath(log_file)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM meta WHERE key = ? OR (key = 'imported_log' AND value = ?)", (key, log_file)
+            ).fetchone()
+        if row or not os.path.exists(log_file):
+            return 0
+        
+        data = LogArchive(log_file).read()
+        with open(log_file, "rb") as f:
+            data += f.read()
+        columns = parse_log_columns(data)
+        
+        # 时间转为日志格式的文本（datetime64 的 ISO 格式把日期和时间用 T 分隔）
+        starts = np.datetime_as_string(columns["start"], unit="s").tolist()
+        ends = np.datetime_as_string(columns["end"], unit="s").tolist()
+        flags = columns["flags"].tolist()
+        rows = [
+            (server, start.replace("T", " "), None if end == "NaT" else end.replace("T", " "), motd,
+             int(bool(flag & FLAG_START_ESTIMATED)), int(bool(flag & FLAG_END_ESTIMATED)))
+            for server, start, end, motd, flag in zip(columns["server"].tolist(), starts, ends, columns["motd"].tolist(), flags)
+        ]
+        
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO sessions (server, start, end, motd, start_estimated, end_estimated) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, log_file))
+            closed = ~np.isnat(columns["end"])
+            if closed.any():
+                spans = (columns["end"][closed] - columns["start"][closed]).astype(np.int64)
+                self.max_span = max(self.max_span, int(spans.max()))
+        print(f"已导入 {len(rows)} 个会话: {log_file}")
+        return len(rows)
+    
+    def sessions_between(self, start: datetime, end: datetime, server=None):
+        """
+        查询与 [start, end) 有重叠的会话（按开始时间排序）
+        已结束的会话开始时间不会早于 start - 最长会话时长，未结束的会话只算开始当天，
+        因此两类会话都能用开始时间上的索引范围扫描
+        """
+        lower = (start - timedelta(seconds=self.max_span)).strftime(LOG_TIME_FORMAT)
+        start_str = start.strftime(LOG_TIME_FORMAT)
+        end_str = end.strftime(LOG_TIME_FORMAT)
+        
+        sql = ("SELECT server, start, end, motd, start_estimated, end_estimated FROM sessions "
+               "WHERE {} start >= ? AND start < ? AND (end >= ? OR (end IS NULL AND start >= ?)) "
+               "ORDER BY start")
+        if server is None:
+            sql = sql.format("")
+            params = (lower, end_str, start_str, start_str)
+        else:
+            sql = sql.format("server = ? AND")
+            params = (server, lower, end_str, start_str, start_str)
+        
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self._row_to_session(row) for row in rows]
+    
+    def servers(self):
+        """所有出现过的服务器地址"""
+        with self.lock:
+            rows = self.conn.execute("SELECT DISTINCT server FROM sessions").fetchall()
+        return [row[0] for row in rows]
     
-    # 创建日志条目
-    log_entry = f"[{server_address}] [上线] {start_str} ~ {end_str} | MOTD: {cleaned_motd}\n"
+    def first_date(self):
+        """最早会话的日期，没有数据时返回 None"""
+        with self.lock:
+            row = self.conn.execute("SELECT MIN(start) FROM sessions").fetchone()
+        return datetime.fromisoformat(row[0]).date() if row[0] else None
     
-    # 写入日志文件
-    config = load_config()
-    log_file = config.get('General', 'log_file', fallback=LOG_FILE)
+    def stats(self):
+        """返回 (有记录的天数, 会话数, 服务器数)"""
+        with self.lock:
+            total_sessions, total_servers = self.conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT server) FROM sessions"
+            ).fetchone()
+            days = {row[0] for row in self.conn.execute("SELECT DISTINCT substr(start, 1, 10) FROM sessions")}
+            # 跨天的会话还要计入之后的日期
+            multi_day = self.conn.execute(
+                "SELECT start, end FROM sessions WHERE end IS NOT NULL AND substr(end, 1, 10) > substr(start, 1, 10)"
+            ).fetchall()
+        days = {datetime.fromisoformat(day).date() for day in days}
+        for start, end in multi_day:
+            current_date = datetime.fromisoformat(start).date()
+            end_date = datetime.fromisoformat(end).date()
+            while current_date <= end_date:
+                days.add(current_date)
+                current_date += timedelta(days=1)
+        return len(days), total_sessions, total_servers
     
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def open_session_store(config):
+    """按配置打开 SQLite 会话库（已有文本日志由写入线程导入，见 LogWriter.set_store）；使用文本日志时返回 None"""
+    print('open_session_store 打开会话库')
+    if config.get('General', 'session_store', fallback='text').strip().lower() != 'sqlite':
+        return None
     try:
+        return SessionStore(config.get('General', 'session_db', fallback=SESSION_DB_FILE))
+    except Exception as e:
+        print(f"打开SQLite会话库错误，改用文本日志: {str(e)}")
+        return None
+
+class LogWriter:
+    """
+    日志写入线程
+    保持日志文件句柄常开，通过队列接收日志条目，检查线程只入队不碰磁盘；
+    写入线程把队列中积压的条目合并为一次写入并 flush（组提交），按 fsync_interval 间隔 fsync；
+    启用 SQLite 会话库（store）时同一批条目在一个事务中写入会话库，每个日志文件第一次使用时先在写入线程中导入已有的历史；
+    在线时长汇总（rollup）和字节偏移索引（index）由日历首次打开时加载，之后每批写入后追上新写入的内容
+    （没打开过日历时写入线程不碰它们，也就不需要导入 numpy/pandas）；启用按月轮转时，月份变化后先把之前月份的日志归档
+    """
+    _STOP = object()
+
+    def __init__(self, log_file=LOG_FILE, fsync_interval: float = 1.0):
+        self.log_file = log_file
+        self.fsync_interval = fsync_interval
+        self.queue = queue.Queue()
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.store = None  # SessionStore，未启用或正在导入历史时为 None（日历使用文本日志）
+        self.rollup = None  # 当前日志文件的 UptimeRollup，日历首次使用时加载
+        self.index = None  # 当前日志文件的 LogIndex，日历首次使用时打开
+        self.rollup_lock = threading.Lock()
+        self.rotate_monthly = False  # 是否按月归档日志，见 LogArchive
+        self._rotation_month = None  # 上次检查轮转的月份
+        self._file = None
+        self._path = None
+        self._dirty = False  # 已 flush 但尚未 fsync
+        self._last_fsync = time.monotonic()
+
+    def start(self):
+        """启动写入线程（重复调用无副作用）"""
+        with self.start_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="LogWriter", daemon=True)
+                self.thread.start()
+
+    def write(self, entry: str):
+        """日志条目入队，立即返回"""
+        self.start()
+        self.queue.put(entry)
+
+    def set_path(self, log_file: str):
+        """切换日志文件路径，写入线程在写完之前入队的条目后重新打开文件"""
+        if log_file and log_file != self.log_file:
+            self.log_file = log_file
+            self.queue.put(("reopen", log_file))
+
+    def set_store(self, store):
+        """启用 SQLite 会话库，写入线程导入当前日志中尚未导入的历史后开始同时写入会话库"""
+        if store is not None:
+            self.queue.put(("store", store))
+
+    def flush(self, timeout: float = 2.0) -> bool:
+        """等待此前入队的条目全部写入并 fsync（读取日志前调用）"""
+        if self.thread is None or not self.thread.is_alive():
+            return True
+        done = threading.Event()
+        self.queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 2.0):
+        """写完剩余条目后关闭文件并结束线程"""
+        print('LogWriter.close 关闭日志写入线程')
+        if self.thread is None or not self.thread.is_alive():
+            return
+        self.queue.put(self._STOP)
+        self.thread.join(timeout)
+
+    def uptime_rollup(self, log_file=None) -> "UptimeRollup":
+        """返回 log_file（默认当前日志）的在线时长汇总，日志路径改变时保存旧的并加载新的"""
+        log_file = log_file or self.log_file
+        with self.rollup_lock:
+            if self.rollup is None or self.rollup.log_file != log_file:
+                if self.rollup is not None:
+                    self.rollup.save(force=True)
+                self.rollup = UptimeRollup.load(log_file)
+            return self.rollup
+
+    def log_index(self, log_file=None) -> "LogIndex":
+        """返回 log_file（默认当前日志）的字节偏移索引"""
+        log_file = log_file or self.log_file
+        with self.rollup_lock:
+            if self.index is None or self.index.log_file != log_file:
+                self.index = LogIndex(log_file)
+            return self.index
+
+    def _update_rollup(self, path, force_save=False):
+        """
+        汇总和索引刚写入的内容（每批只有几行，逐行累加），按间隔保存汇总文件；
+        只维护已经由日历加载的 path 的汇总和索引，没有加载时跳过（下次加载时从保存的位置追上）；
+        其他线程正在重建时也跳过，不让写入（以及等待 flush 的调用方）排在后面
+        """
+        rollup = self.rollup
+        if rollup is not None and rollup.log_file == path:
+            try:
+                rollup.catch_up(blocking=False)
+                rollup.save(force=force_save)
+            except Exception as e:
+                print(f"更新在线时长汇总错误: {str(e)}")
+        index = self.index
+        if index is not None and index.log_file == path:
+            try:
+                index.catch_up(blocking=False)
+            except Exception as e:
+                print(f"更新日志索引错误: {str(e)}")
+
+    def _import_log(self, store, path):
+        """把 path 已有的日志导入会话库（已导入过时直接返回），导入完成前 store 不对外可见；导入失败时不使用会话库"""
+        self.store = None
+        try:
+            store.import_log(path)
+        except Exception as e:
+            print(f"导入SQLite会话库错误，改用文本日志: {str(e)}")
+            return
+        self.store = store
+
+    def _rotate(self, path):
+        """月份变化后（以及启动时）把活动日志中之前月份的行归档"""
+        month = datetime.now().strftime("%Y-%m")
+        if not self.rotate_monthly or month == self._rotation_month:
+            return
+        self._rotation_month = month
+        try:
+            # 已加载的汇总先追上当前日志，归档后从新的活动日志末尾继续；
+            # 没有加载时日志被替换，下次加载时连同归档重新计算
+            rollup = self.rollup
+            if rollup is not None and rollup.log_file != path:
+                rollup = None
+            if rollup is not None:
+                rollup.catch_up()
+            self._close_file()
+            if LogArchive(path).rotate(month) and rollup is not None:
+                rollup.rebase()
+        except Exception as e:
+            print(f"日志轮转错误: {str(e)}")
+
+    def _open(self, path):
+        """以追加模式打开日志文件"""
         # 确保日志目录存在
-        log_dir = os.path.dirname(log_file)
+        log_dir = os.path.dirname(path)
         if log_dir and not os.path.exists(log_dir):
             os.makedirs(log_dir, exist_ok=True)
-        
-        with open(log_file, "a", encoding="utf-8") as log:
-            log.write(log_entry)
-    except Exception as e:
-        print(f"写入日志文件错误: {str(e)}")
+        self._file = open(path, "a", encoding="utf-8")
+        self._path = path
 
-def remove_last_incomplete_log_entry(server_address, start_time: datetime, start_estimated: bool = False):
-    """删除最后一条不完整的日志记录（结束时间为'无'的记录）"""
-    print('remove_last_incomplete_log_entry 删除最后一条不完整的日志记录（这TM有Bug）')
-    config = load_config()
-    log_file = config.get('General', 'log_file', fallback=LOG_FILE)
-    
-    try:
-        # 如果日志文件不存在，直接返回
-        if not os.path.exists(log_file):
+    def _close_file(self):
+        """fsync 并关闭当前文件"""
+        if self._file is None:
             return
-            
-        # 读取所有日志行
-        with open(log_file, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        
-        # 如果没有日志行，直接返回
+        try:
+            self._sync(force=True)
+            self._file.close()
+        except Exception as e:
+            print(f"关闭日志文件错误: {str(e)}")
+        self._file = None
+        self._path = None
+        self._dirty = False
+
+    def _sync(self, force=False):
+        """距离上次 fsync 超过间隔（或 force）时把已 flush 的数据落盘"""
+        if not self._dirty or self._file is None:
+            return
+        now = time.monotonic()
+        if force or now - self._last_fsync >= self.fsync_interval:
+            try:
+                os.fsync(self._file.fileno())
+            except Exception as e:
+                print(f"同步日志文件错误: {str(e)}")
+            self._dirty = False
+            self._last_fsync = now
+
+    def _write_batch(self, lines, path):
+        """把一批条目一次写入 path 并 flush"""
         if not lines:
             return
-            
-        # 构建要查找的上线记录特征
-        start_str = start_time.strftime("%Y-%m-%d %H:%M:%S")
-        if start_estimated:
-            start_str += "*"
-        prefix = f"[{server_address}] [上线] {start_str} ~ 无 | MOTD:"
-        
-        # 从后向前查找匹配的行
-        last_index = -1
-        for i in range(len(lines)-1, -1, -1):
-            if lines[i].startswith(prefix):
-                last_index = i
-                break
-                
-        # 如果找到匹配的行，删除它
-        if last_index != -1:
-            del lines[last_index]
-            
-            # 重新写入日志文件
-            with open(log_file, "w", encoding="utf-8") as f:
-                f.writelines(lines)
-                
-    except Exception as e:
-        print(f"删除日志记录错误: {str(e)}")
+        self._rotate(path)
+        try:
+            if self._path != path:
+                self._close_file()
+                self._open(path)
+            self._file.write("".join(lines))
+            self._file.flush()
+            self._dirty = True
+        except Exception as e:
+            print(f"写入日志文件错误: {str(e)}")
+            self._close_file()
+        
+        if self.store is not None:
+            try:
+                self.store.apply_lines(lines)
+            except Exception as e:
+                print(f"写入SQLite会话库错误: {str(e)}")
+        
+        self._update_rollup(path)
+
+    def _run(self):
+        path = self.log_file  # 写入线程当前使用的路径，只随 reopen 消息变化，保证切换前的条目写入旧文件
+        self._rotate(path)
+        while True:
+            # 有未 fsync 的数据时最多等到下一次 fsync 时刻
+            timeout = None
+            if self._dirty:
+                timeout = max(0.0, self._last_fsync + self.fsync_interval - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self._sync()
+                continue
+
+            # 取出当前积压的所有条目作为一批
+            items = [item]
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            for item in items:
+                if isinstance(item, str):
+                    lines.append(item)
+                    continue
+                # 处理控制消息前先写完之前的条目，保证顺序
+                self._write_batch(lines, path)
+                lines = []
+                if item is self._STOP:
+                    self._close_file()
+                    self._update_rollup(path, force_save=True)
+                    return
+                command, arg = item
+                if command == "reopen":
+                    self._close_file()
+                    self._update_rollup(path, force_save=True)
+                    path = arg
+                    self._rotation_month = None
+                    if self.store is not None:
+                        self._import_log(self.store, path)  # 新的日志文件可能还没有导入
+                elif command == "store":
+                    self._import_log(arg, path)
+                elif command == "flush":
+                    self._sync(force=True)
+                    arg.set()
+            self._write_batch(lines, path)
+            self._sync()
+
+LOG_WRITER = LogWriter()
+
+def log_server_status(server_address, start_time: datetime, end_time: datetime, motd_plain: str, start_estimated: bool = False, end_estimated: bool = False):
+    """记录服务器上线（end_time 为 None）或下线事件到日志文件（只追加，不改写已有内容）"""
+    print('log_server_status 记录日志')
+    # 创建日志条目，交给写入线程，检查线程不等待磁盘
+    log_entry = format_log_entry(
+        server_address, start_time, end_time, motd_plain, start_estimated, end_estimated,
+        event="上线" if end_time is None else "下线"
+    )
+    LOG_WRITER.write(log_entry)
 
 class CenterDialog(QDialog):
     """居中显示的对话框基类"""
@@ -481,6 +2689,410 @@ class CenterDialog(QDialog):
         self.move(int((screen.width() - size.width()) / 2),
                  int((screen.height() - size.height()) / 2))
 
+# 图表字体是否已经设置（setup_chart_fonts 只执行一次，由第一个 ChartRenderer 在后台线程中执行）
+_chart_fonts_ready = False
+_chart_fonts_lock = threading.Lock()
+
+def chart_font_signature():
+    """没有找到中文字体时保存的标记：matplotlib 字体列表的版本和字体数，安装新字体重建字体列表后标记失效"""
+    return f"none:{fm.FontManager.__version__}:{len(fm.fontManager.ttflist)}"
+
+def find_chart_font():
+    """
+    返回支持中文的字体文件路径，找不到时返回 None
+    优先使用 settings.ini 中保存的路径；没有或文件已不存在时按候选字体名查找（冷缓存时可能要几秒），找到后保存。
+    找不到时也保存结果（chart_font_signature），字体列表没有变化时之后不再查找
+    """
+    font_path = config_snapshot().get('Calendar', 'chart_font', fallback='')
+    if font_path.startswith('none:'):
+        if font_path == chart_font_signature():
+            return None
+    elif font_path and os.path.exists(font_path):
+        return font_path
+    
+    print('find_chart_font 查找中文字体')
+    # 尝试查找常见的中文字体
+    possible_fonts = [
+        'SimHei', 'Microsoft YaHei', 'KaiTi', 'SimSun',  # Windows
+        'STHeiti', 'STKaiti', 'Songti SC', 'Heiti SC',    # MacOS
+        'WenQuanYi Micro Hei', 'WenQuanYi Zen Hei',       # Linux
+        'Noto Sans CJK SC', 'Source Han Sans SC'           # 跨平台
+    ]
+    
+    # 查找系统中可用的字体（不回退到默认字体，否则第一个候选总会“找到” DejaVu Sans）
+    for font_name in possible_fonts:
+        try:
+            font_path = fm.findfont(font_name, fallback_to_default=False)
+        except Exception:
+            continue
+        if font_path:
+            break
+    else:
+        font_path = None
+    
+    config = load_config()
+    config.set('Calendar', 'chart_font', font_path or chart_font_signature())
+    save_config(config)
+    return font_path
+
+def setup_chart_fonts():
+    """
+    图表子系统初始化：设置中文字体和字号（修改全局 rcParams，只执行一次）
+    在 ChartRenderer 线程中调用，首次导入 matplotlib 和查找字体都不占用界面线程
+    """
+    global _chart_fonts_ready
+    with _chart_fonts_lock:
+        if _chart_fonts_ready:
+            return
+        _chart_fonts_ready = True
+        _setup_chart_fonts()
+
+def _setup_chart_fonts():
+    font_path = find_chart_font()
+    if font_path:
+        try:
+            # 保存的路径可能还不在 matplotlib 的字体列表中
+            fm.fontManager.addfont(font_path)
+            font_prop = fm.FontProperties(fname=font_path, size=12)  # 增加字体大小
+            matplotlib.rcParams['font.family'] = font_prop.get_name()
+            matplotlib.rcParams['axes.unicode_minus'] = False
+        except Exception as e:
+            print(f"加载中文字体错误: {str(e)}")
+            font_path = None
+    
+    # 如果找不到中文字体，使用默认字体并警告
+    if not font_path:
+        print("警告: 未找到中文字体，图表中的中文可能显示为方块")
+    
+    matplotlib.rcParams['font.size'] = 12  # 全局字体大小
+    matplotlib.rcParams['axes.titlesize'] = 16  # 标题字体大小
+    matplotlib.rcParams['axes.labelsize'] = 14  # 轴标签字体大小
+    matplotlib.rcParams['xtick.labelsize'] = 12  # X轴刻度字体大小
+    matplotlib.rcParams['ytick.labelsize'] = 12  # Y轴刻度字体大小
+
+def render_uptime_chart(chart):
+    """
+    把 CalendarWindow.chart_data() 的数据画到离屏 Agg 画布上，返回 (RGBA 字节, 宽, 高)
+    只使用 Figure/FigureCanvasAgg，不创建 Qt 控件，可以在后台线程中调用
+    """
+    # 创建matplotlib图形 - 增加图形尺寸
+    figure = mpl_figure.Figure(figsize=(12, 8), dpi=100)  # 增加图形尺寸
+    canvas = mpl_backend_agg.FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    
+    viz_type = chart["viz_type"]
+    dates = chart["dates"]
+    durations = chart["durations"]
+    motd_durations = chart["motd_durations"]
+    title_suffix = f" - {chart['server']}" if chart["server"] else ""
+    
+    if not dates:
+        # 直接使用英文显示避免字体问题
+        ax.text(0.5, 0.5, "No data available", ha='center', va='center', fontsize=15)
+    
+    # 根据可视化类型生成图表
+    elif viz_type == "每日时长":
+        # 绘制每日时长柱状图
+        ax.bar(dates, durations, color='skyblue', width=0.8)
+        
+        # 设置标题和标签 - 使用更大的字体
+        ax.set_title('每日服务器在线时长' + title_suffix, fontsize=18)
+        ax.set_xlabel('日期', fontsize=16)
+        ax.set_ylabel('时长 (小时)', fontsize=16)
+        
+        # 设置日期格式
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
+        figure.autofmt_xdate(rotation=30)  # 旋转日期标签避免重叠
+        
+        # 添加数据标签 - 使用更大的字体
+        for i, v in enumerate(durations):
+            if v > 0:
+                ax.text(dates[i], v + 0.1, f"{v:.1f}", 
+                        ha='center', va='bottom', fontsize=12)
+    
+    elif viz_type == "每周时长":
+        # 按周分组数据
+        weekly_data = defaultdict(float)
+        for date, duration in zip(dates, durations):
+            year, week, _ = date.isocalendar()
+            weekly_data[f"{year}-W{week:02d}"] += duration
+        
+        # 准备绘图数据
+        weeks = sorted(weekly_data.keys())
+        week_durations = [weekly_data[week] for week in weeks]
+        
+        # 绘制每周时长柱状图
+        ax.bar(weeks, week_durations, color='lightgreen', width=0.6)
+        
+        # 设置标题和标签 - 使用更大的字体
+        ax.set_title('每周服务器在线时长' + title_suffix, fontsize=18)
+        ax.set_xlabel('周', fontsize=16)
+        ax.set_ylabel('时长 (小时)', fontsize=16)
+        
+        # 添加数据标签 - 使用更大的字体
+        for i, v in enumerate(week_durations):
+            if v > 0:
+                ax.text(i, v + 0.1, f"{v:.1f}", 
+                        ha='center', va='bottom', fontsize=12)
+    
+    elif viz_type == "每月时长":
+        # 按月分组数据
+        monthly_data = defaultdict(float)
+        for date, duration in zip(dates, durations):
+            month_key = date.strftime("%Y-%m")
+            monthly_data[month_key] += duration
+        
+        # 准备绘图数据
+        months = sorted(monthly_data.keys())
+        month_durations = [monthly_data[month] for month in months]
+        
+        # 绘制每月时长柱状图
+        ax.bar(months, month_durations, color='salmon', width=0.6)
+        
+        # 设置标题和标签 - 使用更大的字体
+        ax.set_title('每月服务器在线时长' + title_suffix, fontsize=18)
+        ax.set_xlabel('月份', fontsize=16)
+        ax.set_ylabel('时长 (小时)', fontsize=16)
+        
+        # 添加数据标签 - 使用更大的字体
+        for i, v in enumerate(month_durations):
+            if v > 0:
+                ax.text(i, v + 0.1, f"{v:.1f}", 
+                        ha='center', va='bottom', fontsize=12)
+    
+    elif viz_type == "按MOTD分类统计":
+        if not motd_durations:
+            # 使用英文显示避免字体问题
+            ax.text(0.5, 0.5, "No MOTD data available", ha='center', va='center', fontsize=15)
+        else:
+            # 准备MOTD数据
+            motd_names = []
+            motd_hours = []
+            
+            for motd, seconds in motd_durations.items():
+                motd_names.append(motd[:20] + "..." if len(motd) > 20 else motd)
+                motd_hours.append(seconds / 3600)  # 转换为小时
+            
+            # 排序按时长降序
+            sorted_indices = np.argsort(motd_hours)[::-1]
+            sorted_names = [motd_names[i] for i in sorted_indices]
+            sorted_durations = [motd_hours[i] for i in sorted_indices]
+            
+            # 如果MOTD太多，只显示前10个，其余合并为"其他"
+            max_items = 10
+            if len(sorted_durations) > max_items:
+                other_duration = sum(sorted_durations[max_items:])
+                sorted_durations = sorted_durations[:max_items]
+                sorted_names = sorted_names[:max_items]
+                
+                # 添加"其他"类别
+                sorted_durations.append(other_duration)
+                sorted_names.append("其他")
+            
+            # 绘制饼图 - 使用更大的字体
+            ax.set_title('按MOTD分类的服务器在线时长' + title_suffix, fontsize=18)
+            ax.pie(sorted_durations, labels=sorted_names, autopct='%1.1f%%', 
+                  startangle=90, textprops={'fontsize': 14})  # 增加字体大小
+            ax.axis('equal')  # 确保饼图是圆的
+    
+    if dates:
+        # 设置网格
+        ax.grid(True, linestyle='--', alpha=0.7)
+    
+    canvas.draw()
+    width, height = canvas.get_width_height()
+    return bytes(canvas.buffer_rgba()), width, height
+
+class ChartCache:
+    """
+    渲染好的图表 QPixmap 的 LRU 缓存（只在GUI线程访问），按图像字节数上限淘汰
+    键为查询条件（可视化类型、时间范围、服务器、MOTD开关等），另记录渲染时的数据版本，
+    数据版本变化（有新会话上线或结束）后旧图表全部失效
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0  # 当前缓存的图像字节数
+        self._items = OrderedDict()  # 键 -> (数据版本, QPixmap, 字节数)
+
+    def get(self, key, version):
+        """返回缓存的图表，没有或数据版本已变化时返回 None"""
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] != version:
+            self.invalidate(version)
+            return None
+        self._items.move_to_end(key)
+        return item[1]
+
+    def put(self, key, version, pixmap):
+        self.invalidate(version)
+        nbytes = pixmap.width() * pixmap.height() * 4
+        if nbytes > self.max_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.size -= old[2]
+        self._items[key] = (version, pixmap, nbytes)
+        self.size += nbytes
+        while self.size > self.max_bytes:
+            _, (_, _, evicted) = self._items.popitem(last=False)
+            self.size -= evicted
+
+    def invalidate(self, version):
+        """丢弃数据版本不是 version 的图表"""
+        for key in [key for key, item in self._items.items() if item[0] != version]:
+            self.size -= self._items.pop(key)[2]
+
+# 全局图表缓存
+CHART_CACHE = ChartCache()
+
+# 正在运行的后台任务（ChartRenderer/CalendarLoader），没有父对象，运行结束后才释放；
+# 取消后不等待，关闭窗口或重新加载时界面线程不会卡在一个不能中断的阶段上
+_BACKGROUND_WORKERS = set()
+
+def start_background_worker(worker):
+    """启动后台任务并保留引用直到运行结束"""
+    _BACKGROUND_WORKERS.add(worker)
+    worker.finished.connect(lambda: release_background_worker(worker))
+    worker.start()
+
+def release_background_worker(worker):
+    # finished 在线程退出前发出，wait 只等它真正退出（几乎立即返回）
+    worker.wait()
+    _BACKGROUND_WORKERS.discard(worker)
+
+def stop_background_workers(timeout_ms=2000):
+    """退出程序前取消所有后台任务，最多等待 timeout_ms 毫秒"""
+    deadline = time.monotonic() + timeout_ms / 1000
+    for worker in list(_BACKGROUND_WORKERS):
+        worker.cancel()
+    for worker in list(_BACKGROUND_WORKERS):
+        worker.wait(max(0, int((deadline - time.monotonic()) * 1000)))
+
+class ChartRenderer(QThread):
+    """在后台线程中离屏渲染图表，完成后通过 rendered 信号交给界面线程；取消后丢弃结果"""
+    rendered = pyqtSignal(object)  # (RGBA 字节, 宽, 高)
+    failed = pyqtSignal(str)
+
+    def __init__(self, chart, parent=None):
+        super().__init__(parent)
+        self.chart = chart
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            setup_chart_fonts()
+            motd_query = self.chart.pop("motd_query", None)
+            if motd_query is not None:
+                # 按MOTD分类时在这里查询会话并汇总，不占用界面线程
+                source, start_date, end_date, server = motd_query
+                sessions = source.sessions_between(
+                    datetime.combine(start_date, datetime.min.time()),
+                    datetime.combine(end_date + timedelta(days=1), datetime.min.time()),
+                    server
+                )
+                if self.cancelled:
+                    return
+                self.chart["motd_durations"] = motd_durations_between(sessions, start_date, end_date)
+            image = render_uptime_chart(self.chart)
+        except Exception as e:
+            if not self.cancelled:
+                self.failed.emit(str(e))
+            return
+        if not self.cancelled:
+            self.rendered.emit(image)
+
+class CalendarLoader(QThread):
+    """
+    在后台线程中准备日历数据：等待日志写入、追上在线时长汇总和字节偏移索引、读取并解析新增日志，
+    结果通过 loaded 信号交给界面线程应用（界面线程只做合并和刷新控件）；取消后丢弃结果
+    """
+    progress = pyqtSignal(int, str)
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, log_file, store, log_position, log_parser, loaded_since, parent=None):
+        super().__init__(parent)
+        self.log_file = log_file
+        self.store = store
+        self.log_position = log_position
+        self.log_parser = log_parser
+        self.loaded_since = loaded_since
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            result = self.load()
+        except Exception as e:
+            if not self.cancelled:
+                self.failed.emit(str(e))
+            return
+        if result is not None and not self.cancelled:
+            self.loaded.emit(result)
+
+    def load(self):
+        """准备数据，取消时返回 None"""
+        result = {"loader": self}
+        self.progress.emit(5, "等待日志写入")
+        LOG_WRITER.flush()  # 确保写入线程中尚未落盘的事件可见
+        
+        self.progress.emit(15, "汇总在线时长")
+        result["rollup"] = LOG_WRITER.uptime_rollup(self.log_file)
+        result["rollup"].catch_up()
+        if self.cancelled:
+            return None
+        
+        self.progress.emit(35, "更新日志索引")
+        result["log_index"] = LOG_WRITER.log_index(self.log_file)
+        result["log_index"].catch_up()
+        if self.cancelled:
+            return None
+        
+        if self.store is not None:
+            # SQLite 会话库只取统计信息，日期数据按需范围查询
+            self.progress.emit(60, "读取会话库")
+            result["servers"] = set(self.store.servers())
+            result["stats"] = self.store.stats()
+            self.progress.emit(100, "完成")
+            return result
+        
+        if not os.path.exists(self.log_file):
+            result["missing"] = True
+            return result
+        
+        self.progress.emit(50, "读取日志")
+        data, full, result["log_position"] = read_log_tail(self.log_file, self.log_position)
+        if full or self.log_parser is None:
+            # 活动日志连同需要的归档分段一起用批量解析器，未结束的会话交给增量解析器等待下线事件
+            archive = LogArchive(self.log_file)
+            if not full:
+                data, _, result["log_position"] = read_log_tail(self.log_file, None)
+            data = archive.read(self.loaded_since) + data
+            if self.cancelled:
+                return None
+            self.progress.emit(65, "解析日志")
+            sessions = SessionTable()
+            sessions.append_columns(parse_log_columns(data))
+            log_parser = LogSessionParser()
+            for session in sessions.open_sessions():
+                log_parser.open_sessions[(session["server"], session["start"])] = session
+            self.progress.emit(90, "统计")
+            result.update(archive=archive, sessions=sessions, log_parser=log_parser, stats=sessions.stats())
+        else:
+            result["new_sessions"], result["closed"] = self.log_parser.feed(
+                data.decode("utf-8", errors="replace").splitlines()
+            )
+        self.progress.emit(100, "完成")
+        return result
+
 class CalendarWindow(CenterDialog):
     """服务器日历可视化窗口"""
     
@@ -489,7 +3101,7 @@ class CalendarWindow(CenterDialog):
         super().__init__(parent)
         self.setWindowTitle("服务器日历")
         self.setGeometry(100, 100, 900, 600)
-        self.setWindowIcon(QIcon(load_config().get('General', 'icon_path', fallback=ICON_PATH)))
+        self.setWindowIcon(QIcon(config_snapshot().get('General', 'icon_path', fallback=ICON_PATH)))
         
         # 主布局
         main_layout = QVBoxLayout()
@@ -501,9 +3113,19 @@ class CalendarWindow(CenterDialog):
         
         # 添加刷新按钮
         self.refresh_button = QPushButton("刷新数据")
-        self.refresh_button.clicked.connect(self.load_log_data)
+        self.refresh_button.clicked.connect(lambda: self.load_log_data())
         info_layout.addWidget(self.refresh_button)
         
+        # 后台加载进度和取消按钮（加载时显示）
+        self.load_progress = QProgressBar()
+        self.load_progress.setMaximumWidth(160)
+        self.load_progress.hide()
+        info_layout.addWidget(self.load_progress)
+        self.cancel_load_button = QPushButton("取消")
+        self.cancel_load_button.clicked.connect(self.cancel_load)
+        self.cancel_load_button.hide()
+        info_layout.addWidget(self.cancel_load_button)
+        
         # 添加当天总时长标签
         self.daily_total_label = QLabel("当天总时长: 0小时0分钟")
         info_layout.addWidget(self.daily_total_label)
@@ -564,6 +3186,7 @@ class CalendarWindow(CenterDialog):
         self.calendar.setMinimumDate(datetime.now().date() - timedelta(days=365))
         self.calendar.setMaximumDate(datetime.now().date() + timedelta(days=30))
         self.calendar.clicked.connect(self.date_selected)
+        self.calendar.currentPageChanged.connect(self.update_calendar_colors)  # 翻页时只给新显示的月份上色
         
         # 添加日历说明
         legend_group = QGroupBox("图例说明")
@@ -572,7 +3195,7 @@ class CalendarWindow(CenterDialog):
         # 修改为"显示颜色"复选框
         self.show_color_checkbox = QCheckBox("显示颜色") 
         # 从配置加载初始状态
-        config = load_config()
+        config = config_snapshot()
         show_color = config.getboolean('Calendar', 'show_color', fallback=False)
         self.show_color_checkbox.setChecked(show_color)
         
@@ -635,16 +3258,25 @@ class CalendarWindow(CenterDialog):
         self.setLayout(main_layout)
         
         # 加载日志数据
-        self.log_data = {}
+        self.sessions = SessionTable()  # 文本日志模式下解析出的会话
         self.server_list = set()  # 存储所有服务器地址
-        self.load_log_data()
-        
-        # 应用初始样式
-        self.update_calendar_colors()
-        
-        # 默认选择今天
+        self.colored_dates = set()  # 当前设置了背景色的日期
+        self.log_file = None
+        self.log_parser = None  # 文本日志的增量解析状态，由 CalendarLoader 在后台推进
+        self.log_position = None
+        self.archive = None  # 文本日志的按月归档分段
+        self.loaded_since = datetime.combine(self.calendar.minimumDate().toPyDate(), datetime.min.time())  # 已载入的归档起点
+        self.store = LOG_WRITER.store  # 启用 SQLite 会话库时按范围查询，否则解析文本日志
+        self.rollup = None  # 每服务器每天的在线时长汇总，日历颜色、当天总时长和图表都从这里读取
+        self.log_index = None  # 活动日志的字节偏移索引，选择日期时直接定位当天的日志行
+        self.loader = None  # 正在运行的 CalendarLoader
+        self.after_load = []  # 加载结束后调用的回调 callback(成功与否)，例如等待归档载入的图表
+        self.workers = []  # 后台线程（加载和图表渲染），关闭窗口时取消
+        
+        # 默认选择今天，数据在后台加载完成后刷新
         self.calendar.setSelectedDate(datetime.now().date())
         self.date_selected()
+        self.load_log_data()
         
     def save_show_color_setting(self):
         """保存'显示颜色'设置到配置文件"""
@@ -661,110 +3293,188 @@ class CalendarWindow(CenterDialog):
         
         save_config(config)
 
-    def load_log_data(self):
-        """加载并解析日志文件数据"""
+    def load_log_data(self, restart=False):
+        """
+        在后台线程中加载日志数据（文本日志只解析上次之后新追加的行），完成后更新界面；
+        restart 时取消正在进行的加载，按当前的 loaded_since 重新开始
+        """
         print('load_log_data 加载并解析日志文件数据')
-        self.log_data = {}
-        total_days = 0
-        total_sessions = 0
-        self.server_list = set()  # 重置服务器列表
+        if self.loader is not None and self.loader.isRunning():
+            if not restart:
+                return  # 正在加载
+            self.stop_loader()
         
-        config = load_config()
+        config = config_snapshot()
         log_file = config.get('General', 'log_file', fallback=LOG_FILE)
-        
-        try:
-            if not os.path.exists(log_file):
+        if log_file != self.log_file:
+            # 日志路径改变，清空已解析的数据
+            self.log_position = None
+        self.log_file = log_file
+        
+        loader = CalendarLoader(log_file, self.store, self.log_position, self.log_parser, self.loaded_since)
+        # 进度和失败信号带上 loader，已取消的加载仍在后台运行时发出的信号直接忽略
+        loader.progress.connect(functools.partial(self.show_load_progress, loader))
+        loader.loaded.connect(self.apply_log_data)
+        loader.failed.connect(functools.partial(self.load_failed, loader))
+        self.loader = loader
+        self.refresh_button.setEnabled(False)
+        self.cancel_load_button.show()
+        self.start_worker(loader)
+    
+    def show_load_progress(self, loader, percent, text):
+        """显示后台加载进度"""
+        if loader is not self.loader:
+            return
+        self.load_progress.setValue(percent)
+        self.load_progress.setFormat(f"{text} %p%")
+        self.load_progress.show()
+    
+    def finish_load(self):
+        self.loader = None
+        self.load_progress.hide()
+        self.cancel_load_button.hide()
+        self.refresh_button.setEnabled(True)
+    
+    def stop_loader(self):
+        """
+        取消正在运行的 CalendarLoader，不等待（当前阶段不能中断，它在后台运行完后丢弃结果）；
+        它可能已经消费了部分增量日志，下次从头解析
+        """
+        if self.loader is not None:
+            self.loader.cancel()
+            self.loader = None
+            self.log_position = None
+            self.log_parser = None
+    
+    def cancel_load(self):
+        """取消后台加载"""
+        self.stop_loader()
+        self.finish_load()
+        self.run_after_load(False)
+    
+    def load_failed(self, loader, message):
+        if loader is not self.loader:
+            return
+        self.finish_load()
+        self.log_position = None  # 下次重新完整解析
+        self.log_display.setText(f"读取日志文件错误: {message}")
+        self.run_after_load(False)
+    
+    def run_after_load(self, ok):
+        """调用并清空等待本次加载的回调"""
+        callbacks, self.after_load = self.after_load, []
+        for callback in callbacks:
+            callback(ok)
+    
+    def apply_log_data(self, result):
+        """在界面线程中应用 CalendarLoader 准备好的数据"""
+        if result["loader"] is not self.loader:
+            return  # 已被取消或替换的加载结果
+        self.finish_load()
+        self.rollup = result["rollup"]
+        self.log_index = result["log_index"]
+        
+        if self.store is None:
+            if result.get("missing"):
+                self.sessions = SessionTable()
+                self.server_list = set()
+                self.log_position = None
                 self.log_display.setText("日志文件不存在")
+                self.update_calendar_colors()
+                self.run_after_load(True)
                 return
-            
-            with open(log_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    # 解析日志行
-                    try:
-                        # 示例: [127.0.0.1:25565] [上线] 2024-06-28 10:30:00 - 2024-06-28 12:45:00 | MOTD: Welcome to the server
-                        if line.startswith("[") and "] [上线]" in line:
-                            # 提取服务器地址
-                            server_address_end = line.index("] [上线]")
-                            server_address = line[1:server_address_end]
-                            self.server_list.add(server_address)  # 添加到服务器列表
-                            
-                            parts = line[server_address_end + len("] [上线] "):].split("|")
-                            time_part = parts[0].strip()
-                            motd_part = parts[1].replace("MOTD:", "").strip() if len(parts) > 1 else "无MOTD"
-                            
-                            # 处理时间范围
-                            time_range = time_part.split("~")
-                            start_str = time_range[0].strip()
-                            end_str = time_range[1].strip() if len(time_range) > 1 else ""
-                            
-                            # 解析时间
-                            start_estimated = start_str.endswith("*")
-                            end_estimated = end_str.endswith("*")
-                            
-                            start_str = start_str.rstrip("*").strip()
-                            end_str = end_str.rstrip("*").strip()
-                            
-                            try:
-                                start_time = datetime.strptime(start_str, "%Y-%m-%d %H:%M:%S")
-                            except:
-                                continue
-                            
-                            if end_str == "无":
-                                end_time = None
-                            else:
-                                try:
-                                    end_time = datetime.strptime(end_str, "%Y-%m-%d %H:%M:%S")
-                                except:
-                                    end_time = None
-                            
-                            # 添加到日期索引
-                            session = {
-                                "server": server_address,
-                                "start": start_time,
-                                "end": end_time,
-                                "motd": motd_part,
-                                "start_estimated": start_estimated,
-                                "end_estimated": end_estimated,
-                                "duration": (end_time - start_time).total_seconds() if end_time else 0
-                            }
-                            
-                            # 按日期分组
-                            current_date = start_time.date()
-                            while end_time is None or current_date <= end_time.date():
-                                if current_date not in self.log_data:
-                                    self.log_data[current_date] = []
-                                
-                                self.log_data[current_date].append(session)
-                                current_date += timedelta(days=1)
-                                
-                                # 如果到达结束日期或没有结束时间（只处理一天）
-                                if end_time is None or current_date > end_time.date():
-                                    break
-                            
-                            total_sessions += 1
-                    
-                    except Exception as e:
-                        print(f"解析日志行错误: {line}\n错误: {str(e)}")
-            
-            # 更新服务器选择框
-            self.server_combo.clear()
-            self.server_combo.addItem("所有服务器")  # 默认选项
-            for server in sorted(self.server_list):
-                self.server_combo.addItem(server)
-            
-            # 统计信息
-            total_days = len(self.log_data)
-            self.stats_label.setText(f"总天数: {total_days} | 总会话: {total_sessions} | 服务器数: {len(self.server_list)}")
-            
-        except Exception as e:
-            self.log_display.setText(f"读取日志文件错误: {str(e)}")
+            self.log_position = result["log_position"]
+            if "sessions" in result:
+                self.sessions = result["sessions"]
+                self.log_parser = result["log_parser"]
+                self.archive = result["archive"]
+            else:
+                self.sessions.append_sessions(result["new_sessions"])
+                for session in result["closed"]:
+                    self.sessions.close(session["server"], session["start"], session["end"], session["end_estimated"])
+            self.server_list = set(self.sessions.servers()) | self.archive.servers()
+            total_days, total_sessions, _ = result.get("stats") or self.sessions.stats()
+        else:
+            self.server_list = result["servers"]
+            total_days, total_sessions, _ = result["stats"]
+        
+        # 更新服务器选择框（保留当前选择）
+        selected_server = self.server_combo.currentText()
+        self.server_combo.blockSignals(True)
+        self.server_combo.clear()
+        self.server_combo.addItem("所有服务器")  # 默认选项
+        for server in sorted(self.server_list):
+            self.server_combo.addItem(server)
+        index = self.server_combo.findText(selected_server)
+        self.server_combo.setCurrentIndex(max(index, 0))
+        self.server_combo.blockSignals(False)
+        
+        # 统计信息
+        self.stats_label.setText(f"总天数: {total_days} | 总会话: {total_sessions} | 服务器数: {len(self.server_list)}")
         
-        # 更新日历颜色
+        # 更新日历颜色和所选日期的详情
         self.update_calendar_colors()
+        self.date_selected()
+        self.run_after_load(True)
+    
+    def session_source(self):
+        """会话数据来源：SQLite 会话库或内存中的列式会话表（接口相同）"""
+        return self.store if self.store is not None else self.sessions
+    
+    def needs_archive(self, start_date):
+        """文本日志模式下从 start_date 开始的查询是否需要连同更早的归档分段重新载入"""
+        start_time = datetime.combine(start_date, datetime.min.time())
+        return (self.store is None and self.archive is not None and start_time < self.loaded_since
+                and bool(self.archive.segments_between(start_time, self.loaded_since)))
+    
+    def sessions_in_range(self, start_date, end_date):
+        """返回 {日期: 会话列表}，按所选服务器和日期范围查询（只查询已载入的数据）"""
+        selected_server = self.server_combo.currentText()
+        server = None if selected_server in ("", "所有服务器") else selected_server
+        sessions = self.session_source().sessions_between(
+            datetime.combine(start_date, datetime.min.time()),
+            datetime.combine(end_date + timedelta(days=1), datetime.min.time()),
+            server
+        )
+        day_sessions = {}
+        add_sessions_by_day(day_sessions, sessions)
+        return {date: items for date, items in day_sessions.items() if start_date <= date <= end_date}
+    
+    def sessions_on(self, date):
+        """
+        返回 {日期: 会话列表}，只含 date 一天（按所选服务器）
+        文本日志模式下日期在活动日志内时用字节偏移索引直接读取相关行，不依赖已载入的全部会话
+        """
+        if self.store is None and self.log_index is not None and self.log_index.covers(date):
+            selected_server = self.server_combo.currentText()
+            server = None if selected_server in ("", "所有服务器") else selected_server
+            sessions = self.log_index.sessions_on(date, server)
+            if sessions is not None:
+                return {date: sessions} if sessions else {}
+        return self.sessions_in_range(date, date)
+    
+    def first_date(self):
+        """最早有记录的日期，没有数据时返回 None"""
+        dates = [self.session_source().first_date()]
+        if self.store is None and self.archive is not None:
+            dates.append(self.archive.first_date())
+        dates = [date for date in dates if date]
+        return min(dates) if dates else None
+    
+    def daily_totals(self, start_date, end_date):
+        """返回 {日期: (在线秒数, 会话数)}，按所选服务器从在线时长汇总中读取"""
+        if self.rollup is None:
+            return {}
+        selected_server = self.server_combo.currentText()
+        server = None if selected_server in ("", "所有服务器") else selected_server
+        return self.rollup.daily_totals(start_date, end_date, server)
+    
+    def visible_date_range(self):
+        """日历当前页显示的日期范围（6 周网格，含上月末和下月初的几天），限制在可选范围内"""
+        month_start = datetime(self.calendar.yearShown(), self.calendar.monthShown(), 1).date()
+        start = max(month_start - timedelta(days=7), self.calendar.minimumDate().toPyDate())
+        end = min(month_start + timedelta(days=6 * 7), self.calendar.maximumDate().toPyDate())
+        return start, end
     
     def update_calendar_colors(self):
         """根据日志数据更新日历颜色"""
@@ -772,59 +3482,22 @@ class CalendarWindow(CenterDialog):
         # 获取是否显示颜色
         show_color = self.show_color_checkbox.isChecked()  # 修改这里
         
-        # 重置所有日期格式为白色
-        for date in self.log_data.keys():
-            fmt = QTextCharFormat()
-            fmt.setBackground(QBrush(Qt.white))  # 默认白色
-            self.calendar.setDateTextFormat(date, fmt)
+        # 清除上次设置的日期格式（空日期表示全部清除，恢复默认白色）
+        self.calendar.setDateTextFormat(QDate(), QTextCharFormat())
+        self.colored_dates = set()
         
         # 如果不显示颜色，直接返回
         if not show_color:  # 修改这里
             return
         
-        # 获取选择的服务器
-        selected_server = self.server_combo.currentText()
-        
-        # 检查是否按服务器显示颜色
-        by_server = (selected_server != "所有服务器")
+        # 只需要当前显示的这一页的每日合计（按所选服务器）
+        day_totals = self.daily_totals(*self.visible_date_range())
         
-        for date in self.log_data.keys():
+        for date, (online_seconds, _) in day_totals.items():
             fmt = QTextCharFormat()
             
-            # 获取当天的所有会话
-            sessions = self.log_data[date]
-            
             # 计算当天的在线时间比例
-            total_seconds = 24 * 60 * 60
-            online_seconds = 0
-            has_data = False  # 标记当天是否有数据
-            
-            for session in sessions:
-                # 如果按服务器显示颜色，只统计所选服务器的会话
-                if by_server and session["server"] != selected_server:
-                    continue
-                    
-                start_time = session["start"]
-                end_time = session["end"] or datetime.now()
-                
-                # 计算当天开始和结束时间
-                day_start = datetime.combine(date, datetime.min.time())
-                day_end = datetime.combine(date, datetime.max.time())
-                
-                # 计算会话在当天的部分
-                session_start = max(start_time, day_start)
-                session_end = min(end_time, day_end) if end_time else day_end
-                
-                # 计算在线秒数
-                online_seconds += (session_end - session_start).total_seconds()
-                has_data = True  # 标记有数据
-            
-            # 如果没有数据且按服务器显示，保持白色
-            if by_server and not has_data:
-                continue
-            
-            # 计算在线比例
-            online_ratio = online_seconds / total_seconds
+            online_ratio = online_seconds / (24 * 60 * 60)
             
             # 设置颜色
             if online_ratio < 0.166:  # 在线 < 4h
@@ -837,6 +3510,7 @@ class CalendarWindow(CenterDialog):
                 fmt.setBackground(QBrush(QColor(255,69,0)))  # 红色
             
             self.calendar.setDateTextFormat(date, fmt)
+            self.colored_dates.add(date)
     
     def date_selected(self):
         """当选择日期时显示详细信息"""
@@ -850,36 +3524,17 @@ class CalendarWindow(CenterDialog):
         # 检查是否按服务器显示（即是否选择了特定服务器）
         by_server = (selected_server != "所有服务器")  # 修改这里
         
-        # 计算并显示当天总时长
-        total_seconds = 0
-        if selected_date in self.log_data:
-            sessions = self.log_data[selected_date]
-            for session in sessions:
-                # 如果按服务器显示，只统计所选服务器的会话
-                if by_server and selected_server != "所有服务器" and session["server"] != selected_server:
-                    continue
-                    
-                start_time = session["start"]
-                end_time = session["end"] or datetime.now()
-                
-                # 计算当天开始和结束时间
-                day_start = datetime.combine(selected_date, datetime.min.time())
-                day_end = datetime.combine(selected_date, datetime.max.time())
-                
-                # 计算会话在当天的部分
-                session_start = max(start_time, day_start)
-                session_end = min(end_time, day_end) if end_time else day_end
-                
-                # 计算在线秒数
-                total_seconds += (session_end - session_start).total_seconds()
+        # 当天总时长从汇总中读取
+        total_seconds, _ = self.daily_totals(selected_date, selected_date).get(selected_date, (0, 0))
+        day_sessions = self.sessions_on(selected_date)
         
         # 转换为小时和分钟
         hours = int(total_seconds // 3600)
         minutes = int((total_seconds % 3600) // 60)
         self.daily_total_label.setText(f"当天总时长: {hours}小时{minutes}分钟")
         
-        if selected_date in self.log_data:
-            sessions = self.log_data[selected_date]
+        if selected_date in day_sessions:
+            sessions = day_sessions[selected_date]
             
             # 生成显示文本
             display_text = f"<h2>服务器状态 - {selected_date.strftime('%Y-%m-%d')}</h2>"
@@ -942,8 +3597,78 @@ class CalendarWindow(CenterDialog):
         else:
             self.log_display.setText(f"{selected_date.strftime('%Y-%m-%d')} 无服务器状态记录")
 
+    def chart_range(self):
+        """按所选时间范围返回图表的 (开始日期, 结束日期)"""
+        time_range = self.time_range_combo.currentText()
+        end_date = datetime.now().date()
+        if time_range == "最近7天":
+            start_date = end_date - timedelta(days=7)
+        elif time_range == "最近30天":
+            start_date = end_date - timedelta(days=30)
+        else:  # 全部数据
+            start_date = self.first_date() or end_date - timedelta(days=30)
+        return start_date, end_date
+    
+    def chart_data(self):
+        """
+        按当前选择的可视化类型、时间范围和服务器准备图表数据（来自在线时长汇总，只读取已载入的数据，不阻塞）
+        按MOTD分类时只附带查询参数（motd_query），会话由 ChartRenderer 在后台线程中查询和汇总
+        """
+        viz_type = self.viz_type_combo.currentText()
+        show_motd = self.show_motd_checkbox.isChecked()
+        selected_server = self.server_combo.currentText()
+        by_server = (selected_server != "所有服务器")  # 修改这里
+        server = selected_server if by_server else None
+        
+        # 确定时间范围
+        start_date, end_date = self.chart_range()
+        
+        # 每日时长从汇总中读取，只有按MOTD分类时才需要逐个会话
+        day_totals = self.daily_totals(start_date, end_date)
+        dates = sorted(day_totals)
+        durations = [day_totals[date][0] / 3600 for date in dates]  # 转换为小时
+        
+        chart = {
+            "viz_type": viz_type,
+            "server": server,
+            "dates": dates,
+            "durations": durations,
+            "motd_durations": {}
+        }
+        if show_motd and viz_type == "按MOTD分类统计":
+            if self.store is not None:
+                source = self.store  # SessionStore 的查询自带锁，可以在后台线程中调用
+            else:
+                # 内存会话表只在界面线程中修改，交给后台线程的是所选范围的副本
+                source = self.sessions.subset(
+                    SessionTable.to_epoch(datetime.combine(start_date, datetime.min.time())),
+                    SessionTable.to_epoch(datetime.combine(end_date + timedelta(days=1), datetime.min.time())),
+                    server
+                )
+            chart["motd_query"] = (source, start_date, end_date, server)
+        return chart
+    
+    def chart_key(self):
+        """
+        返回 (图表缓存键, 数据版本)；没有在线时长汇总时数据版本为 None（不缓存）
+        有未结束的会话时图表随时间变化，键中加入当前分钟
+        """
+        live = None
+        if self.rollup is not None and self.rollup.open_sessions:
+            live = int(time.time() // 60)
+        key = (
+            self.viz_type_combo.currentText(),
+            self.time_range_combo.currentText(),
+            self.server_combo.currentText(),
+            self.show_motd_checkbox.isChecked(),
+            datetime.now().date(),  # “最近N天”随日期变化
+            live
+        )
+        version = None if self.rollup is None else self.rollup.version
+        return key, version
+    
     def generate_visualization(self):
-        """在新窗口中生成服务器启动时间可视化图表"""
+        """在新窗口中显示服务器启动时间可视化图表，图表在后台线程中离屏渲染，完成后显示"""
         print('generate_visualization 生成可视化')
         # 创建可视化窗口 - 增加窗口尺寸
         viz_dialog = CenterDialog(self)
@@ -953,267 +3678,92 @@ class CalendarWindow(CenterDialog):
         # 使用垂直布局
         layout = QVBoxLayout(viz_dialog)
         
-        # 创建matplotlib图形 - 增加图形尺寸
-        figure = Figure(figsize=(12, 8), dpi=100)  # 增加图形尺寸
-        canvas = FigureCanvas(figure)
+        # 渲染完成前显示进度
+        image_label = QLabel("正在生成图表...")
+        image_label.setAlignment(Qt.AlignCenter)
         
         # 创建滚动区域以适应大图表
         scroll_area = QScrollArea()
         scroll_area.setWidgetResizable(True)
-        scroll_area.setWidget(canvas)
+        scroll_area.setWidget(image_label)
         layout.addWidget(scroll_area)
         
-        # 设置支持中文的字体 - 更可靠的方法
-        font_path = None
-        # 尝试查找常见的中文字体
-        possible_fonts = [
-            'SimHei', 'Microsoft YaHei', 'KaiTi', 'SimSun',  # Windows
-            'STHeiti', 'STKaiti', 'Songti SC', 'Heiti SC',    # MacOS
-            'WenQuanYi Micro Hei', 'WenQuanYi Zen Hei',       # Linux
-            'Noto Sans CJK SC', 'Source Han Sans SC'           # 跨平台
-        ]
-        
-        # 查找系统中可用的字体
-        for font_name in possible_fonts:
-            try:
-                font_path = fm.findfont(font_name)
-                if font_path:
-                    # 设置字体
-                    font_prop = fm.FontProperties(fname=font_path, size=12)  # 增加字体大小
-                    matplotlib.rcParams['font.family'] = font_prop.get_name()
-                    matplotlib.rcParams['axes.unicode_minus'] = False
-                    matplotlib.rcParams['font.size'] = 12  # 全局字体大小
-                    matplotlib.rcParams['axes.titlesize'] = 16  # 标题字体大小
-                    matplotlib.rcParams['axes.labelsize'] = 14  # 轴标签字体大小
-                    matplotlib.rcParams['xtick.labelsize'] = 12  # X轴刻度字体大小
-                    matplotlib.rcParams['ytick.labelsize'] = 12  # Y轴刻度字体大小
-                    break
-            except:
-                continue
-        
-        # 如果找不到中文字体，使用默认字体并警告
-        if not font_path:
-            print("警告: 未找到中文字体，图表中的中文可能显示为方块")
-            # 设置默认字体大小
-            matplotlib.rcParams['font.size'] = 12
-            matplotlib.rcParams['axes.titlesize'] = 16
-            matplotlib.rcParams['axes.labelsize'] = 14
-            matplotlib.rcParams['xtick.labelsize'] = 12
-            matplotlib.rcParams['ytick.labelsize'] = 12
-        
-        ax = figure.add_subplot(111)
-        
-        # 获取可视化类型和时间范围
-        viz_type = self.viz_type_combo.currentText()
-        time_range = self.time_range_combo.currentText()
-        show_motd = self.show_motd_checkbox.isChecked()
-        selected_server = self.server_combo.currentText()
-        by_server = (selected_server != "所有服务器")  # 修改这里
+        progress = QProgressBar()
+        progress.setRange(0, 0)  # 忙碌指示
+        layout.addWidget(progress)
         
-        # 确定时间范围
-        end_date = datetime.now().date()
-        if time_range == "最近7天":
-            start_date = end_date - timedelta(days=7)
-        elif time_range == "最近30天":
-            start_date = end_date - timedelta(days=30)
-        else:  # 全部数据
-            if self.log_data:
-                start_date = min(self.log_data.keys())
-            else:
-                start_date = end_date - timedelta(days=30)
-        
-        # 准备数据
-        dates = []
-        durations = []
-        motd_data = defaultdict(list)
-        
-        current_date = start_date
-        while current_date <= end_date:
-            if current_date in self.log_data:
-                total_seconds = 0
-                for session in self.log_data[current_date]:
-                    # 如果按服务器显示，只统计所选服务器的会话
-                    if by_server and selected_server != "所有服务器" and session["server"] != selected_server:
-                        continue
-                        
-                    start_time = session["start"]
-                    end_time = session["end"] or datetime.now()
-                    
-                    # 计算当天开始和结束时间
-                    day_start = datetime.combine(current_date, datetime.min.time())
-                    day_end = datetime.combine(current_date, datetime.max.time())
-                    
-                    # 计算会话在当天的部分
-                    session_start = max(start_time, day_start)
-                    session_end = min(end_time, day_end) if end_time else day_end
-                    
-                    # 计算在线秒数
-                    duration_seconds = (session_end - session_start).total_seconds()
-                    total_seconds += duration_seconds
-                    
-                    # 按MOTD分组
-                    motd = session['motd']
-                    if show_motd:
-                        motd_data[motd].append((current_date, duration_seconds))
-                
-                dates.append(current_date)
-                durations.append(total_seconds / 3600)  # 转换为小时
-            current_date += timedelta(days=1)
+        # 添加关闭按钮（渲染中关闭即取消）
+        close_button = QPushButton("关闭")
+        close_button.clicked.connect(viz_dialog.accept)
+        layout.addWidget(close_button)
         
-        if not dates:
-            # 直接使用英文显示避免字体问题
-            ax.text(0.5, 0.5, "No data available", ha='center', va='center', fontsize=15)
-            canvas.draw()
-            
-            # 添加关闭按钮
-            close_button = QPushButton("关闭")
-            close_button.clicked.connect(viz_dialog.accept)
-            layout.addWidget(close_button)
-            
+        # 同样的查询且数据没有变化时直接显示缓存的图表
+        key, version = self.chart_key()
+        pixmap = CHART_CACHE.get(key, version)
+        if pixmap is not None:
+            image_label.setPixmap(pixmap)
+            progress.hide()
             viz_dialog.exec_()
             return
         
-        # 根据可视化类型生成图表
-        if viz_type == "每日时长":
-            # 绘制每日时长柱状图
-            ax.bar(dates, durations, color='skyblue', width=0.8)
-            
-            # 设置标题和标签 - 使用更大的字体
-            title = '每日服务器在线时长'
-            if by_server and selected_server != "所有服务器":
-                title += f" - {selected_server}"
-            ax.set_title(title, fontsize=18)
-            ax.set_xlabel('日期', fontsize=16)
-            ax.set_ylabel('时长 (小时)', fontsize=16)
-            
-            # 设置日期格式
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
-            figure.autofmt_xdate(rotation=30)  # 旋转日期标签避免重叠
-            
-            # 添加数据标签 - 使用更大的字体
-            for i, v in enumerate(durations):
-                if v > 0:
-                    ax.text(dates[i], v + 0.1, f"{v:.1f}", 
-                            ha='center', va='bottom', fontsize=12)
-        
-        elif viz_type == "每周时长":
-            # 按周分组数据
-            weekly_data = defaultdict(float)
-            for date, duration in zip(dates, durations):
-                year, week, _ = date.isocalendar()
-                weekly_data[f"{year}-W{week:02d}"] += duration
-            
-            # 准备绘图数据
-            weeks = sorted(weekly_data.keys())
-            week_durations = [weekly_data[week] for week in weeks]
-            
-            # 绘制每周时长柱状图
-            ax.bar(weeks, week_durations, color='lightgreen', width=0.6)
-            
-            # 设置标题和标签 - 使用更大的字体
-            title = '每周服务器在线时长'
-            if by_server and selected_server != "所有服务器":
-                title += f" - {selected_server}"
-            ax.set_title(title, fontsize=18)
-            ax.set_xlabel('周', fontsize=16)
-            ax.set_ylabel('时长 (小时)', fontsize=16)
-            
-            # 添加数据标签 - 使用更大的字体
-            for i, v in enumerate(week_durations):
-                if v > 0:
-                    ax.text(i, v + 0.1, f"{v:.1f}", 
-                            ha='center', va='bottom', fontsize=12)
-        
-        elif viz_type == "每月时长":
-            # 按月分组数据
-            monthly_data = defaultdict(float)
-            for date, duration in zip(dates, durations):
-                month_key = date.strftime("%Y-%m")
-                monthly_data[month_key] += duration
-            
-            # 准备绘图数据
-            months = sorted(monthly_data.keys())
-            month_durations = [monthly_data[month] for month in months]
-            
-            # 绘制每月时长柱状图
-            ax.bar(months, month_durations, color='salmon', width=0.6)
-            
-            # 设置标题和标签 - 使用更大的字体
-            title = '每月服务器在线时长'
-            if by_server and selected_server != "所有服务器":
-                title += f" - {selected_server}"
-            ax.set_title(title, fontsize=18)
-            ax.set_xlabel('月份', fontsize=16)
-            ax.set_ylabel('时长 (小时)', fontsize=16)
-            
-            # 添加数据标签 - 使用更大的字体
-            for i, v in enumerate(month_durations):
-                if v > 0:
-                    ax.text(i, v + 0.1, f"{v:.1f}", 
-                            ha='center', va='bottom', fontsize=12)
-        
-        elif viz_type == "按MOTD分类统计":
-            if not motd_data:
-                # 使用英文显示避免字体问题
-                ax.text(0.5, 0.5, "No MOTD data available", ha='center', va='center', fontsize=15)
-                canvas.draw()
-                
-                # 添加关闭按钮
-                close_button = QPushButton("关闭")
-                close_button.clicked.connect(viz_dialog.accept)
-                layout.addWidget(close_button)
-                
-                viz_dialog.exec_()
+        closed = []
+        viz_dialog.finished.connect(lambda: closed.append(True))
+        
+        def show_error(message):
+            image_label.setText(f"生成图表错误: {message}")
+            progress.hide()
+        
+        def render(loaded=True):
+            if closed:
+                return  # 等待加载时窗口已关闭
+            if not loaded:
+                show_error("日志加载失败或已取消")
                 return
+            image_label.setText("正在生成图表...")
+            key, version = self.chart_key()  # 重新载入后数据版本可能变化
+            renderer = ChartRenderer(self.chart_data())
             
-            # 准备MOTD数据
-            motd_names = []
-            motd_durations = []
-            
-            for motd, data in motd_data.items():
-                total_duration = sum(duration for _, duration in data) / 3600  # 转换为小时
-                motd_names.append(motd[:20] + "..." if len(motd) > 20 else motd)
-                motd_durations.append(total_duration)
-            
-            # 排序按时长降序
-            sorted_indices = np.argsort(motd_durations)[::-1]
-            sorted_names = [motd_names[i] for i in sorted_indices]
-            sorted_durations = [motd_durations[i] for i in sorted_indices]
-            
-            # 如果MOTD太多，只显示前10个，其余合并为"其他"
-            max_items = 10
-            if len(sorted_durations) > max_items:
-                other_duration = sum(sorted_durations[max_items:])
-                sorted_durations = sorted_durations[:max_items]
-                sorted_names = sorted_names[:max_items]
-                
-                # 添加"其他"类别
-                sorted_durations.append(other_duration)
-                sorted_names.append("其他")
+            def show_chart(image):
+                data, width, height = image
+                pixmap = QPixmap.fromImage(QImage(data, width, height, QImage.Format_RGBA8888).copy())
+                if version is not None:
+                    CHART_CACHE.put(key, version, pixmap)
+                image_label.setPixmap(pixmap)
+                progress.hide()
             
-            # 绘制饼图 - 使用更大的字体
-            title = '按MOTD分类的服务器在线时长'
-            if by_server and selected_server != "所有服务器":
-                title += f" - {selected_server}"
-            ax.set_title(title, fontsize=18)
-            ax.pie(sorted_durations, labels=sorted_names, autopct='%1.1f%%', 
-                  startangle=90, textprops={'fontsize': 14})  # 增加字体大小
-            ax.axis('equal')  # 确保饼图是圆的
-        
-        # 设置网格
-        ax.grid(True, linestyle='--', alpha=0.7)
-        
-        # 添加关闭按钮
-        close_button = QPushButton("关闭")
-        close_button.clicked.connect(viz_dialog.accept)
-        layout.addWidget(close_button)
-        
-        # 调整布局并显示窗口
-        viz_dialog.setLayout(layout)
-        
-        # 绘制图表并显示窗口
-        canvas.draw()
+            renderer.rendered.connect(show_chart)
+            renderer.failed.connect(show_error)
+            viz_dialog.finished.connect(renderer.cancel)
+            self.start_worker(renderer)
+        
+        start_date = self.chart_range()[0]
+        if self.show_motd_checkbox.isChecked() and self.viz_type_combo.currentText() == "按MOTD分类统计" \
+                and self.needs_archive(start_date):
+            # 查询范围早于已载入的归档：在后台连同更早的分段重新载入，完成后再生成图表
+            image_label.setText("正在加载归档日志...")
+            self.loaded_since = datetime.combine(start_date, datetime.min.time())
+            self.log_position = None
+            self.after_load.append(render)
+            self.load_log_data(restart=True)
+        else:
+            render()
         viz_dialog.exec_()
+    
+    def start_worker(self, worker):
+        """启动后台任务，窗口关闭时统一取消"""
+        self.workers = [w for w in self.workers if w.isRunning()]
+        self.workers.append(worker)
+        start_background_worker(worker)
+    
+    def done(self, result):
+        """关闭窗口前取消后台任务，不等待（它们在后台运行到下一个检查点后结束，结果被丢弃）"""
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+        if self.loader is not None:
+            self.stop_loader()
+            self.finish_load()
+        super().done(result)
 
 class ServerListItem(QWidget):
     """自定义服务器列表项，包含通知设置"""
@@ -1251,12 +3801,27 @@ class ServerListItem(QWidget):
         self.ignore_motd_check = QCheckBox("忽略MOTD变化")
         self.ignore_motd_check.setToolTip("针对动态MOTD")
         layout.addWidget(self.ignore_motd_check, 0, 4)
+
+        # 自适应检查间隔范围（留空使用默认值）
+        self.min_interval_edit = QLineEdit()
+        self.min_interval_edit.setPlaceholderText("最小间隔")
+        self.min_interval_edit.setToolTip("状态变化后的检查间隔 (秒)，留空使用默认值")
+        self.min_interval_edit.setValidator(QIntValidator(10, 86400, self))
+        self.min_interval_edit.setFixedWidth(70)
+        layout.addWidget(self.min_interval_edit, 0, 5)
+
+        self.max_interval_edit = QLineEdit()
+        self.max_interval_edit.setPlaceholderText("最大间隔")
+        self.max_interval_edit.setToolTip("长期稳定时的检查间隔上限 (秒)，留空使用默认值")
+        self.max_interval_edit.setValidator(QIntValidator(10, 86400, self))
+        self.max_interval_edit.setFixedWidth(70)
+        layout.addWidget(self.max_interval_edit, 0, 6)
         
         # 移除按钮
         self.remove_button = QPushButton("移除")
         self.remove_button.setFixedWidth(80)
         self.remove_button.clicked.connect(self.remove_self)
-        layout.addWidget(self.remove_button, 0, 5)
+        layout.addWidget(self.remove_button, 0, 7)
 
         # 设置列比例，确保对齐
         layout.setColumnStretch(0, 3)  # 服务器地址列
@@ -1264,7 +3829,9 @@ class ServerListItem(QWidget):
         layout.setColumnStretch(2, 2)  # 上线通知
         layout.setColumnStretch(3, 2)  # 离线通知
         layout.setColumnStretch(4, 2)  # 忽略MOTD变化
-        layout.setColumnStretch(5, 1)  # 移除按钮
+        layout.setColumnStretch(5, 1)  # 最小间隔
+        layout.setColumnStretch(6, 1)  # 最大间隔
+        layout.setColumnStretch(7, 1)  # 移除按钮
         
         self.setLayout(layout)
     
@@ -1277,6 +3844,14 @@ class ServerListItem(QWidget):
             int(self.offline_check.isChecked()),
             int(self.ignore_motd_check.isChecked())  # 添加忽略MOTD设置
         )
+
+    def get_interval_settings(self):
+        """获取检查间隔范围设置，格式 '最小间隔,最大间隔'，都未设置时返回空字符串"""
+        min_text = self.min_interval_edit.text().strip()
+        max_text = self.max_interval_edit.text().strip()
+        if not min_text and not max_text:
+            return ""
+        return f"{min_text},{max_text}"
     
     def remove_self(self):
         """移除自身"""
@@ -1284,13 +3859,99 @@ class ServerListItem(QWidget):
         self.removed.emit(self.server_address)  # 发出移除信号
         self.deleteLater()
 
-class ServerCheckerThread(QThread):
-    """后台线程用于检查服务器状态"""
-    status_changed = pyqtSignal(dict, str)  # 服务器状态和消息
-    
+class LatencyRing:
+    """固定容量的延迟样本环形缓冲区（numpy 数组，内存占用不随运行时间增长；第一次写入时才分配）"""
+
+    def __init__(self, capacity=1440):
+        self.capacity = max(1, capacity)
+        self.samples = None
+        self.index = 0  # 下一个写入位置
+        self.count = 0  # 有效样本数
+
+    def add(self, rtt):
+        """写入一个延迟样本 (ms)，缓冲区满时覆盖最旧的样本"""
+        if self.samples is None:
+            self.samples = np.zeros(self.capacity, dtype=np.float32)
+        self.samples[self.index] = rtt
+        self.index = (self.index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def ordered(self):
+        """按时间顺序返回有效样本"""
+        if self.count < self.capacity:
+            return self.samples[:self.count]
+        return np.concatenate((self.samples[self.index:], self.samples[:self.index]))
+
+    def stats(self):
+        """计算 p50、p95、最大值和抖动（相邻样本差的平均绝对值），没有样本时返回 None"""
+        if self.count == 0:
+            return None
+        data = self.ordered()
+        p50, p95 = np.percentile(data, [50, 95])
+        jitter = float(np.abs(np.diff(data)).mean()) if self.count > 1 else 0.0
+        return {
+            "p50": float(p50),
+            "p95": float(p95),
+            "max": float(data.max()),
+            "jitter": jitter,
+            "samples": self.count
+        }
+
+def format_latency_stats(stats):
+    """格式化延迟统计信息"""
+    if not stats:
+        return "无样本"
+    return (f"p50 {stats['p50']:.0f} / p95 {stats['p95']:.0f} / "
+            f"最大 {stats['max']:.0f} / 抖动 {stats['jitter']:.0f} ms")
+
+class CircuitBreaker:
+    """
+    单个服务器的熔断器
+    连续失败达到阈值后进入半开状态：用较短超时的低成本检查、按指数退避重试，
+    检查成功后立即恢复正常检查频率
+    """
+
+    def __init__(self, threshold=5, max_delay=3600):
+        self.threshold = max(1, threshold)
+        self.max_delay = max_delay
+        self.failures = 0  # 连续失败次数
+        self.failed_probe_seconds = 0.0  # 失败检查累计耗时（秒）
+        self.retry_at = None  # 半开状态下的下一次重试时间
+
+    @property
+    def is_open(self):
+        return self.failures >= self.threshold
+
+    def record(self, online, elapsed):
+        """记录一次检查结果和耗时"""
+        if online:
+            self.failures = 0
+            self.retry_at = None
+        else:
+            self.failures += 1
+            self.failed_probe_seconds += elapsed
+
+    def retry_delay(self, base_interval):
+        """半开状态下到下一次重试的间隔：超过阈值后每多失败一次翻倍"""
+        exponent = min(self.failures - self.threshold, 16)
+        delay = min(self.max_delay, base_interval * (2 ** exponent))
+        self.retry_at = datetime.now() + timedelta(seconds=delay)
+        return delay
+
+    def snapshot(self):
+        """返回熔断状态（随检查结果发送到GUI线程显示）"""
+        return {
+            "open": self.is_open,
+            "failures": self.failures,
+            "failed_probe_seconds": self.failed_probe_seconds,
+            "retry_at": self.retry_at.strftime("%H:%M:%S") if self.is_open and self.retry_at else None
+        }
+
+class ServerChecker:
+    """单个服务器的状态跟踪器（由 ServerProbeEngine 统一调度检查）"""
+
     def __init__(self, server_address):
-        print('ServerCheckerThread__init__ 后台线程-检查服务器状态')
-        super().__init__()
+        print('ServerChecker__init__ 服务器状态跟踪器')
         self.server_address = server_address
         self.host, self.port = parse_server_address(server_address)
         self.last_status = None
@@ -1300,25 +3961,31 @@ class ServerCheckerThread(QThread):
         self.current_session_motd = None  # 当前上线会话的MOTD
         self.last_motd = None  # 上一次的MOTD
         self.initial_check = True  # 标记是否为初始检查
-        self.force_check = False  # 强制检查标志
         self.start_estimated = False  # 记录当前会话的开始时间是否是估计的
-        self.ignore_motd = False  # 是否忽略MOTD变化
-    
-    def run(self):
-        """线程主循环"""
-        print(threading.current_thread().name+'-run-线程主循环')
-        config = load_config()
-        check_interval = int(config.get('General', 'check_interval', fallback=180))
-        settings_str=config.get('ServerNotifications', self.server_address, fallback='1110')
+        self.state_changed = False  # 最近一次检查是否发生了上下线或MOTD变化
+
+        config = config_snapshot()
+        settings_str = config.get('ServerNotifications', self.server_address, fallback='1110')
         settings = [bool(int(x)) for x in settings_str] if settings_str else [True, True, True, False]
-        self.ignore_motd=settings[3]
-        
-        # 初始状态检测
-        info = get_server_info(self.host, self.port)
-        if info.get("online", False):
-            info["ping"] = get_ping(self.host, self.port)
+        self.ignore_motd = settings[3]  # 是否忽略MOTD变化
+
+        # 自适应检查间隔
+        self.min_interval, self.max_interval = get_server_interval_bounds(config, server_address)
+        check_interval = int(config.get('General', 'check_interval', fallback=180))
+        self.interval = min(max(check_interval, self.min_interval), self.max_interval)
+
+        # 最近的延迟样本
+        self.latency = LatencyRing(config.getint('General', 'latency_samples', fallback=1440))
+
+        # 熔断器：长期离线时降低检查成本
+        self.breaker = CircuitBreaker(
+            threshold=config.getint('General', 'breaker_threshold', fallback=5),
+            max_delay=config.getint('General', 'breaker_max_delay', fallback=3600)
+        )
 
-        # 处理初始状态
+    def handle_initial_status(self, info):
+        """处理应用启动后的第一次检查结果"""
+        print('handle_initial_status 处理初始状态')
         if info["online"]:
             # 应用启动时服务器在线，记录上线时间为当前时间
             self.current_session_start = datetime.now()
@@ -1338,148 +4005,126 @@ class ServerCheckerThread(QThread):
             # 应用启动时服务器离线，不记录
             self.last_online_status = False
             self.start_estimated = False
-        
+
         # 标记初始检查完成
         self.initial_check = False
 
-        while self.running:
-            # 获取服务器信息
-            info = get_server_info(self.host, self.port)
-            
-            # 测量延迟
-            if info.get("online", False):
-                info["ping"] = get_ping(self.host, self.port)
-            
-            # 检测状态变化
-            current_online = info["online"]
-
-            # 状态变化处理
-            if self.last_online_status is None or self.last_online_status != current_online:
-                if current_online:
-                    # 服务器上线
-                    self.current_session_start = datetime.now()
-                    self.current_session_motd = info["motd_plain"]
-                    self.last_motd = info["motd_plain"]
-                    self.start_estimated = False  # 正常检测到的上线
-                    
-                    # 记录日志
-                    log_server_status(
-                        self.server_address,
-                        self.current_session_start,
-                        None,
-                        self.current_session_motd
-                    )
-                else:
-                    # 服务器下线
-                    if self.current_session_start:
-                        # 删除之前的不完整记录
-                        remove_last_incomplete_log_entry(
-                            self.server_address,
-                            self.current_session_start,
-                            self.start_estimated
-                        )
-                        
-                        # 记录完整日志，保留开始时间的估计标记
-                        log_server_status(
-                            self.server_address,
-                            self.current_session_start,
-                            datetime.now(),
-                            self.current_session_motd,
-                            start_estimated=self.start_estimated
-                        )
-                        self.current_session_start = None
-                        self.current_session_motd = None
-                        self.last_motd = None
-                        self.start_estimated = False
-                
-                # 更新状态
-                self.last_online_status = current_online
-            elif current_online and self.last_online_status:
-                # 状态保持在线，但MOTD发生变化 - 服务器重启
-                current_motd = info["motd_plain"]
-                if self.last_motd and self.last_motd != current_motd and not self.ignore_motd:
-                    # 删除之前的不完整记录
-                    if self.current_session_start:
-                        remove_last_incomplete_log_entry(
-                            self.server_address,
-                            self.current_session_start,
-                            self.start_estimated
-                        )
-                    
-                    # 记录服务器下线（重启）
+    def handle_status(self, info):
+        """处理一次检查结果，返回需要发出的 (状态, 消息) 列表"""
+        # 检测状态变化
+        current_online = info["online"]
+        self.state_changed = False
+
+        # 状态变化处理
+        if self.last_online_status is None or self.last_online_status != current_online:
+            if current_online:
+                # 服务器上线
+                self.current_session_start = datetime.now()
+                self.current_session_motd = info["motd_plain"]
+                self.last_motd = info["motd_plain"]
+                self.start_estimated = False  # 正常检测到的上线
+
+                # 记录日志
+                log_server_status(
+                    self.server_address,
+                    self.current_session_start,
+                    None,
+                    self.current_session_motd
+                )
+            else:
+                # 服务器下线
+                if self.current_session_start:
+                    # 记录下线事件，保留开始时间的估计标记
                     log_server_status(
                         self.server_address,
                         self.current_session_start,
                         datetime.now(),
-                        self.last_motd,
+                        self.current_session_motd,
                         start_estimated=self.start_estimated
                     )
-                    
-                    # 记录服务器上线（重启后）
-                    self.current_session_start = datetime.now()
-                    self.current_session_motd = current_motd
-                    self.last_motd = current_motd
-                    self.start_estimated = False  # 新的会话是正常检测到的
-                    
-                    # 记录上线事件
-                    log_server_status(
-                        self.server_address,
-                        self.current_session_start,
-                        None,
-                        self.current_session_motd
-                    )
-                else:
-                    # 更新最后MOTD
-                    self.last_motd = current_motd
+                    self.current_session_start = None
+                    self.current_session_motd = None
+                    self.last_motd = None
+                    self.start_estimated = False
 
-            # 生成状态消息
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            status_msg = f"[{timestamp}] [{self.server_address}] 服务器状态: "
-            
-            if info["online"]:
-                cleaned_motd = info["motd_plain"]
-                status_msg += f"✅ 在线 | 延迟: {info['ping']:.2f} ms | 玩家: {info['players']['online']}/{info['players']['max']}"
-                
-                # 如果服务器状态从离线变为在线，发送通知
-                if self.last_status is None or not self.last_status["online"]:
-                    self.status_changed.emit(info, "online")
+            # 更新状态
+            self.state_changed = self.last_online_status is not None
+            self.last_online_status = current_online
+        elif current_online and self.last_online_status:
+            # 状态保持在线，但MOTD发生变化 - 服务器重启
+            current_motd = info["motd_plain"]
+            if self.last_motd and self.last_motd != current_motd and not self.ignore_motd:
+                # 记录服务器下线（重启）
+                log_server_status(
+                    self.server_address,
+                    self.current_session_start,
+                    datetime.now(),
+                    self.last_motd,
+                    start_estimated=self.start_estimated
+                )
+
+                # 记录服务器上线（重启后）
+                self.state_changed = True
+                self.current_session_start = datetime.now()
+                self.current_session_motd = current_motd
+                self.last_motd = current_motd
+                self.start_estimated = False  # 新的会话是正常检测到的
+
+                # 记录上线事件
+                log_server_status(
+                    self.server_address,
+                    self.current_session_start,
+                    None,
+                    self.current_session_motd
+                )
             else:
-                status_msg += f"❌ 离线 - {info.get('error', '未知错误')}"
-                self.status_changed.emit(info, "offline")
-            
-            # 更新最后状态
-            self.last_status = info
-            self.status_changed.emit(info, status_msg)
-            
-            # 等待指定间隔或直到强制检查
-            for i in range(check_interval):
-                if not self.running:
-                    return
-                if self.force_check:
-                    self.force_check = False
-                    break
-                time.sleep(1)
-    
-    def request_force_check(self):
-        """请求立即执行一次服务器检查"""
-        print('request_force_check 请求立即执行一次服务器检查')
-        self.force_check = True
-    
+                # 更新最后MOTD
+                self.last_motd = current_motd
+
+        # 生成状态消息
+        emits = []
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        status_msg = f"[{timestamp}] [{self.server_address}] 服务器状态: "
+
+        if info["online"]:
+            status_msg += f"✅ 在线 | 延迟: {info['ping']:.2f} ms | 玩家: {info['players']['online']}/{info['players']['max']}"
+
+            # 如果服务器状态从离线变为在线，发送通知
+            if self.last_status is None or not self.last_status["online"]:
+                emits.append((info, "online"))
+        else:
+            status_msg += f"❌ 离线 - {info.get('error', '未知错误')}"
+
+            # 只在服务器从在线（或初始未知）变为离线时发送离线通知
+            if self.last_status is None or self.last_status["online"]:
+                emits.append((info, "offline"))
+
+        # 更新最后状态
+        self.last_status = info
+        emits.append((info, status_msg))
+        return emits
+
+    def next_interval(self):
+        """根据最近一次检查结果计算到下一次检查的间隔（秒）"""
+        if self.breaker.is_open:
+            # 熔断中：在最大间隔的基础上指数退避
+            return self.breaker.retry_delay(self.max_interval)
+        if self.state_changed:
+            # 刚发生上下线或MOTD变化：收紧间隔，更精确地记录后续变化
+            self.interval = self.min_interval
+        else:
+            # 状态稳定：逐步放宽间隔，直到最大间隔
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        return self.interval
+
     def stop(self):
-        """停止线程"""
-        print('stop 停止线程')
+        """停止检查并结束当前会话"""
+        print('stop 停止服务器检查')
         self.running = False
-        
+
         # 如果服务器在线时退出，记录下线时间为当前时间（带星号）
         if self.current_session_start:
-            # 删除之前的不完整记录
-            remove_last_incomplete_log_entry(
-                self.server_address,
-                self.current_session_start,
-                self.start_estimated
-            )
-            
-            # 记录完整日志，保留开始时间的估计标记
+            # 记录下线事件，保留开始时间的估计标记
             log_server_status(
                 self.server_address,
                 self.current_session_start,
@@ -1488,6 +4133,229 @@ class ServerCheckerThread(QThread):
                 start_estimated=self.start_estimated,
                 end_estimated=True
             )
+            self.current_session_start = None
+
+class AdaptiveScheduler:
+    """按下一次检查时间排列的最小堆调度器（移除和重新调度采用延迟删除）"""
+
+    def __init__(self):
+        self._heap = []  # (到期时间, 序号, 服务器地址)
+        self._entries = {}  # 服务器地址 -> 当前有效的序号
+        self._counter = 0
+
+    def schedule(self, server_address, due):
+        """安排服务器在 due 时刻检查（覆盖之前的安排）"""
+        self._counter += 1
+        self._entries[server_address] = self._counter
+        heapq.heappush(self._heap, (due, self._counter, server_address))
+
+    def remove(self, server_address):
+        self._entries.pop(server_address, None)
+
+    def next_due(self):
+        """返回最早的有效到期时间，没有任务时返回 None"""
+        while self._heap:
+            due, seq, server_address = self._heap[0]
+            if self._entries.get(server_address) == seq:
+                return due
+            heapq.heappop(self._heap)  # 丢弃已失效的条目
+        return None
+
+    def pop_due(self, now):
+        """弹出所有已到期的服务器地址"""
+        due_servers = []
+        while self._heap and self._heap[0][0] <= now:
+            due, seq, server_address = heapq.heappop(self._heap)
+            if self._entries.get(server_address) == seq:
+                del self._entries[server_address]
+                due_servers.append(server_address)
+        return due_servers
+
+    def __len__(self):
+        return len(self._entries)
+
+class ServerProbeEngine(QThread):
+    """后台探测引擎：在单个 asyncio 事件循环中按自适应间隔检查所有服务器"""
+    status_changed = pyqtSignal(dict, str)  # 服务器状态和消息
+
+    def __init__(self, max_concurrency=64):
+        print('ServerProbeEngine__init__ 后台探测引擎')
+        super().__init__()
+        self.max_concurrency = max(1, int(max_concurrency))  # 同时进行的最大检查数
+        self.checkers = {}  # 服务器地址 -> ServerChecker
+        self.running = True
+        self.loop = None  # 引擎线程中的事件循环
+        self._lock = threading.Lock()  # 保护 checkers 和 loop（GUI线程与引擎线程共享）
+        # 以下成员只在事件循环中访问
+        self._scheduler = AdaptiveScheduler()
+        self._tasks = {}  # 服务器地址 -> 正在进行的检查任务
+        self._semaphore = None
+        self._stop_event = None
+        self._wakeup = None  # 唤醒调度循环的事件
+        self._next_wake = None  # 调度循环计划的下一次唤醒时间
+
+        config = config_snapshot()
+        self.resolver = ResolverCache(ttl=config.getint('General', 'dns_cache_ttl', fallback=300))
+        self.probe_timeout = config.getfloat('General', 'probe_timeout', fallback=5)
+        # 熔断中的服务器使用较短的超时进行低成本检查
+        self.breaker_probe_timeout = max(1.0, self.probe_timeout / 3)
+
+    def add_server(self, server_address):
+        """添加一个服务器到探测引擎（可从任意线程调用）"""
+        print('add_server 添加服务器到探测引擎')
+        checker = ServerChecker(server_address)
+        with self._lock:
+            self.checkers[server_address] = checker
+            loop = self.loop
+        if loop is not None:
+            self._call_in_loop(loop, self._start_checker, checker)
+        return checker
+
+    def remove_server(self, server_address):
+        """从探测引擎中移除一个服务器（可从任意线程调用）"""
+        print('remove_server 从探测引擎移除服务器')
+        with self._lock:
+            checker = self.checkers.pop(server_address, None)
+            loop = self.loop
+        if checker is None:
+            return
+        checker.stop()
+        FAVICON_CACHE.release(f"{checker.host}:{checker.port}")
+        if loop is not None:
+            self._call_in_loop(loop, self._cancel_checker, server_address)
+
+    def request_force_check(self):
+        """请求立即检查所有服务器"""
+        print('request_force_check 请求立即检查所有服务器')
+        loop = self.loop
+        if loop is not None:
+            self._call_in_loop(loop, self._force_all)
+
+    def stop(self):
+        """停止引擎，并结束所有服务器的当前会话"""
+        print('stop 停止探测引擎')
+        self.running = False
+        with self._lock:
+            checkers = list(self.checkers.values())
+            loop = self.loop
+        for checker in checkers:
+            checker.stop()
+        if loop is not None:
+            self._call_in_loop(loop, self._stop_event.set)
+
+    @staticmethod
+    def _call_in_loop(loop, callback, *args):
+        """线程安全地把回调投递到事件循环"""
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    def run(self):
+        """引擎线程主函数"""
+        print(threading.current_thread().name+'-run-探测引擎主循环')
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._stop_event = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        with self._lock:
+            self.loop = asyncio.get_running_loop()
+            checkers = list(self.checkers.values())
+        if not self.running:
+            return
+
+        for checker in checkers:
+            self._start_checker(checker)
+        scheduler_task = asyncio.create_task(self._schedule_loop())
+
+        await self._stop_event.wait()
+
+        # 取消调度循环和所有进行中的检查
+        tasks = [scheduler_task] + list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _schedule(self, server_address, due):
+        """安排一次检查，必要时提前唤醒调度循环"""
+        self._scheduler.schedule(server_address, due)
+        if self._next_wake is None or due < self._next_wake:
+            self._wakeup.set()
+
+    def _start_checker(self, checker):
+        if not checker.running:
+            return
+        self._schedule(checker.server_address, self.loop.time())
+
+    def _cancel_checker(self, server_address):
+        self._scheduler.remove(server_address)
+        task = self._tasks.pop(server_address, None)
+        if task is not None:
+            task.cancel()
+
+    def _force_all(self):
+        now = self.loop.time()
+        for server_address in list(self.checkers):
+            if server_address not in self._tasks:
+                self._schedule(server_address, now)
+
+    async def _schedule_loop(self):
+        """调度循环：取出到期的服务器启动检查，然后睡眠到下一个到期时间"""
+        while True:
+            now = self.loop.time()
+            for server_address in self._scheduler.pop_due(now):
+                checker = self.checkers.get(server_address)
+                if checker is not None and checker.running and server_address not in self._tasks:
+                    self._tasks[server_address] = asyncio.create_task(self._check(checker))
+
+            self._next_wake = self._scheduler.next_due()
+            self._wakeup.clear()
+            timeout = None if self._next_wake is None else max(0, self._next_wake - now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _probe(self, checker):
+        """在并发上限内完成一次服务器检查"""
+        timeout = self.breaker_probe_timeout if checker.breaker.is_open else self.probe_timeout
+        async with self._semaphore:
+            start = self.loop.time()
+            # 延迟在同一连接上通过 Ping/Pong 测量
+            info = await async_get_server_info(
+                checker.host, checker.port, timeout=timeout, resolver=self.resolver)
+            checker.breaker.record(info["online"], self.loop.time() - start)
+        return info
+
+    async def _check(self, checker):
+        """检查一次服务器，处理结果并安排下一次检查"""
+        interval = checker.interval
+        try:
+            info = await self._probe(checker)
+            if not checker.running:
+                return
+            if checker.initial_check:
+                # 初始状态检测（首次结果同时作为第一轮检查结果）
+                checker.handle_initial_status(info)
+            if info["online"]:
+                checker.latency.add(info["ping"])
+                info["latency"] = checker.latency.stats()
+            emits = checker.handle_status(info)
+            interval = checker.next_interval()
+            info["breaker"] = checker.breaker.snapshot()
+            for status, message in emits:
+                self.status_changed.emit(status, message)
+        except Exception as e:
+            print(f"处理服务器状态错误 [{checker.server_address}]: {str(e)}")
+        finally:
+            if self._tasks.get(checker.server_address) is asyncio.current_task():
+                del self._tasks[checker.server_address]
+
+        if checker.running:
+            self._schedule(checker.server_address, self.loop.time() + interval)
 
 class SettingsDialog(CenterDialog):
     """设置对话框（添加按服务器通知设置）"""
@@ -1497,7 +4365,7 @@ class SettingsDialog(CenterDialog):
         super().__init__(parent)
         self.setWindowTitle("服务器监控设置(部分设置重启生效)")
         self.setGeometry(200, 200, 900, 600)  # 增加宽度和高度以容纳更多内容
-        self.setWindowIcon(QIcon(load_config().get('General', 'icon_path', fallback=ICON_PATH)))
+        self.setWindowIcon(QIcon(config_snapshot().get('General', 'icon_path', fallback=ICON_PATH)))
         
         # 主布局
         layout = QVBoxLayout()
@@ -1522,6 +4390,12 @@ class SettingsDialog(CenterDialog):
         self.icon_path_edit = QLineEdit()
         general_layout.addWidget(self.icon_path_edit, 2, 1)
         
+        # 最大并发检测数设置
+        general_layout.addWidget(QLabel("最大并发检测数:"), 3, 0)
+        self.concurrency_edit = QLineEdit()
+        self.concurrency_edit.setValidator(QIntValidator(1, 4096, self))
+        general_layout.addWidget(self.concurrency_edit, 3, 1)
+        
         general_group.setLayout(general_layout)
         layout.addWidget(general_group)
         
@@ -1563,7 +4437,9 @@ class SettingsDialog(CenterDialog):
         title_layout.setColumnStretch(2, 2)  # 上线通知
         title_layout.setColumnStretch(3, 2)  # 离线通知
         title_layout.setColumnStretch(4, 2)  # 忽略MOTD变化
-        title_layout.setColumnStretch(5, 1)  # 操作按钮
+        title_layout.setColumnStretch(5, 1)  # 最小间隔
+        title_layout.setColumnStretch(6, 1)  # 最大间隔
+        title_layout.setColumnStretch(7, 1)  # 操作按钮
         
         servers_layout.addWidget(title_widget)
         
@@ -1600,12 +4476,13 @@ class SettingsDialog(CenterDialog):
     def load_settings(self):
         """加载当前设置"""
         print('load_settings 加载当前设置')
-        config = load_config()
+        config = config_snapshot()
         
         # 常规设置
         self.interval_edit.setText(config.get('General', 'check_interval', fallback='180'))
         self.log_file_edit.setText(config.get('General', 'log_file', fallback=LOG_FILE))
         self.icon_path_edit.setText(config.get('General', 'icon_path', fallback=ICON_PATH))
+        self.concurrency_edit.setText(config.get('General', 'max_concurrency', fallback='64'))
         
         # 全局通知设置
         self.startup_notify_check.setChecked(config.getboolean('Notifications', 'show_startup_notification', fallback=True))
@@ -1676,6 +4553,13 @@ class SettingsDialog(CenterDialog):
                 item.offline_check.setChecked(settings[2] == 1)
                 item.ignore_motd_check.setChecked(settings[3] == 1)  # 忽略MOTD设置
 
+                # 检查间隔范围
+                bounds_str = config.get('ServerIntervals', server, fallback='')
+                if ',' in bounds_str:
+                    min_str, max_str = bounds_str.split(',', 1)
+                    item.min_interval_edit.setText(min_str.strip())
+                    item.max_interval_edit.setText(max_str.strip())
+
                 item.removed.connect(self.handle_server_removed)
                 self.scroll_layout.addWidget(item)
                 self.server_items[server] = item
@@ -1691,6 +4575,9 @@ class SettingsDialog(CenterDialog):
         config.set('General', 'check_interval', self.interval_edit.text())
         config.set('General', 'log_file', self.log_file_edit.text())
         config.set('General', 'icon_path', self.icon_path_edit.text())
+        config.set('General', 'max_concurrency', self.concurrency_edit.text() or '64')
+        # 日志路径变化时，写入线程写完已入队的条目后切换到新文件（启用会话库时导入新文件中尚未导入的历史）
+        LOG_WRITER.set_path(self.log_file_edit.text())
         
         # 全局通知设置
         config.set('Notifications', 'show_startup_notification', 
@@ -1703,9 +4590,11 @@ class SettingsDialog(CenterDialog):
         # 保存服务器列表
         servers = []
     
-        # 确保 ServerNotifications 部分存在
+        # 确保 ServerNotifications 和 ServerIntervals 部分存在
         if not config.has_section('ServerNotifications'):
             config.add_section('ServerNotifications')
+        if not config.has_section('ServerIntervals'):
+            config.add_section('ServerIntervals')
         
         # 打印当前要保存的设置
         print("保存服务器通知设置:")
@@ -1714,6 +4603,8 @@ class SettingsDialog(CenterDialog):
             if config.has_option('ServerNotifications', server):
                 config.remove_option('ServerNotifications', server)
                 print(f"  已移除服务器设置: {server}")
+            if config.has_option('ServerIntervals', server):
+                config.remove_option('ServerIntervals', server)
         
         for server, item in list(self.server_items.items()):
             # 检查项是否仍然有效
@@ -1723,6 +4614,13 @@ class SettingsDialog(CenterDialog):
                 
                 # 使用原始服务器地址作为键
                 config.set('ServerNotifications', server, settings_str)
+
+                # 检查间隔范围（未设置时删除，使用默认值）
+                interval_str = item.get_interval_settings()
+                if interval_str:
+                    config.set('ServerIntervals', server, interval_str)
+                elif config.has_option('ServerIntervals', server):
+                    config.remove_option('ServerIntervals', server)
                 servers.append(server)
                 print(f"  保存服务器设置: {server} -> {settings_str}")
             else:
@@ -1810,7 +4708,14 @@ class MinecraftServerMonitor(QApplication):
         print('MinecraftServerMonitor__init__ Minecraft服务器监控托盘应用')
         super().__init__(args)
         self.setQuitOnLastWindowClosed(False)
-        self.config = load_config()
+        self.config = config_snapshot()
+        
+        # 启动日志写入线程（启用时同时写入 SQLite 会话库）
+        LOG_WRITER.set_path(self.config.get('General', 'log_file', fallback=LOG_FILE))
+        LOG_WRITER.set_store(open_session_store(self.config))  # 已有日志在写入线程中导入，不阻塞托盘启动
+        LOG_WRITER.fsync_interval = self.config.getfloat('General', 'log_fsync_interval', fallback=1.0)
+        LOG_WRITER.rotate_monthly = self.config.get('General', 'log_rotation', fallback='monthly').strip().lower() == 'monthly'
+        LOG_WRITER.start()
         
         # 设置托盘图标
         self.tray_icon = QSystemTrayIcon(self)
@@ -1848,8 +4753,11 @@ class MinecraftServerMonitor(QApplication):
         self.tray_icon.setContextMenu(self.menu)
         self.tray_icon.show()
         
-        # 设置服务器检查器
-        self.server_checkers = []
+        # 设置探测引擎（所有服务器共用一个事件循环线程）
+        self.probe_engine = ServerProbeEngine(
+            max_concurrency=self.config.getint('General', 'max_concurrency', fallback=64)
+        )
+        self.probe_engine.status_changed.connect(self.update_status)
         self.server_statuses = {}
         
         # 加载服务器列表
@@ -1857,12 +4765,13 @@ class MinecraftServerMonitor(QApplication):
         for server in servers:
             if server.strip() and is_valid_server_address(server.strip()):
                 self.add_server_checker(server.strip())
+        self.probe_engine.start()
         
         # 显示启动通知（如果启用）
         if self.config.getboolean('Notifications', 'show_startup_notification', fallback=True):
             self.tray_icon.showMessage(
                 "服务器监控已启动",
-                f"开始监控 {len(self.server_checkers)} 个服务器",
+                f"开始监控 {len(self.probe_engine.checkers)} 个服务器",
                 QSystemTrayIcon.Information,
                 3000
             )
@@ -1870,18 +4779,7 @@ class MinecraftServerMonitor(QApplication):
     def add_server_checker(self, server_address):
         """添加一个新的服务器检查器"""
         print('add_server_checker 添加一个新的服务器检查器')
-        # 获取该服务器的通知设置
-        config = load_config()
-        settings_str = config.get('ServerNotifications', server_address, fallback='0000')
-        
-        # 确保设置值是4位数字
-        if len(settings_str) < 4:
-            settings_str = settings_str.ljust(4, '0')
-        
-        checker = ServerCheckerThread(server_address)
-        checker.status_changed.connect(self.update_status)
-        checker.start()
-        self.server_checkers.append(checker)
+        self.probe_engine.add_server(server_address)
         
         # 初始化状态
         self.server_statuses[server_address] = {
@@ -1895,14 +4793,9 @@ class MinecraftServerMonitor(QApplication):
     def remove_server_checker(self, server_address):
         """移除一个服务器检查器"""
         print('remove_server_checker 移除一个服务器检查器')
-        for checker in self.server_checkers[:]:
-            if checker.server_address == server_address:
-                checker.stop()
-                checker.wait(2000)  # 等待2秒让线程结束
-                self.server_checkers.remove(checker)
-                if server_address in self.server_statuses:
-                    del self.server_statuses[server_address]
-                break
+        self.probe_engine.remove_server(server_address)
+        if server_address in self.server_statuses:
+            del self.server_statuses[server_address]
         
         # 更新状态菜单
         self.update_status_menu()
@@ -1913,12 +4806,26 @@ class MinecraftServerMonitor(QApplication):
         self.status_menu.clear()
         
         # 添加每个服务器的状态
+        open_count = 0
+        failed_seconds = 0.0
         for server_address, status_info in self.server_statuses.items():
-            action = self.status_menu.addAction(f"{server_address}: {status_info['status']}")
+            text = f"{server_address}: {status_info['status']}"
+            breaker = (status_info['info'] or {}).get('breaker')
+            if breaker:
+                failed_seconds += breaker['failed_probe_seconds']
+                if breaker['open']:
+                    open_count += 1
+                    text += f" [熔断: 连续失败 {breaker['failures']} 次, 下次重试 {breaker['retry_at']}]"
+            action = self.status_menu.addAction(text)
             action.setEnabled(False)
         
         # 添加分隔符
         self.status_menu.addSeparator()
+
+        # 离线服务器消耗的检查时间
+        cost_action = self.status_menu.addAction(
+            f"熔断中: {open_count} 个服务器 | 失败检查累计耗时: {failed_seconds:.1f} 秒")
+        cost_action.setEnabled(False)
         
         # 添加查看所有服务器详细信息的选项
         view_all_action = self.status_menu.addAction("查看所有服务器状态")
@@ -1927,7 +4834,7 @@ class MinecraftServerMonitor(QApplication):
     def update_tray_icon(self):
         """更新托盘图标"""
         print('update_tray_icon 更新托盘图标')
-        icon_path = self.config.get('General', 'icon_path', fallback=ICON_PATH)
+        icon_path = config_snapshot().get('General', 'icon_path', fallback=ICON_PATH)
         if os.path.exists(icon_path):
             self.tray_icon.setIcon(QIcon(icon_path))
         else:
@@ -1938,8 +4845,7 @@ class MinecraftServerMonitor(QApplication):
     def force_refresh_all(self):
         """立即刷新所有服务器状态"""
         print('force_refresh_all 立即刷新')
-        for checker in self.server_checkers:
-            checker.request_force_check()
+        self.probe_engine.request_force_check()
         
         # 显示刷新提示（如果启用）
         if self.config.getboolean('Notifications', 'show_refresh_notification', fallback=True):
@@ -2009,8 +4915,8 @@ class MinecraftServerMonitor(QApplication):
             'info': info
         }
 
-        # 获取该服务器的通知设置
-        config = load_config()
+        # 获取该服务器的通知设置（配置快照，文件未变化时不重新解析）
+        config = config_snapshot()
         settings_str = config.get('ServerNotifications', server_address, fallback='1110')
         settings = [bool(int(x)) for x in settings_str] if settings_str else [True, True, True, False]
         popup_enabled, online_enabled, offline_enabled, ignore = settings
@@ -2022,12 +4928,16 @@ class MinecraftServerMonitor(QApplication):
         online_count = sum(1 for s in self.server_statuses.values() if s['info'] and s['info']['online'])
         total_count = len(self.server_statuses)
         
-        self.tray_icon.setToolTip(
+        tooltip = (
             f"Minecraft服务器监控\n"
             f"监控服务器数: {total_count}\n"
             f"在线服务器: {online_count}\n"
             f"上次检查: {datetime.now().strftime('%H:%M:%S')}"
         )
+        # 最近一次检查的服务器的延迟统计
+        if info.get('latency'):
+            tooltip += f"\n{server_address} 延迟: {format_latency_stats(info['latency'])}"
+        self.tray_icon.setToolTip(tooltip)
         
         # 如果服务器在线，显示通知
         if message == "online":
@@ -2136,19 +5046,12 @@ class MinecraftServerMonitor(QApplication):
                 icon_label.setAlignment(Qt.AlignCenter)
                 icon_label.setStyleSheet("background-color: #444444;")  # 图标背景稍亮
 
-                # 如果有图标数据，显示图标
-                if "favicon" in info and info["favicon"]:
-                    pixmap = base64_to_pixmap(info["favicon"])
-                    if pixmap and not pixmap.isNull():
-                        # 缩放图标以适应标签
-                        pixmap = pixmap.scaled(64, 64, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                        icon_label.setPixmap(pixmap)
-                    else:
-                        # 没有有效图标时显示占位符
-                        icon_label.setText("<span style='color: white;'>无图标</span>")
-
+                # 如果有图标数据，显示图标（已缩放的图标从缓存获取）
+                pixmap = FAVICON_CACHE.get_pixmap(info.get("favicon_hash"))
+                if pixmap:
+                    icon_label.setPixmap(pixmap)
                 else:
-                    # 没有图标数据时显示占位符
+                    # 没有有效图标时显示占位符
                     icon_label.setText("<span style='color: white;'>无图标</span>")
 
                 hbox.addWidget(icon_label)
@@ -2178,6 +5081,8 @@ class MinecraftServerMonitor(QApplication):
                 details.setHtml(
                     f"<span style='color: white;'><b>状态:</b> ✅ 在线</span><br>"
                     f"<span style='color: white;'><b>延迟:</b> {info['ping']:.2f} ms</span><br>"
+                    f"<span style='color: white;'><b>延迟统计:</b> {format_latency_stats(info.get('latency'))}"
+                    f" ({(info.get('latency') or {}).get('samples', 0)} 个样本)</span><br>"
                     f"<span style='color: white;'><b>版本:</b> {info['version']} (协议: {info['protocol']})</span><br>"
                     f"<b>MOTD:</b><br>{motd_html}<br>"
                     f"<span style='color: white;'><b>玩家:</b> {info['players']['online']}/{info['players']['max']}</span><br>"
@@ -2222,18 +5127,31 @@ class MinecraftServerMonitor(QApplication):
         """显示日志内容"""
         print('show_log 显示日志内容')
         try:
-            log_file = self.config.get('General', 'log_file', fallback=LOG_FILE)
+            log_file = config_snapshot().get('General', 'log_file', fallback=LOG_FILE)
+            # 确保写入线程中尚未落盘的事件可见；界面线程只短暂等待，来不及写入的事件下次打开时显示
+            LOG_WRITER.flush(timeout=0.2)
             
             if not os.path.exists(log_file):
                 QMessageBox.information(None, "日志文件", "日志文件不存在")
                 return
                 
+            # 只显示活动日志（当月），之前月份已压缩归档，不需要解压
+            archived = len(LogArchive(log_file).segments)
+            
+            # 日志是上线/下线事件流，配对成会话后按旧格式每个会话显示一行
             with open(log_file, "r", encoding="utf-8") as log_file:
-                log_content = log_file.read()
+                sessions = read_log_sessions(log_file)
+            log_content = "".join(
+                format_log_entry(
+                    session["server"], session["start"], session["end"], session["motd"],
+                    session["start_estimated"], session["end_estimated"]
+                )
+                for session in sessions
+            )
                 
             # 创建自定义对话框显示日志
             log_dialog = CenterDialog()
-            log_dialog.setWindowTitle("服务器状态日志")
+            log_dialog.setWindowTitle(f"服务器状态日志（另有 {archived} 个月已归档）" if archived else "服务器状态日志")
             log_dialog.setGeometry(100, 100, 800, 600)
             
             layout = QVBoxLayout()
@@ -2261,9 +5179,10 @@ class MinecraftServerMonitor(QApplication):
     def quit_app(self):
         """退出应用程序"""
         print('quit_app 退出应用程序')
-        for checker in self.server_checkers:
-            checker.stop()
-            checker.wait(2000)  # 等待2秒让线程结束
+        self.probe_engine.stop()
+        self.probe_engine.wait(2000)  # 等待2秒让引擎线程结束
+        stop_background_workers()  # 日历加载、图表渲染等后台任务
+        LOG_WRITER.close()  # 写完退出时产生的下线事件
         self.quit()
 
 def hide_console_window():